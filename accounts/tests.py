@@ -1,3 +1,301 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import User
+from core.models import (
+    ChatMessage, ChatParticipant, ColoniaProcesada, ConfiguracionRuta, RutaCompletada, TrabajoProcesamiento,
+)
+from core.utils.chat_pubsub import get_bus_chat
+
+
+class RutasStaffSupervisionTests(TestCase):
+    """obtener_rutas_staff_supervision: consultas constantes y paginación por cursor"""
+
+    url = '/accounts/api/rutas_staff_supervision/'
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='x', role='staff')
+        self.client.force_login(self.staff)
+        self.colonia = ColoniaProcesada.objects.create(nombre='Colonia Prueba', creado_por=self.staff)
+        self.empleados = [
+            User.objects.create_user(username=f'empleado{i}', password='x', role='employee') for i in range(3)
+        ]
+
+    def crear_configuraciones(self, cantidad):
+        for _ in range(cantidad):
+            config = ConfiguracionRuta.objects.create(
+                colonia=self.colonia,
+                creado_por=self.staff,
+                mapa_calculado={'rutas': [
+                    {'empleado_id': e.id, 'distancia': 1.5, 'nodos': 10, 'tiempo_estimado': 22}
+                    for e in self.empleados
+                ]},
+            )
+            config.empleados_asignados.set(self.empleados)
+            ahora = timezone.now()
+            RutaCompletada.objects.create(
+                colonia=self.colonia, empleado=self.empleados[0], configuracion_ruta=config,
+                fecha_inicio=ahora - timedelta(hours=1), fecha_fin=ahora,
+                tiempo_real_minutos=60, tiempo_estimado_minutos=50, distancia_km=1.5, num_nodos=10,
+                area_zona_m2=1000, densidad_nodos_km2=10, densidad_calles_m_km2=100,
+                experiencia_empleado_dias=30, hora_inicio=9, dia_semana=0,
+                eficiencia_porcentaje=83.3, velocidad_promedio_kmh=1.5, algoritmo_usado='kernighan_lin',
+            )
+
+    def obtener(self, **params):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(self.url, params)
+            contenido = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(contenido), len(consultas)
+
+    def test_numero_de_consultas_no_depende_de_las_configuraciones(self):
+        self.crear_configuraciones(2)
+        _, consultas_pocas = self.obtener()
+        self.crear_configuraciones(10)
+        data, consultas_muchas = self.obtener()
+
+        self.assertEqual(len(data['rutas']), 12)
+        self.assertEqual(consultas_pocas, consultas_muchas)
+
+    def test_estado_y_datos_de_cada_empleado(self):
+        self.crear_configuraciones(1)
+        data, _ = self.obtener()
+
+        empleados = {e['empleado_id']: e for e in data['rutas'][0]['empleados']}
+        self.assertEqual(empleados[self.empleados[0].id]['estado'], 'completada')
+        self.assertEqual(empleados[self.empleados[1].id]['estado'], 'pendiente')
+        self.assertEqual(empleados[self.empleados[1].id]['distancia_km'], 1.5)
+        self.assertEqual(data['rutas'][0]['empleados_completados'], 1)
+
+    def test_paginacion_por_cursor(self):
+        self.crear_configuraciones(5)
+        vistas = []
+        cursor = None
+        while True:
+            params = {'limite': 2}
+            if cursor:
+                params['cursor'] = cursor
+            data, _ = self.obtener(**params)
+            vistas.extend(r['configuracion_id'] for r in data['rutas'])
+            cursor = data['siguiente_cursor']
+            if not cursor:
+                break
+
+        esperadas = list(ConfiguracionRuta.objects.order_by('-fecha_creacion', '-id').values_list('id', flat=True))
+        self.assertEqual(vistas, esperadas)
+
+    def test_cursor_invalido(self):
+        response = self.client.get(self.url, {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CHAT_SSE_DURACION_MAX=0)
+class ChatStreamTests(TestCase):
+    """chat_stream: recuperación por Last-Event-ID y publicación de mensajes nuevos"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='x', role='staff')
+        self.empleado = User.objects.create_user(username='empleado', password='x', role='employee')
+        colonia = ColoniaProcesada.objects.create(nombre='Colonia Chat', creado_por=self.staff)
+        self.config = ConfiguracionRuta.objects.create(colonia=colonia, creado_por=self.staff)
+        self.config.empleados_asignados.add(self.empleado)
+        self.url = f'/accounts/chat/{self.config.id}/stream/'
+
+    def crear_mensaje(self, usuario, contenido):
+        return ChatMessage.objects.create(configuracion_ruta=self.config, usuario=usuario, contenido=contenido)
+
+    def test_recupera_mensajes_posteriores_a_last_event_id(self):
+        primero = self.crear_mensaje(self.staff, 'hola')
+        segundo = self.crear_mensaje(self.staff, 'ruta lista')
+        self.client.force_login(self.empleado)
+
+        response = self.client.get(self.url, HTTP_LAST_EVENT_ID=str(primero.id))
+        contenido = b''.join(response.streaming_content).decode('utf-8')
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn(f'id: {segundo.id}\n', contenido)
+        self.assertNotIn(f'id: {primero.id}\n', contenido)
+        self.assertIn('"es_propio": false', contenido)
+
+    def test_recupera_mas_de_un_lote(self):
+        primero = self.crear_mensaje(self.staff, 'inicio')
+        ChatMessage.objects.bulk_create([
+            ChatMessage(configuracion_ruta=self.config, usuario=self.staff, contenido=f'mensaje {i}')
+            for i in range(250)
+        ])
+        self.client.force_login(self.empleado)
+
+        response = self.client.get(self.url, HTTP_LAST_EVENT_ID=str(primero.id))
+        contenido = b''.join(response.streaming_content).decode('utf-8')
+
+        ids = [int(linea[4:]) for linea in contenido.splitlines() if linea.startswith('id: ')]
+        esperados = ChatMessage.objects.filter(configuracion_ruta=self.config, id__gt=primero.id).order_by('id')
+        self.assertEqual(len(ids), 250)
+        self.assertEqual(ids, list(esperados.values_list('id', flat=True)))
+
+    def test_sin_acceso_a_la_ruta(self):
+        otro = User.objects.create_user(username='otro', password='x', role='employee')
+        self.client.force_login(otro)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_mensaje_nuevo_se_publica_al_confirmar(self):
+        with get_bus_chat().suscribir(self.config.id) as suscripcion:
+            with self.captureOnCommitCallbacks(execute=True):
+                mensaje = self.crear_mensaje(self.empleado, 'en camino')
+            publicados = suscripcion.esperar(timeout=0)
+
+        self.assertEqual([m['id'] for m in publicados], [mensaje.id])
+        self.assertEqual(publicados[0]['usuario']['username'], 'empleado')
+
+
+class ChatHistorialTests(TestCase):
+    """obtener_mensajes_chat: paginación por id del historial"""
+
+    url = '/accounts/chat/obtener_mensajes/'
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='x', role='staff')
+        colonia = ColoniaProcesada.objects.create(nombre='Colonia Historial', creado_por=self.staff)
+        self.config = ConfiguracionRuta.objects.create(colonia=colonia, creado_por=self.staff)
+        self.mensajes = [
+            ChatMessage.objects.create(configuracion_ruta=self.config, usuario=self.staff, contenido=f'mensaje {i}')
+            for i in range(7)
+        ]
+        self.client.force_login(self.staff)
+
+    def obtener(self, **datos):
+        response = self.client.post(self.url, json.dumps(dict(ruta_id=self.config.id, **datos)),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_recorrer_historial_hacia_atras(self):
+        data = self.obtener(limite=3)
+        vistos = [m['id'] for m in data['mensajes']]
+        while data['paginacion']['hay_mas_antiguos']:
+            data = self.obtener(limite=3, antes_de=data['paginacion']['primer_id'])
+            vistos = [m['id'] for m in data['mensajes']] + vistos
+
+        self.assertEqual(vistos, [m.id for m in self.mensajes])
+
+    def test_ponerse_al_dia_despues_de_un_id(self):
+        data = self.obtener(limite=2, despues_de=self.mensajes[2].id)
+
+        self.assertEqual([m['id'] for m in data['mensajes']], [self.mensajes[3].id, self.mensajes[4].id])
+        self.assertTrue(data['paginacion']['hay_mas_recientes'])
+
+
+class ChatBandejaTests(TestCase):
+    """bandeja_chat: no leídos de todas las rutas con un número fijo de consultas"""
+
+    url = '/accounts/chat/bandeja/'
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='x', role='staff')
+        self.empleado = User.objects.create_user(username='empleado', password='x', role='employee')
+        self.colonia = ColoniaProcesada.objects.create(nombre='Colonia Bandeja', creado_por=self.staff)
+        self.client.force_login(self.staff)
+
+    def crear_rutas(self, cantidad, mensajes_por_ruta):
+        rutas = []
+        for _ in range(cantidad):
+            config = ConfiguracionRuta.objects.create(colonia=self.colonia, creado_por=self.staff)
+            ChatParticipant.objects.create(configuracion_ruta=config, usuario=self.staff, rol_en_chat='staff')
+            ChatMessage.objects.create(configuracion_ruta=config, usuario=self.staff, contenido='propio')
+            for i in range(mensajes_por_ruta):
+                ChatMessage.objects.create(configuracion_ruta=config, usuario=self.empleado, contenido=f'mensaje {i}')
+            rutas.append(config)
+        return rutas
+
+    def obtener(self):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(consultas)
+
+    def test_conteos_por_ruta(self):
+        rutas = self.crear_rutas(2, 3)
+        ultimo = ChatMessage.objects.filter(configuracion_ruta=rutas[0]).latest('id')
+        ChatParticipant.objects.get(configuracion_ruta=rutas[0], usuario=self.staff).marcar_leidos(ultimo.id)
+
+        data, _ = self.obtener()
+
+        no_leidos = {r['ruta_id']: r['no_leidos'] for r in data['rutas']}
+        self.assertEqual(no_leidos, {rutas[0].id: 0, rutas[1].id: 3})
+        self.assertEqual(data['total_no_leidos'], 3)
+
+    def test_numero_de_consultas_no_depende_de_las_rutas(self):
+        self.crear_rutas(2, 1)
+        _, consultas_pocas = self.obtener()
+        self.crear_rutas(10, 2)
+        data, consultas_muchas = self.obtener()
+
+        self.assertEqual(len(data['rutas']), 12)
+        self.assertEqual(consultas_pocas, consultas_muchas)
+
+
+class ChatLecturasTests(TestCase):
+    """Marca de lectura por participante: un UPDATE por lectura y "visto por" sin recorrer mensajes"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='x', role='staff')
+        self.empleado = User.objects.create_user(username='empleado', password='x', role='employee')
+        colonia = ColoniaProcesada.objects.create(nombre='Colonia Lecturas', creado_por=self.staff)
+        self.config = ConfiguracionRuta.objects.create(colonia=colonia, creado_por=self.staff)
+        self.config.empleados_asignados.add(self.empleado)
+        self.participante = ChatParticipant.objects.create(
+            configuracion_ruta=self.config, usuario=self.empleado, rol_en_chat='empleado')
+        self.mensajes = [
+            ChatMessage.objects.create(configuracion_ruta=self.config, usuario=self.staff, contenido=f'mensaje {i}')
+            for i in range(5)
+        ]
+
+    def test_marcar_leidos_es_un_update_y_no_retrocede(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(self.participante.marcar_leidos(self.mensajes[3].id))
+        self.assertFalse(self.participante.marcar_leidos(self.mensajes[1].id))
+
+        self.participante.refresh_from_db()
+        self.assertEqual(self.participante.ultimo_mensaje_leido_id, self.mensajes[3].id)
+        self.assertEqual(self.participante.get_mensajes_no_leidos(), 1)
+        self.assertEqual(list(self.mensajes[3].leido_por()), [self.participante])
+        self.assertEqual(list(self.mensajes[4].leido_por()), [])
+
+    def test_endpoint_y_lecturas_en_el_historial(self):
+        self.client.force_login(self.empleado)
+        response = self.client.post('/accounts/chat/marcar_leidos/', json.dumps(
+            {'ruta_id': self.config.id, 'hasta_id': self.mensajes[2].id}), content_type='application/json')
+        self.assertEqual(response.json()['ultimo_mensaje_leido_id'], self.mensajes[2].id)
+
+        self.client.force_login(self.staff)
+        response = self.client.post('/accounts/chat/obtener_mensajes/', json.dumps(
+            {'ruta_id': self.config.id}), content_type='application/json')
+        lecturas = {l['username']: l['ultimo_mensaje_leido_id'] for l in response.json()['lecturas']}
+        self.assertEqual(lecturas['empleado'], self.mensajes[2].id)
+
+
+class DividirPoligonoTests(TestCase):
+    """dividir_poligono_para_empleados: la división se encola como trabajo"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='x', role='staff')
+        self.client.force_login(self.staff)
+        self.colonia = ColoniaProcesada.objects.create(
+            nombre='Colonia Dividir', creado_por=self.staff,
+            poligono_geojson={'type': 'Polygon', 'coordinates': [[[0, 0], [0, 1], [1, 1], [0, 0]]]})
+
+    def test_responde_con_el_trabajo_encolado(self):
+        response = self.client.post('/accounts/dividir_poligono_para_empleados/', json.dumps(
+            {'colonia_id': self.colonia.id, 'employee_ids': [1, 2, 3]}), content_type='application/json')
+
+        self.assertEqual(response.status_code, 202)
+        trabajo = TrabajoProcesamiento.objects.get(id=response.json()['job_id'])
+        self.assertEqual(trabajo.tipo, 'dividir_poligono')
+        self.assertEqual(trabajo.estado, 'pendiente')
+        self.assertEqual(trabajo.parametros['num_empleados'], 3)
@@ -27,6 +27,9 @@ from .views import (user_login,
                     obtener_mensajes_chat,
                     enviar_mensaje_chat,
                     verificar_mensajes_nuevos,
+                    marcar_leidos_chat,
+                    chat_stream,
+                    bandeja_chat,
                     chat_dashboard,
                     user_logout,
                     researcher_dashboard,
@@ -44,7 +47,11 @@ from .views import (user_login,
                     marcar_ruta_completada_staff,
                     obtener_rutas_empleado,
                     obtener_rutas_staff_supervision,
-                    get_all_colonias)
+                    get_all_colonias,
+                    estado_trabajo,
+                    benchmark_algoritmos,
+                    colonias_en_punto,
+                    colonias_superpuestas)
 
 urlpatterns = [
     path('login/', user_login, name='user_login'),
@@ -74,6 +81,9 @@ urlpatterns = [
     path('chat/obtener_mensajes/', obtener_mensajes_chat, name='obtener_mensajes_chat'),
     path('chat/enviar_mensaje/', enviar_mensaje_chat, name='enviar_mensaje_chat'),
     path('chat/verificar_nuevos/', verificar_mensajes_nuevos, name='verificar_mensajes_nuevos'),
+    path('chat/marcar_leidos/', marcar_leidos_chat, name='marcar_leidos_chat'),
+    path('chat/<int:ruta_id>/stream/', chat_stream, name='chat_stream'),
+    path('chat/bandeja/', bandeja_chat, name='bandeja_chat'),
     
     # Dashboard de chats del staff
     path('chat_dashboard/', chat_dashboard, name='chat_dashboard'),
@@ -86,6 +96,7 @@ urlpatterns = [
     path('comparacion_algoritmos/', comparacion_algoritmos_dashboard, name='comparacion_algoritmos_dashboard'),
     path('api/analizar_algoritmo/', analizar_algoritmo, name='analizar_algoritmo'),
     path('api/comparar_algoritmos/', comparar_algoritmos, name='comparar_algoritmos'),
+    path('api/benchmark_algoritmos/', benchmark_algoritmos, name='benchmark_algoritmos'),
     path('api/obtener_historico/', obtener_historico_algoritmo, name='obtener_historico_algoritmo'),
     path('gestion_algoritmos/', gestion_algoritmos_dashboard, name='gestion_algoritmos_dashboard'),
     path('api/cambiar_algoritmo_defecto/', cambiar_algoritmo_defecto, name='cambiar_algoritmo_defecto'),
@@ -103,4 +114,11 @@ urlpatterns = [
     path('api/rutas_empleado/', obtener_rutas_empleado, name='obtener_rutas_empleado'),
     path('api/rutas_staff_supervision/', obtener_rutas_staff_supervision, name='obtener_rutas_staff_supervision'),
     path('get_all_colonias/', get_all_colonias, name='get_all_colonias'),
+    
+    # Índice espacial de colonias
+    path('api/colonias/en_punto/', colonias_en_punto, name='colonias_en_punto'),
+    path('api/colonias/<int:colonia_id>/superpuestas/', colonias_superpuestas, name='colonias_superpuestas'),
+    
+    # Trabajos asíncronos de procesamiento
+    path('trabajos/<int:trabajo_id>/', estado_trabajo, name='estado_trabajo'),
 ]
\ No newline at end of file
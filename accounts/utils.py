@@ -1,20 +1,9 @@
 import os
 import json
 import re
-from io import BytesIO
 from django.core.mail import EmailMessage
 from django.template.loader import render_to_string
 from django.conf import settings
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER, TA_LEFT
-import folium
-from PIL import Image as PILImage
-import base64
-import tempfile
 from difflib import SequenceMatcher
 
 
@@ -23,10 +12,18 @@ from difflib import SequenceMatcher
 
 def get_map_url_from_configuracion(configuracion_ruta, verify_exists=True):
     """
-    Extract map ID from mapa_html field and return the corresponding map URL
-    Optionally verify if the map exists in the API
+    Return the map URL for a route configuration: the shared GeoJSON viewer
+    when mapa_calculado has the zone geometry, otherwise the legacy HTML map whose ID
+    is extracted from mapa_html (optionally verifying it exists in the API)
     """
     try:
+        # Rutas con geometría en mapa_calculado: se usa el visor compartido
+        from core.utils.geojson_rutas import tiene_geometria
+        if tiene_geometria(configuracion_ruta.mapa_calculado):
+            map_url = f"/api/rutas/{configuracion_ruta.id}/mapa/"
+            print(f"🗺️ URL del mapa: {map_url}")
+            return map_url
+        
         if not configuracion_ruta.mapa_html:
             print("No hay mapa_html en la configuración")
             return None
@@ -12,12 +12,10 @@ import json
 import time
 import random
 from core.models import ColoniaProcesada,ConfiguracionRuta
-from shapely.geometry import shape
 # Create your views here.
 import os
-from core.utils.main import procesar_poligono_completo
-import psutil
-import os
+# El stack geo/ML (core.utils.main: osmnx, geopandas, folium, sklearn...) se importa
+# dentro de cada vista la primera vez que se usa; ver core/utils/precarga.py
 from .utils import (
     normalize_colonia_name, 
     validate_colonia_name, 
@@ -87,8 +85,8 @@ def admin_dashboard(request):
                 # Obtener configuración de la colonia
                 from core.utils.main import download_bbox
                 from core.utils.polygon_logic import get_colonia_config
-                cache_path = download_bbox(colonia)
-                config = get_colonia_config(cache_path)
+                resultados_nominatim = download_bbox(colonia)
+                config = get_colonia_config(resultados_nominatim)
                 colonia_obj.configuracion = config
                 
                 # Guardar polígono y datos JSON si se proporcionan
@@ -179,8 +177,8 @@ def admin_dashboard(request):
             try:
                 from core.utils.main import download_bbox
                 from core.utils.polygon_logic import get_colonia_config
-                cache_path = download_bbox(colonia)
-                config = get_colonia_config(cache_path)
+                resultados_nominatim = download_bbox(colonia)
+                config = get_colonia_config(resultados_nominatim)
                 context['colonia'] = colonia
                 context['config'] = config
                 
@@ -389,8 +387,8 @@ def buscar_colonia_inteligente(request):
                     from core.utils.main import download_bbox
                     from core.utils.polygon_logic import get_colonia_config
                     
-                    cache_path = download_bbox(cleaned_query)
-                    config = get_colonia_config(cache_path)
+                    resultados_nominatim = download_bbox(cleaned_query)
+                    config = get_colonia_config(resultados_nominatim)
                     
                     return JsonResponse({
                         'success': True,
@@ -460,6 +458,7 @@ def staff_dashboard(request):
     context = {
         'colonias': colonias,
         'empleados': empleados,
+        'max_empleados_ruta': ConfiguracionRuta.MAX_EMPLEADOS,
     }
     
     return render(request, 'staff_dashboard.html', context)
@@ -595,8 +594,8 @@ def admin_map_dashboard(request):
         if colonia:
             from core.utils.main import download_bbox, procesar_poligono_completo
             try:
-                # Descargar y guardar el bbox de la colonia
-                cache_path = download_bbox(colonia)
+                # Descargar (o leer de caché) el bbox de la colonia
+                download_bbox(colonia)
                 
                 # Buscar la colonia en la base de datos por nombre
                 try:
@@ -853,6 +852,9 @@ def guardar_configuracion_rutas(request):
             print("ERROR: No empleados provided")
             return JsonResponse({'error': 'Debe seleccionar al menos un empleado'}, status=400)
         
+        if len(empleados) > ConfiguracionRuta.MAX_EMPLEADOS:
+            return JsonResponse({'error': f'Máximo {ConfiguracionRuta.MAX_EMPLEADOS} empleados por ruta'}, status=400)
+        
         # Verificar que la colonia existe
         try:
             colonia = ColoniaProcesada.objects.get(id=colonia_id)
@@ -891,124 +893,51 @@ def guardar_configuracion_rutas(request):
                 'estado_asignacion': 'activo'
             })
         
-        # Calcular rutas reales usando el algoritmo de división
-        from core.utils.main import procesar_poligono_completo
-        import os
+        # Obtener el algoritmo activo por defecto
+        from django.db import transaction
+        from core.models import ConfiguracionAlgoritmo, TrabajoProcesamiento
+        from core.utils.trabajos import encolar_trabajo
+        config_activa = ConfiguracionAlgoritmo.objects.filter(activo=True).first()
+        algoritmo_activo = config_activa.algoritmo_por_defecto if config_activa else 'kernighan_lin'
         
-        print(f"🚀 GUARDAR_CONFIGURACION: Procesando colonia_id={colonia.id}, empleados={len(empleados_validos)}")
+        print(f"🔧 GUARDAR_CONFIGURACION: Usando algoritmo activo: {algoritmo_activo}")
         
-        try:
-            # Obtener el algoritmo activo por defecto
-            from core.models import ConfiguracionAlgoritmo
-            config_activa = ConfiguracionAlgoritmo.objects.filter(activo=True).first()
-            algoritmo_activo = config_activa.algoritmo_por_defecto if config_activa else 'kernighan_lin'
-            
-            print(f"🔧 GUARDAR_CONFIGURACION: Usando algoritmo activo: {algoritmo_activo}")
-            
-            # Procesar con el algoritmo real usando base de datos
-            num_employees = len(empleados_validos)
-            resultado = procesar_poligono_completo(colonia.id, num_employees, algoritmo_activo)
-            
-            # Extraer coordenadas reales de las calles
-            G = resultado['graph']
-            part1 = resultado['part1_nodes']
-            part2 = resultado['part2_nodes']
-            
-            # Extraer calles para cada zona
-            calles_ruta1 = []
-            for u, v, data in G.edges(data=True):
-                if u in part1 and v in part1:
-                    if 'geometry' in data:
-                        coords = [(pt[1], pt[0]) for pt in data['geometry'].coords]
-                    else:
-                        coords = [(G.nodes[u]['y'], G.nodes[u]['x']), (G.nodes[v]['y'], G.nodes[v]['x'])]
-                    calles_ruta1.append(coords)
-            
-            calles_ruta2 = []
-            if num_employees > 1:
-                for u, v, data in G.edges(data=True):
-                    if u in part2 and v in part2:
-                        if 'geometry' in data:
-                            coords = [(pt[1], pt[0]) for pt in data['geometry'].coords]
-                        else:
-                            coords = [(G.nodes[u]['y'], G.nodes[u]['x']), (G.nodes[v]['y'], G.nodes[v]['x'])]
-                        calles_ruta2.append(coords)
-            
-            # Crear datos de ruta reales
-            datos_ruta = {
-                'fecha_creacion_frontend': data.get('fecha_creacion'),
-                'empleados_ids': [e.id for e in empleados_validos],
-                'empleados_usernames': [e.username for e in empleados_validos],
-                'distancia_total': (resultado['longitudes']['zona1_m'] + resultado['longitudes']['zona2_m']) / 1000,  # Convertir a km
-                'puntos_parada': resultado['nodos']['total'],
-                'tipo_ruta': 'algoritmo_grafos'
-            }
-            
-            # Crear mapa calculado con datos reales
-            mapa_calculado = {
-                'rutas': [],
-                'centro_colonia': colonia.get_configuracion_centro(),
-                'poligono_colonia': colonia.poligono_geojson
-            }
+        # Datos de la ruta; distancia y paradas los completa el trabajo al calcular las rutas
+        datos_ruta = {
+            'fecha_creacion_frontend': data.get('fecha_creacion'),
+            'empleados_ids': [e.id for e in empleados_validos],
+            'empleados_usernames': [e.username for e in empleados_validos],
+            'tipo_ruta': 'algoritmo_grafos'
+        }
+        
+        with transaction.atomic():
+            configuracion_ruta = ConfiguracionRuta.objects.create(
+                colonia=colonia,
+                creado_por=request.user,
+                estado='pendiente',
+                informacion_empleados=informacion_empleados,
+                notas=f"Ruta asignada por {request.user.username} usando algoritmo {algoritmo_activo}",
+                datos_ruta=datos_ruta,
+                chat_asignado=f"chat_ruta_{colonia.id}_{random.randint(1000, 9999)}",
+                tiempo_calculado=tiempo_estimado,
+                algoritmo_usado=algoritmo_activo
+            )
             
-            # Obtener el HTML del mapa generado
-            mapa_html_content = resultado.get('mapa_html_content', '')
-            
-            # Crear rutas reales para cada empleado
-            colores_rutas = ['#e74c3c', '#3498db', '#2ecc71']
-            for i, empleado in enumerate(empleados_validos):
-                if i == 0:  # Primer empleado - ruta 1
-                    ruta_empleado = {
-                        'empleado_id': empleado.id,
-                        'empleado_nombre': empleado.username,
-                        'color_ruta': colores_rutas[i],
-                        'puntos': calles_ruta1,  # Coordenadas reales
-                        'distancia': resultado['longitudes']['zona1_m'] / 1000,  # Convertir a km
-                        'tiempo_estimado': int((resultado['longitudes']['zona1_m'] / 1000) * 15),  # Estimación: 15 min/km
-                        'nodos': resultado['nodos']['zona1'],
-                        'area': resultado['areas']['zona1_m2']
-                    }
-                elif i == 1 and num_employees > 1:  # Segundo empleado - ruta 2
-                    ruta_empleado = {
-                        'empleado_id': empleado.id,
-                        'empleado_nombre': empleado.username,
-                        'color_ruta': colores_rutas[i],
-                        'puntos': calles_ruta2,  # Coordenadas reales
-                        'distancia': resultado['longitudes']['zona2_m'] / 1000,  # Convertir a km
-                        'tiempo_estimado': int((resultado['longitudes']['zona2_m'] / 1000) * 15),  # Estimación: 15 min/km
-                        'nodos': resultado['nodos']['zona2'],
-                        'area': resultado['areas']['zona2_m2']
-                    }
-                
-                mapa_calculado['rutas'].append(ruta_empleado)
+            # Agregar empleados a la configuración
+            configuracion_ruta.empleados_asignados.set(empleados_validos)
             
-            # Calcular tiempo total estimado basado en las rutas reales
-            tiempo_total_minutos = sum(ruta['tiempo_estimado'] for ruta in mapa_calculado['rutas'])
-            tiempo_estimado = timedelta(minutes=tiempo_total_minutos)
+            # Crear participantes de chat automáticamente
+            crear_participantes_chat(configuracion_ruta)
             
-        except Exception as e:
-            print(f"❌ GUARDAR_CONFIGURACION: Error procesando polígono: {str(e)}")
-            return JsonResponse({'error': f'Error al procesar rutas: {str(e)}'}, status=500)
-        
-        configuracion_ruta = ConfiguracionRuta.objects.create(
-            colonia=colonia,
-            creado_por=request.user,
-            estado='pendiente',
-            informacion_empleados=informacion_empleados,
-            notas=f"Ruta asignada por {request.user.username} usando algoritmo {algoritmo_activo}",
-            datos_ruta=datos_ruta,
-            mapa_calculado=mapa_calculado,
-            mapa_html=mapa_html_content,
-            chat_asignado=f"chat_ruta_{colonia.id}_{random.randint(1000, 9999)}",
-            tiempo_calculado=tiempo_estimado,
-            algoritmo_usado=algoritmo_activo
-        )
-        
-        # Agregar empleados a la configuración
-        configuracion_ruta.empleados_asignados.set(empleados_validos)
-        
-        # Crear participantes de chat automáticamente
-        crear_participantes_chat(configuracion_ruta)
+            # Calcular las rutas en segundo plano; el frontend consulta el avance con el job_id
+            trabajo = TrabajoProcesamiento.objects.create(
+                tipo='calcular_rutas',
+                colonia=colonia,
+                configuracion_ruta=configuracion_ruta,
+                parametros={'num_empleados': len(empleados_validos), 'algoritmo': algoritmo_activo},
+                creado_por=request.user
+            )
+            encolar_trabajo(trabajo)
         
         print(f"Configuración guardada en BD por {request.user.username}:")
         print(f"  ID Configuración: {configuracion_ruta.id}")
@@ -1016,25 +945,45 @@ def guardar_configuracion_rutas(request):
         print(f"  Empleados: {[e.username for e in empleados_validos]}")
         print(f"  Algoritmo usado: {algoritmo_activo}")
         print(f"  Fecha: {data.get('fecha_creacion')}")
-        print(f"  Tiempo estimado: {configuracion_ruta.get_tiempo_formateado()}")
+        print(f"  Trabajo de cálculo: {trabajo.id}")
         print(f"  Chat asignado: {configuracion_ruta.chat_asignado}")
         
         return JsonResponse({
             'success': True,
-            'message': f'Configuración guardada para {len(empleados_validos)} empleados en "{colonia.nombre}" usando algoritmo {algoritmo_activo}',
+            'message': f'Configuración guardada para {len(empleados_validos)} empleados en "{colonia.nombre}" usando algoritmo {algoritmo_activo}. Calculando rutas...',
             'colonia': colonia.nombre,
             'empleados_count': len(empleados_validos),
             'configuracion_id': configuracion_ruta.id,
+            'job_id': trabajo.id,
+            'job_url': f'/accounts/trabajos/{trabajo.id}/',
             'algoritmo_usado': algoritmo_activo,
-            'tiempo_estimado': configuracion_ruta.get_tiempo_formateado(),
             'chat_asignado': configuracion_ruta.chat_asignado,
             'estado': configuracion_ruta.estado
-        })
+        }, status=202)
         
     except Exception as e:
         print(f"ERROR en guardar_configuracion_rutas: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
+@login_required
+def estado_trabajo(request, trabajo_id):
+    """Endpoint para consultar el estado y avance de un trabajo de procesamiento"""
+    from core.models import TrabajoProcesamiento
+    from core.utils.trabajos import barrer_si_corresponde
+    
+    # Quien consulta un trabajo atorado (su worker se recicló) dispara su recuperación
+    barrer_si_corresponde()
+    
+    try:
+        trabajo = TrabajoProcesamiento.objects.get(id=trabajo_id)
+    except TrabajoProcesamiento.DoesNotExist:
+        return JsonResponse({'error': 'Trabajo no encontrado'}, status=404)
+    
+    if trabajo.creado_por_id != request.user.id and request.user.role != 'admin':
+        return JsonResponse({'error': 'Acceso denegado'}, status=403)
+    
+    return JsonResponse(trabajo.to_dict())
+
 @login_required
 def listar_rutas_staff(request):
     """Endpoint para listar las rutas creadas por el staff"""
@@ -1044,29 +993,37 @@ def listar_rutas_staff(request):
     try:
         from core.models import ConfiguracionRuta
         
-        # Obtener rutas creadas por el usuario actual
-        rutas = ConfiguracionRuta.objects.filter(creado_por=request.user).order_by('-fecha_creacion')
-        
-        rutas_data = []
-        for ruta in rutas:
-            empleados_info = ruta.get_empleados_info()
-            rutas_data.append({
-                'id': ruta.id,
-                'colonia_nombre': ruta.colonia.nombre,
-                'empleados': empleados_info,
-                'empleados_count': ruta.get_empleados_count(),
-                'estado': ruta.estado,
-                'fecha_creacion': ruta.fecha_creacion.isoformat(),
-                'tiempo_estimado': ruta.get_tiempo_formateado(),
-                'chat_asignado': ruta.chat_asignado,
-                'notas': ruta.notas,
-                'datos_ruta': ruta.datos_ruta
-            })
+        from core.utils.json_streaming import StreamingJsonResponse
+        
+        # Obtener rutas creadas por el usuario actual (mapa_calculado no se usa aquí)
+        rutas = (ConfiguracionRuta.objects.filter(creado_por=request.user)
+                 .select_related('colonia')
+                 .prefetch_related('empleados_asignados')
+                 .defer('mapa_calculado', 'mapa_html')
+                 .order_by('-fecha_creacion'))
+        total_rutas = rutas.count()
+        
+        def rutas_data():
+            # Se serializan mientras se envían, por bloques de 100 configuraciones
+            for ruta in rutas.iterator(chunk_size=100):
+                empleados_info = ruta.get_empleados_info()
+                yield {
+                    'id': ruta.id,
+                    'colonia_nombre': ruta.colonia.nombre,
+                    'empleados': empleados_info,
+                    'empleados_count': len(empleados_info),
+                    'estado': ruta.estado,
+                    'fecha_creacion': ruta.fecha_creacion.isoformat(),
+                    'tiempo_estimado': ruta.get_tiempo_formateado(),
+                    'chat_asignado': ruta.chat_asignado,
+                    'notas': ruta.notas,
+                    'datos_ruta': ruta.datos_ruta
+                }
         
-        return JsonResponse({
+        return StreamingJsonResponse({
             'success': True,
-            'rutas': rutas_data,
-            'total_rutas': len(rutas_data)
+            'total_rutas': total_rutas,
+            'rutas': rutas_data()
         })
         
     except Exception as e:
@@ -1079,7 +1036,10 @@ def listar_rutas_staff(request):
 def dividir_poligono_para_empleados(request):
     """
     Usa el algoritmo existente de división de grafos para crear
-    rutas reales para los empleados seleccionados
+    rutas reales para los empleados seleccionados.
+    
+    La división corre como TrabajoProcesamiento: se responde 202 con el job_id
+    y las rutas llegan en el resultado del trabajo (/accounts/trabajos/<id>/).
     """
     if request.method == 'POST':
         try:
@@ -1105,88 +1065,36 @@ def dividir_poligono_para_empleados(request):
         # 3. Determinar número de empleados y validar límite
         num_employees = len(employee_ids) if employee_ids else 2  # Default a 2 si no se especifica
         
-        # Validar que no se exceda el límite de 2 empleados
-        if num_employees > 2:
+        # Validar que no se exceda el límite de empleados por ruta
+        if num_employees > ConfiguracionRuta.MAX_EMPLEADOS:
             return JsonResponse({
-                'error': f'El sistema solo permite asignar rutas a 1 o 2 empleados máximo. Se recibieron {num_employees} empleados.'
+                'error': f'El sistema solo permite asignar rutas a {ConfiguracionRuta.MAX_EMPLEADOS} empleados máximo. Se recibieron {num_employees} empleados.'
             }, status=400)
         
-        # 4. Usar tu algoritmo existente con el número correcto de empleados
-        from core.utils.main import procesar_poligono_completo
-        
-        # Obtener el algoritmo activo por defecto
-        from core.models import ConfiguracionAlgoritmo
+        # 4. Obtener el algoritmo activo por defecto
+        from core.models import ConfiguracionAlgoritmo, TrabajoProcesamiento
+        from core.utils.trabajos import encolar_trabajo
         config_activa = ConfiguracionAlgoritmo.objects.filter(activo=True).first()
         algoritmo_activo = config_activa.algoritmo_por_defecto if config_activa else 'kernighan_lin'
         
-        print(f"🚀 DIVIDIR_POLIGONO: Procesando colonia_id={colonia_id}, empleados={num_employees}, algoritmo={algoritmo_activo}")
-        
-        # 5. Procesar directamente usando la base de datos (sin archivos temporales)
-        resultado = procesar_poligono_completo(colonia_id, num_employees, algoritmo_activo)
-        
-        # 8. Extraer coordenadas reales de las calles para cada zona
-        from core.utils.main import ox, nx
-        from networkx.algorithms.community.kernighan_lin import kernighan_lin_bisection
-        
-        # Usar el grafo y nodos ya procesados
-        G = resultado['graph']
-        part1 = resultado['part1_nodes']
-        part2 = resultado['part2_nodes']
+        # 5. Dividir en segundo plano; el frontend consulta el avance y recibe las rutas
+        # (calles como polilíneas codificadas) en el resultado del trabajo
+        trabajo = TrabajoProcesamiento.objects.create(
+            tipo='dividir_poligono',
+            colonia=colonia,
+            parametros={'num_empleados': num_employees, 'algoritmo': algoritmo_activo},
+            creado_por=request.user
+        )
+        encolar_trabajo(trabajo)
         
-        # Extraer coordenadas de calles para zona 1 (roja)
-        calles_ruta1 = []
-        for u, v, data in G.edges(data=True):
-            if u in part1 and v in part1:
-                if 'geometry' in data:
-                    coords = [(pt[1], pt[0]) for pt in data['geometry'].coords]
-                else:
-                    coords = [(G.nodes[u]['y'], G.nodes[u]['x']), (G.nodes[v]['y'], G.nodes[v]['x'])]
-                calles_ruta1.append(coords)
-        
-        # Extraer coordenadas de calles para zona 2 (azul) - solo si hay más de un empleado
-        calles_ruta2 = []
-        if num_employees > 1:
-            for u, v, data in G.edges(data=True):
-                if u in part2 and v in part2:
-                    if 'geometry' in data:
-                        coords = [(pt[1], pt[0]) for pt in data['geometry'].coords]
-                    else:
-                        coords = [(G.nodes[u]['y'], G.nodes[u]['x']), (G.nodes[v]['y'], G.nodes[v]['x'])]
-                    calles_ruta2.append(coords)
+        print(f"📥 DIVIDIR_POLIGONO: trabajo {trabajo.id} para colonia_id={colonia_id}, empleados={num_employees}, algoritmo={algoritmo_activo}")
         
-        # 9. Preparar respuesta para el frontend con calles reales
-        response_data = {
+        return JsonResponse({
             'success': True,
-            'algoritmo_usado': algoritmo_activo,  # Agregar algoritmo usado
-            'ruta1': {
-                'nodos': resultado['nodos']['zona1'],
-                'longitud': resultado['longitudes']['zona1_m'],
-                'area': resultado['areas']['zona1_m2'],
-                'densidad_nodos': resultado['densidades']['nodos_por_km2_z1'],
-                'densidad_calles': resultado['densidades']['calles_m_por_km2_z1'],
-                'color': '#e74c3c',  # Rojo
-                'calles': calles_ruta1  # Coordenadas reales de calles
-            },
-            'metricas_totales': {
-                'nodos_total': resultado['nodos']['total'],
-                'longitud_total': resultado['longitudes']['zona1_m'] + resultado['longitudes']['zona2_m'],
-                'area_total': resultado['areas']['zona1_m2'] + resultado['areas']['zona2_m2']
-            }
-        }
-        
-        # Solo incluir ruta2 si hay más de un empleado
-        if num_employees > 1:
-            response_data['ruta2'] = {
-                'nodos': resultado['nodos']['zona2'],
-                'longitud': resultado['longitudes']['zona2_m'],
-                'area': resultado['areas']['zona2_m2'],
-                'densidad_nodos': resultado['densidades']['nodos_por_km2_z2'],
-                'densidad_calles': resultado['densidades']['calles_m_por_km2_z2'],
-                'color': '#3498db',  # Azul
-                'calles': calles_ruta2  # Coordenadas reales de calles
-            }
-        
-        return JsonResponse(response_data)
+            'job_id': trabajo.id,
+            'job_url': f'/accounts/trabajos/{trabajo.id}/',
+            'algoritmo_usado': algoritmo_activo
+        }, status=202)
         
     except ColoniaProcesada.DoesNotExist:
         return JsonResponse({'error': 'Colonia no encontrada'}, status=404)
@@ -1499,6 +1407,18 @@ def obtener_ruta_empleado(request):
                 for i, ruta_data in enumerate(ruta.mapa_calculado['rutas']):
                     print(f"  - Ruta {i+1}: empleado_id={ruta_data.get('empleado_id')}, puntos={len(ruta_data.get('puntos', []))}")
         
+        # Las calles se piden por tiles (/tiles/<id>/<z>/<x>/<y>) en lugar de mandar todo el GeoJSON
+        mapa_calculado = ruta.mapa_calculado
+        tiles = None
+        from core.utils.geojson_rutas import tiene_geometria
+        if tiene_geometria(mapa_calculado):
+            from core.utils.tiles import version_mapa
+            mapa_calculado = {k: v for k, v in mapa_calculado.items() if k not in ('geometria', 'geojson')}
+            tiles = {
+                'configuracion_id': ruta.id,
+                'version': version_mapa(mapa_calculado),
+            }
+
         response_data = {
             'ruta_id': ruta.id,
             'colonia': {
@@ -1506,7 +1426,8 @@ def obtener_ruta_empleado(request):
                 'nombre': ruta.colonia.nombre
             },
             'empleados': empleados_info,
-            'mapa_calculado': ruta.mapa_calculado,
+            'mapa_calculado': mapa_calculado,
+            'tiles': tiles,
             'mapa_html': ruta.mapa_html,
             'ruta_empleado': ruta_empleado,
             'datos_ruta': ruta.datos_ruta,
@@ -1558,10 +1479,32 @@ def crear_participantes_chat(configuracion_ruta):
         tipo_mensaje='sistema'
     )
 
+def ruta_chat_de_usuario(usuario, ruta_id):
+    """Ruta cuyo chat puede ver el usuario (staff que la creó o empleado asignado), o None"""
+    if usuario.role == 'staff':
+        return ConfiguracionRuta.objects.filter(id=ruta_id, creado_por=usuario).select_related('colonia').first()
+    if usuario.role == 'employee':
+        return ConfiguracionRuta.objects.filter(id=ruta_id, empleados_asignados=usuario).select_related('colonia').first()
+    return None
+
+def lecturas_chat(ruta):
+    """Marca de lectura de cada participante; el cliente arma el "visto por" comparando ids"""
+    from core.models import ChatParticipant
+    return [
+        {
+            'usuario_id': p['usuario_id'],
+            'username': p['usuario__username'],
+            'ultimo_mensaje_leido_id': p['ultimo_mensaje_leido_id']
+        }
+        for p in ChatParticipant.objects.filter(configuracion_ruta=ruta).values(
+            'usuario_id', 'usuario__username', 'ultimo_mensaje_leido_id'
+        )
+    ]
+
 @login_required
 @csrf_exempt
 def obtener_mensajes_chat(request):
-    """Obtener mensajes de chat de una ruta específica"""
+    """Obtener mensajes de chat de una ruta específica, paginados por id (antes_de / despues_de / limite)"""
     if request.method != 'POST':
         return JsonResponse({'error': 'Método no permitido'}, status=405)
     
@@ -1572,70 +1515,74 @@ def obtener_mensajes_chat(request):
         if not ruta_id:
             return JsonResponse({'error': 'ID de ruta requerido'}, status=400)
         
-        from core.models import ConfiguracionRuta, ChatMessage, ChatParticipant
+        from core.models import ChatMessage, ChatParticipant
         
         # Verificar que el usuario tiene acceso a esta ruta
-        if request.user.role == 'staff':
-            ruta = ConfiguracionRuta.objects.filter(
-                id=ruta_id,
-                creado_por=request.user
-            ).first()
-        elif request.user.role == 'employee':
-            ruta = ConfiguracionRuta.objects.filter(
-                id=ruta_id,
-                empleados_asignados=request.user
-            ).first()
-        else:
+        if request.user.role not in ('staff', 'employee'):
             return JsonResponse({'error': 'Acceso denegado'}, status=403)
         
+        ruta = ruta_chat_de_usuario(request.user, ruta_id)
         if not ruta:
             return JsonResponse({'error': 'Ruta no encontrada o sin acceso'}, status=404)
         
-        # Obtener mensajes de los últimos 3 días
-        from datetime import timedelta
-        from django.utils import timezone
-        
-        limite_tiempo = timezone.now() - timedelta(days=3)
-        mensajes = ChatMessage.objects.filter(
-            configuracion_ruta=ruta,
-            timestamp__gte=limite_tiempo
-        ).select_related('usuario').order_by('timestamp')
-        
-        # Formatear mensajes para el frontend
-        mensajes_data = []
-        for mensaje in mensajes:
-            mensajes_data.append({
-                'id': mensaje.id,
-                'usuario': {
-                    'id': mensaje.usuario.id,
-                    'username': mensaje.usuario.username,
-                    'role': mensaje.usuario.role
-                },
-                'contenido': mensaje.contenido,
-                'timestamp': mensaje.timestamp.isoformat(),
-                'tiempo_relativo': mensaje.get_tiempo_relativo(),
-                'tipo_mensaje': mensaje.tipo_mensaje,
-                'es_propio': mensaje.usuario == request.user
-            })
+        # Paginación por id: sin cursores, la página más reciente; antes_de para
+        # cargar historial hacia atrás y despues_de para ponerse al día
+        from core.utils.paginacion import leer_limite
+        try:
+            limite = leer_limite(data.get('limite'))
+            antes_de = int(data['antes_de']) if data.get('antes_de') else None
+            despues_de = int(data['despues_de']) if data.get('despues_de') else None
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'limite, antes_de y despues_de deben ser enteros'}, status=400)
+        if antes_de and despues_de:
+            return JsonResponse({'error': 'Usa antes_de o despues_de, no ambos'}, status=400)
+        
+        mensajes = ChatMessage.objects.filter(configuracion_ruta=ruta).select_related('usuario')
+        if despues_de:
+            # Índice (configuracion_ruta, id) en orden ascendente
+            pagina = list(mensajes.filter(id__gt=despues_de).order_by('id')[:limite + 1])
+            hay_mas = len(pagina) > limite
+            pagina = pagina[:limite]
+        else:
+            if antes_de:
+                mensajes = mensajes.filter(id__lt=antes_de)
+            pagina = list(mensajes.order_by('-id')[:limite + 1])
+            hay_mas = len(pagina) > limite
+            pagina = pagina[:limite][::-1]
+        
+        # Formatear mensajes para el frontend (siempre del más antiguo al más reciente)
+        mensajes_data = [mensaje.to_dict(request.user) for mensaje in pagina]
+        
+        # Avanzar la marca de lectura hasta el último mensaje entregado (un solo UPDATE);
+        # las páginas de historial (antes_de) no cambian lo leído
+        if not antes_de and mensajes_data:
+            participante, created = ChatParticipant.objects.get_or_create(
+                configuracion_ruta=ruta,
+                usuario=request.user,
+                defaults={
+                    'rol_en_chat': 'staff' if request.user.role == 'staff' else 'empleado'
+                }
+            )
+            participante.marcar_leidos(mensajes_data[-1]['id'])
         
-        # Actualizar último visto del usuario
-        participante, created = ChatParticipant.objects.get_or_create(
-            configuracion_ruta=ruta,
-            usuario=request.user,
-            defaults={
-                'rol_en_chat': 'staff' if request.user.role == 'staff' else 'empleado'
-            }
-        )
-        participante.actualizar_ultimo_visto()
+        lecturas = lecturas_chat(ruta)
         
         return JsonResponse({
             'success': True,
             'mensajes': mensajes_data,
+            'paginacion': {
+                'limite': limite,
+                'hay_mas_antiguos': True if despues_de else hay_mas,
+                'hay_mas_recientes': hay_mas if despues_de else bool(antes_de),
+                'primer_id': mensajes_data[0]['id'] if mensajes_data else None,
+                'ultimo_id': mensajes_data[-1]['id'] if mensajes_data else None
+            },
             'chat_info': {
                 'ruta_id': ruta.id,
                 'colonia_nombre': ruta.colonia.nombre,
-                'participantes_count': ruta.participantes_chat.count()
-            }
+                'participantes_count': len(lecturas)
+            },
+            'lecturas': lecturas
         })
         
     except Exception as e:
@@ -1660,34 +1607,45 @@ def enviar_mensaje_chat(request):
         if len(contenido) > 1000:
             return JsonResponse({'error': 'Mensaje demasiado largo (máximo 1000 caracteres)'}, status=400)
         
-        from core.models import ConfiguracionRuta, ChatMessage, ChatParticipant
+        from core.models import ChatMessage, ChatParticipant
         
         # Verificar acceso a la ruta
-        if request.user.role == 'staff':
-            ruta = ConfiguracionRuta.objects.filter(
-                id=ruta_id,
-                creado_por=request.user
-            ).first()
-        elif request.user.role == 'employee':
-            ruta = ConfiguracionRuta.objects.filter(
-                id=ruta_id,
-                empleados_asignados=request.user
-            ).first()
-        else:
+        if request.user.role not in ('staff', 'employee'):
             return JsonResponse({'error': 'Acceso denegado'}, status=403)
         
+        ruta = ruta_chat_de_usuario(request.user, ruta_id)
         if not ruta:
             return JsonResponse({'error': 'Ruta no encontrada o sin acceso'}, status=404)
         
+        # Mensajes de ubicación: guardar coordenadas y la colonia en la que cae el punto
+        metadatos = None
+        if tipo_mensaje == 'ubicacion':
+            ubicacion = data.get('ubicacion') or {}
+            try:
+                lat = float(ubicacion['lat'])
+                lon = float(ubicacion['lon'])
+            except (KeyError, TypeError, ValueError):
+                return JsonResponse({'error': 'Ubicación inválida: se requieren lat y lon'}, status=400)
+            
+            from core.utils.indice_colonias import get_indice_colonias
+            colonias = get_indice_colonias().colonias_en_punto(lon, lat)
+            metadatos = {
+                'lat': lat,
+                'lon': lon,
+                'colonia': colonias[0] if colonias else None,
+                'en_colonia_de_ruta': any(c['id'] == ruta.colonia_id for c in colonias)
+            }
+        
         # Crear el mensaje
         mensaje = ChatMessage.objects.create(
             configuracion_ruta=ruta,
             usuario=request.user,
             contenido=contenido,
-            tipo_mensaje=tipo_mensaje
+            tipo_mensaje=tipo_mensaje,
+            metadatos=metadatos
         )
         
-        # Actualizar último visto del remitente
+        # El remitente ya leyó hasta su propio mensaje
         participante, created = ChatParticipant.objects.get_or_create(
             configuracion_ruta=ruta,
             usuario=request.user,
@@ -1695,28 +1653,64 @@ def enviar_mensaje_chat(request):
                 'rol_en_chat': 'staff' if request.user.role == 'staff' else 'empleado'
             }
         )
-        participante.actualizar_ultimo_visto()
+        participante.marcar_leidos(mensaje.id)
         
         return JsonResponse({
             'success': True,
-            'mensaje': {
-                'id': mensaje.id,
-                'usuario': {
-                    'id': mensaje.usuario.id,
-                    'username': mensaje.usuario.username,
-                    'role': mensaje.usuario.role
-                },
-                'contenido': mensaje.contenido,
-                'timestamp': mensaje.timestamp.isoformat(),
-                'tiempo_relativo': mensaje.get_tiempo_relativo(),
-                'tipo_mensaje': mensaje.tipo_mensaje,
-                'es_propio': True
-            }
+            'mensaje': mensaje.to_dict(request.user)
         })
         
     except Exception as e:
         return JsonResponse({'error': f'Error al enviar mensaje: {str(e)}'}, status=500)
 
+@login_required
+@csrf_exempt
+def marcar_leidos_chat(request):
+    """Marcar como leídos todos los mensajes de una ruta hasta hasta_id (recibo de lectura)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    try:
+        data = json.loads(request.body)
+        ruta_id = data.get('ruta_id')
+        try:
+            hasta_id = int(data.get('hasta_id'))
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'hasta_id debe ser un entero'}, status=400)
+        
+        if not ruta_id:
+            return JsonResponse({'error': 'ID de ruta requerido'}, status=400)
+        
+        from core.models import ChatMessage, ChatParticipant
+        
+        if request.user.role not in ('staff', 'employee'):
+            return JsonResponse({'error': 'Acceso denegado'}, status=403)
+        
+        ruta = ruta_chat_de_usuario(request.user, ruta_id)
+        if not ruta:
+            return JsonResponse({'error': 'Ruta no encontrada o sin acceso'}, status=404)
+        
+        if not ChatMessage.objects.filter(configuracion_ruta=ruta, id=hasta_id).exists():
+            return JsonResponse({'error': 'Mensaje no encontrado en esta ruta'}, status=404)
+        
+        participante, created = ChatParticipant.objects.get_or_create(
+            configuracion_ruta=ruta,
+            usuario=request.user,
+            defaults={
+                'rol_en_chat': 'staff' if request.user.role == 'staff' else 'empleado'
+            }
+        )
+        actualizado = participante.marcar_leidos(hasta_id)
+        
+        return JsonResponse({
+            'success': True,
+            'actualizado': actualizado,
+            'ultimo_mensaje_leido_id': participante.ultimo_mensaje_leido_id
+        })
+        
+    except Exception as e:
+        return JsonResponse({'error': f'Error al marcar mensajes como leídos: {str(e)}'}, status=500)
+
 @login_required
 @csrf_exempt  
 def verificar_mensajes_nuevos(request):
@@ -1732,22 +1726,13 @@ def verificar_mensajes_nuevos(request):
         if not ruta_id:
             return JsonResponse({'error': 'ID de ruta requerido'}, status=400)
         
-        from core.models import ConfiguracionRuta, ChatMessage, ChatParticipant
+        from core.models import ChatMessage, ChatParticipant
         
         # Verificar acceso
-        if request.user.role == 'staff':
-            ruta = ConfiguracionRuta.objects.filter(
-                id=ruta_id,
-                creado_por=request.user
-            ).first()
-        elif request.user.role == 'employee':
-            ruta = ConfiguracionRuta.objects.filter(
-                id=ruta_id,
-                empleados_asignados=request.user
-            ).first()
-        else:
+        if request.user.role not in ('staff', 'employee'):
             return JsonResponse({'error': 'Acceso denegado'}, status=403)
         
+        ruta = ruta_chat_de_usuario(request.user, ruta_id)
         if not ruta:
             return JsonResponse({'error': 'Ruta no encontrada'}, status=404)
         
@@ -1757,31 +1742,12 @@ def verificar_mensajes_nuevos(request):
             id__gt=ultimo_mensaje_id
         ).exclude(usuario=request.user).select_related('usuario')
         
-        mensajes_data = []
-        for mensaje in mensajes_nuevos:
-            mensajes_data.append({
-                'id': mensaje.id,
-                'usuario': {
-                    'id': mensaje.usuario.id,
-                    'username': mensaje.usuario.username,
-                    'role': mensaje.usuario.role
-                },
-                'contenido': mensaje.contenido,
-                'timestamp': mensaje.timestamp.isoformat(),
-                'tiempo_relativo': mensaje.get_tiempo_relativo(),
-                'tipo_mensaje': mensaje.tipo_mensaje,
-                'es_propio': False
-            })
+        mensajes_data = [mensaje.to_dict(request.user) for mensaje in mensajes_nuevos]
         
         # Obtener conteo de mensajes no leídos
-        try:
-            participante = ChatParticipant.objects.get(
-                configuracion_ruta=ruta,
-                usuario=request.user
-            )
-            mensajes_no_leidos = participante.get_mensajes_no_leidos()
-        except ChatParticipant.DoesNotExist:
-            mensajes_no_leidos = 0
+        mensajes_no_leidos = ChatParticipant.con_no_leidos(request.user).filter(
+            configuracion_ruta=ruta
+        ).values_list('no_leidos', flat=True).first() or 0
         
         return JsonResponse({
             'success': True,
@@ -1793,6 +1759,112 @@ def verificar_mensajes_nuevos(request):
     except Exception as e:
         return JsonResponse({'error': f'Error al verificar mensajes: {str(e)}'}, status=500)
 
+@login_required
+def chat_stream(request, ruta_id):
+    """
+    Mensajes nuevos (evento "mensaje") y recibos de lectura (evento "lectura")
+    del chat de una ruta por Server-Sent Events.
+
+    El acceso se verifica una sola vez al conectar; después el cliente solo
+    recibe lo que publica el bus de chat (core/utils/chat_pubsub.py), sin
+    consultar la base de datos. Al reconectar, EventSource envía
+    Last-Event-ID y se recuperan los mensajes perdidos con una consulta.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    if request.user.role not in ('staff', 'employee'):
+        return JsonResponse({'error': 'Acceso denegado'}, status=403)
+    
+    ruta = ruta_chat_de_usuario(request.user, ruta_id)
+    if not ruta:
+        return JsonResponse({'error': 'Ruta no encontrada o sin acceso'}, status=404)
+    
+    try:
+        ultimo_id = int(request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('ultimo_id') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'ultimo_id debe ser un entero'}, status=400)
+    
+    from django.db import connection
+    from django.http import StreamingHttpResponse
+    from core.models import ChatMessage
+    from core.utils.chat_pubsub import get_bus_chat
+    
+    usuario = request.user
+    duracion_max = getattr(settings, 'CHAT_SSE_DURACION_MAX', 300)
+    latido = getattr(settings, 'CHAT_SSE_LATIDO', 15)
+    lote_reenvio = 100
+    
+    def evento(mensaje):
+        mensaje = dict(mensaje, es_propio=mensaje['usuario']['id'] == usuario.id)
+        return f"id: {mensaje['id']}\nevent: mensaje\ndata: {json.dumps(mensaje, default=str)}\n\n"
+    
+    def eventos():
+        nonlocal ultimo_id
+        # Suscribirse antes de consultar para no perder lo que llegue entre ambos pasos
+        with get_bus_chat().suscribir(ruta.id) as suscripcion:
+            yield "retry: 3000\n\n"
+            # Recuperar los perdidos en lotes por id hasta agotarlos
+            while ultimo_id:
+                pendientes = list(ChatMessage.objects.filter(
+                    configuracion_ruta_id=ruta.id, id__gt=ultimo_id
+                ).select_related('usuario').order_by('id')[:lote_reenvio])
+                for mensaje in pendientes:
+                    ultimo_id = mensaje.id
+                    yield evento(mensaje.to_dict())
+                if len(pendientes) < lote_reenvio:
+                    break
+            # La conexión puede quedar abierta minutos: no retener una conexión a la BD
+            if not connection.in_atomic_block:
+                connection.close()
+            
+            fin = time.monotonic() + duracion_max
+            while time.monotonic() < fin:
+                mensajes = suscripcion.esperar(timeout=latido)
+                if not mensajes:
+                    yield ": ping\n\n"
+                    continue
+                for mensaje in mensajes:
+                    if mensaje.get('evento') == 'lectura':
+                        yield f"event: lectura\ndata: {json.dumps(mensaje)}\n\n"
+                    elif mensaje['id'] > ultimo_id:
+                        ultimo_id = mensaje['id']
+                        yield evento(mensaje)
+    
+    response = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+def bandeja_chat(request):
+    """Mensajes no leídos de todas las rutas en las que participa el usuario, en una sola consulta"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    from django.db.models import F
+    from core.models import ChatParticipant
+    
+    participaciones = ChatParticipant.con_no_leidos(request.user).values(
+        'configuracion_ruta_id', 'configuracion_ruta__colonia__nombre', 'no_leidos', 'ultimo_mensaje_id'
+    ).order_by(F('ultimo_mensaje_id').desc(nulls_last=True))
+    
+    rutas = [
+        {
+            'ruta_id': p['configuracion_ruta_id'],
+            'colonia_nombre': p['configuracion_ruta__colonia__nombre'],
+            'no_leidos': p['no_leidos'],
+            'ultimo_mensaje_id': p['ultimo_mensaje_id']
+        }
+        for p in participaciones
+    ]
+    
+    return JsonResponse({
+        'success': True,
+        'rutas': rutas,
+        'total_no_leidos': sum(r['no_leidos'] for r in rutas),
+        'rutas_con_no_leidos': sum(1 for r in rutas if r['no_leidos'] > 0)
+    })
+
 @login_required
 def chat_dashboard(request):
     """Dashboard de chats para el staff"""
@@ -1805,35 +1877,25 @@ def chat_dashboard(request):
     # Obtener todas las rutas creadas por el staff actual
     rutas_con_chat = ConfiguracionRuta.objects.filter(
         creado_por=request.user
-    ).select_related('colonia').prefetch_related('empleados_asignados', 'participantes_chat').annotate(
+    ).select_related('colonia').prefetch_related('empleados_asignados').annotate(
         total_mensajes=Count('mensajes_chat'),
-        ultimo_mensaje=Max('mensajes_chat__timestamp')
-    ).order_by('-ultimo_mensaje', '-fecha_creacion')
+        ultimo_mensaje=Max('mensajes_chat__timestamp'),
+        ultimo_mensaje_id=Max('mensajes_chat__id')
+    ).defer('mapa_calculado', 'mapa_html', 'datos_ruta').order_by('-ultimo_mensaje', '-fecha_creacion')
     
     # Debug: Mostrar información sobre las rutas encontradas
     print(f"🔍 Usuario staff: {request.user.username}")
-    print(f"🔍 Rutas encontradas: {rutas_con_chat.count()}")
+    print(f"🔍 Rutas encontradas: {len(rutas_con_chat)}")
+    
+    # No leídos de todas las rutas y últimos mensajes: una consulta cada uno, no una por ruta
+    no_leidos = dict(ChatParticipant.con_no_leidos(request.user).values_list('configuracion_ruta_id', 'no_leidos'))
+    ultimos_mensajes = ChatMessage.objects.select_related('usuario').in_bulk(
+        [ruta.ultimo_mensaje_id for ruta in rutas_con_chat if ruta.ultimo_mensaje_id]
+    )
     
     # Preparar datos de chat para cada ruta
     chats_data = []
     for ruta in rutas_con_chat:
-        print(f"🔍 Procesando ruta: {ruta.id} - {ruta.colonia.nombre}")
-        
-        # Obtener último mensaje
-        ultimo_mensaje = ChatMessage.objects.filter(
-            configuracion_ruta=ruta
-        ).select_related('usuario').order_by('-timestamp').first()
-        
-        # Obtener participante del staff para contar mensajes no leídos
-        try:
-            participante_staff = ChatParticipant.objects.get(
-                configuracion_ruta=ruta,
-                usuario=request.user
-            )
-            mensajes_no_leidos = participante_staff.get_mensajes_no_leidos()
-        except ChatParticipant.DoesNotExist:
-            mensajes_no_leidos = 0
-        
         # Obtener información de empleados
         empleados_info = [
             {
@@ -1847,10 +1909,10 @@ def chat_dashboard(request):
             'ruta': ruta,
             'colonia_nombre': ruta.colonia.nombre,
             'empleados': empleados_info,
-            'empleados_count': ruta.empleados_asignados.count(),
+            'empleados_count': len(empleados_info),
             'total_mensajes': ruta.total_mensajes,
-            'mensajes_no_leidos': mensajes_no_leidos,
-            'ultimo_mensaje': ultimo_mensaje,
+            'mensajes_no_leidos': no_leidos.get(ruta.id, 0),
+            'ultimo_mensaje': ultimos_mensajes.get(ruta.ultimo_mensaje_id),
             'estado': ruta.estado,
             'fecha_creacion': ruta.fecha_creacion,
             'chat_id': ruta.chat_asignado
@@ -1903,6 +1965,11 @@ def analizar_algoritmo(request):
             colonia_id = data.get('colonia_id')
             num_empleados = int(data.get('num_empleados', 2))
             algoritmo_tipo = data.get('algoritmo_tipo', 'current')
+            silhouette_estrategia = data.get('silhouette_estrategia')  # None = la de settings
+            
+            from core.utils.metricas_zonas import ESTRATEGIAS_SILHOUETTE
+            if silhouette_estrategia and silhouette_estrategia not in ESTRATEGIAS_SILHOUETTE:
+                return JsonResponse({'error': f'Estrategia de silhouette inválida. Opciones: {", ".join(ESTRATEGIAS_SILHOUETTE)}'}, status=400)
             
             if not colonia_id:
                 return JsonResponse({'error': 'ID de colonia requerido'}, status=400)
@@ -1921,7 +1988,8 @@ def analizar_algoritmo(request):
             tiempo_inicial = time.time()
             
             # Importar la función real de procesamiento
-            
+            from core.utils.main import procesar_poligono_completo
+            import psutil
             
             # Obtener métricas de memoria inicial
             proceso = psutil.Process(os.getpid())
@@ -1935,7 +2003,8 @@ def analizar_algoritmo(request):
                 print(f"🆔 Usando colonia de la base de datos con ID: {colonia_id}")
                 
                 # Ejecutar el algoritmo real usando datos de la base de datos
-                resultado_algoritmo = procesar_poligono_completo(colonia_id, num_empleados, algoritmo_tipo)
+                resultado_algoritmo = procesar_poligono_completo(colonia_id, num_empleados, algoritmo_tipo,
+                                                                 silhouette_estrategia=silhouette_estrategia)
                 
                 print(f"✅ API ANALIZAR_ALGORITMO: Algoritmo ejecutado exitosamente")
                 
@@ -1947,48 +2016,32 @@ def analizar_algoritmo(request):
                 
                 print(f"⏱️ API ANALIZAR_ALGORITMO: Tiempo={tiempo_ejecucion}s, Memoria={memoria_usada}MB")
                 
-                # Calcular métricas de calidad basadas en datos reales
-                nodos_z1 = resultado_algoritmo['nodos']['zona1']
-                nodos_z2 = resultado_algoritmo['nodos']['zona2']
+                # Calcular métricas de calidad basadas en datos reales (una entrada por zona)
+                zonas = resultado_algoritmo['zonas']
+                nodos_zonas = [zona['nodos'] for zona in zonas]
+                longitudes_zonas = [zona['longitud_m'] for zona in zonas]
+                areas_zonas = [zona['area_m2'] for zona in zonas]
                 total_nodos = resultado_algoritmo['nodos']['total']
                 
-                print(f"📈 API ANALIZAR_ALGORITMO: Nodos zona1={nodos_z1}, zona2={nodos_z2}, total={total_nodos}")
+                print(f"📈 API ANALIZAR_ALGORITMO: Nodos por zona={nodos_zonas}, total={total_nodos}")
                 
+                # Las columnas del modelo guardan las dos primeras zonas
+                nodos_z1 = resultado_algoritmo['nodos']['zona1']
+                nodos_z2 = resultado_algoritmo['nodos']['zona2']
                 longitud_z1 = resultado_algoritmo['longitudes']['zona1_m']
                 longitud_z2 = resultado_algoritmo['longitudes']['zona2_m']
-                
                 area_z1 = resultado_algoritmo['areas']['zona1_m2']
                 area_z2 = resultado_algoritmo['areas']['zona2_m2']
-                
-                # Calcular balance de zonas (qué tan equilibradas están)
-                if num_empleados == 1:
-                    balance_zonas = 100.0  # Perfecto para un empleado
-                else: #####################################################################calculo para el score
-                    diferencia_nodos = abs(nodos_z1 - nodos_z2)
-                    balance_zonas = max(0, 100 - (diferencia_nodos / total_nodos * 100)) if total_nodos > 0 else 0
-                
-                # Calcular eficiencia de rutas (densidad de calles vs área)##########################
                 dens_calles_z1 = resultado_algoritmo['densidades']['calles_m_por_km2_z1']
                 dens_calles_z2 = resultado_algoritmo['densidades']['calles_m_por_km2_z2']
-                eficiencia_promedio = (dens_calles_z1 + dens_calles_z2) / 2 if num_empleados > 1 else dens_calles_z1
-                eficiencia_rutas = min(100, max(0, eficiencia_promedio / 1000))  # Normalizar a 0-100
                 
-                # Calcular equidad de cargas (equilibrio de longitudes)
-                if num_empleados == 1:
-                    equidad_cargas = 100.0
-                else:
-                    total_longitud = longitud_z1 + longitud_z2
-                    diferencia_longitud = abs(longitud_z1 - longitud_z2)
-                    equidad_cargas = max(0, 100 - (diferencia_longitud / total_longitud * 100)) if total_longitud > 0 else 0
-                
-                # Calcular compacidad (relación área vs perímetro simulado)
-                if num_empleados == 1:
-                    compacidad = 85.0  # Valor base para zona única
-                else:
-                    # Estimar compacidad basada en la relación área/densidad
-                    compacidad_z1 = min(100, area_z1 / 100000) if area_z1 > 0 else 0  # Normalizar
-                    compacidad_z2 = min(100, area_z2 / 100000) if area_z2 > 0 else 0
-                    compacidad = (compacidad_z1 + compacidad_z2) / 2
+                # Calcular balance, eficiencia, equidad y compacidad de las zonas
+                from core.utils.metricas_zonas import calcular_scores_calidad
+                scores = calcular_scores_calidad(zonas, total_nodos)
+                balance_zonas = scores['balance_zonas']
+                eficiencia_rutas = scores['eficiencia_rutas']
+                equidad_cargas = scores['equidad_cargas']
+                compacidad = scores['compacidad']
                 
                 # Obtener Silhouette Score del resultado del algoritmo
                 silhouette_score = resultado_algoritmo.get('silhouette_score', 0.0)
@@ -1997,43 +2050,23 @@ def analizar_algoritmo(request):
                 
                 # Generar datos reales de las zonas ANTES de guardar
                 zonas_data = []
-                if num_empleados == 1:
+                for zona in zonas:
+                    dens_calles = zona['densidad_calles_m_km2']
                     zonas_data.append({
-                        'zona': 1,
-                        'area_km2': round(area_z1 / 1000000, 2),  # Convertir m² a km²
-                        'puntos_asignados': nodos_z1,
-                        'longitud_calles_m': round(longitud_z1, 2),
-                        'densidad_nodos': round(resultado_algoritmo['densidades']['nodos_por_km2_z1'], 2),
-                        'tiempo_estimado': round(longitud_z1 / 1000 * 0.1, 1),  # Estimar tiempo basado en longitud
-                        'dificultad': 'Media' if dens_calles_z1 > 500 else 'Baja'
+                        'zona': zona['zona'],
+                        'area_km2': round(zona['area_m2'] / 1000000, 2),  # Convertir m² a km²
+                        'puntos_asignados': zona['nodos'],
+                        'longitud_calles_m': round(zona['longitud_m'], 2),
+                        'densidad_nodos': round(zona['densidad_nodos_km2'], 2),
+                        'tiempo_estimado': round(zona['longitud_m'] / 1000 * 0.1, 1),  # Estimar tiempo basado en longitud
+                        'dificultad': 'Alta' if dens_calles > 1000 else 'Media' if dens_calles > 500 else 'Baja'
                     })
-                else:
-                    zonas_data.extend([
-                        {
-                            'zona': 1,
-                            'area_km2': round(area_z1 / 1000000, 2),
-                            'puntos_asignados': nodos_z1,
-                            'longitud_calles_m': round(longitud_z1, 2),
-                            'densidad_nodos': round(resultado_algoritmo['densidades']['nodos_por_km2_z1'], 2),
-                            'tiempo_estimado': round(longitud_z1 / 1000 * 0.1, 1),
-                            'dificultad': 'Alta' if dens_calles_z1 > 1000 else 'Media' if dens_calles_z1 > 500 else 'Baja'
-                        },
-                        {
-                            'zona': 2,
-                            'area_km2': round(area_z2 / 1000000, 2),
-                            'puntos_asignados': nodos_z2,
-                            'longitud_calles_m': round(longitud_z2, 2),
-                            'densidad_nodos': round(resultado_algoritmo['densidades']['nodos_por_km2_z2'], 2),
-                            'tiempo_estimado': round(longitud_z2 / 1000 * 0.1, 1),
-                            'dificultad': 'Alta' if dens_calles_z2 > 1000 else 'Media' if dens_calles_z2 > 500 else 'Baja'
-                        }
-                    ])
                 
                 # Guardar métricas reales en el modelo EficienciaAlgoritmica
                 try:
                     # Calcular valores totales
-                    area_total = area_z1 + area_z2
-                    longitud_total = longitud_z1 + longitud_z2
+                    area_total = sum(areas_zonas)
+                    longitud_total = sum(longitudes_zonas)
                     total_aristas = len(resultado_algoritmo.get('graph', {}).edges()) if resultado_algoritmo.get('graph') else 0
                     
                     eficiencia_obj = EficienciaAlgoritmica.objects.create(
@@ -2071,7 +2104,8 @@ def analizar_algoritmo(request):
                             'timestamp': tiempo_inicial,
                             'memoria_inicial_mb': memoria_inicial,
                             'memoria_final_mb': memoria_final,
-                            'proceso_id': os.getpid()
+                            'proceso_id': os.getpid(),
+                            'silhouette': resultado_algoritmo.get('silhouette')
                         },
                         notas=f"Análisis ejecutado por {request.user.username}",
                         colonia=colonia,
@@ -2201,6 +2235,82 @@ def analizar_algoritmo(request):
     
     return JsonResponse({'error': 'Método no permitido'}, status=405)
 
+@login_required
+@csrf_exempt
+def benchmark_algoritmos(request):
+    """
+    API para medir todos los algoritmos de división sobre una colonia.
+    
+    El grafo se construye una vez y cada algoritmo corre en un pool de procesos
+    con mediciones aisladas; se responde con el id del trabajo y los resultados
+    se guardan en EficienciaAlgoritmica al terminar.
+    """
+    if request.user.role != 'researcher':
+        return JsonResponse({'error': 'Acceso denegado'}, status=403)
+    
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    
+    try:
+        data = json.loads(request.body or b'{}')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Formato JSON inválido'}, status=400)
+    
+    from core.models import EficienciaAlgoritmica, TrabajoProcesamiento
+    from core.utils.trabajos import encolar_trabajo
+    
+    colonia_id = data.get('colonia_id')
+    if not colonia_id:
+        return JsonResponse({'error': 'ID de colonia requerido'}, status=400)
+    
+    try:
+        colonia = ColoniaProcesada.objects.get(id=colonia_id)
+    except ColoniaProcesada.DoesNotExist:
+        return JsonResponse({'error': 'Colonia no encontrada'}, status=404)
+    
+    algoritmos_validos = [clave for clave, _ in EficienciaAlgoritmica.ALGORITMO_CHOICES]
+    algoritmos = data.get('algoritmos') or algoritmos_validos
+    invalidos = [a for a in algoritmos if a not in algoritmos_validos]
+    if invalidos:
+        return JsonResponse({'error': f'Algoritmos inválidos: {", ".join(invalidos)}'}, status=400)
+    
+    try:
+        num_empleados = int(data.get('num_empleados', 2))
+        repeticiones = min(max(int(data.get('repeticiones', 5)), 1), 50)
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'num_empleados y repeticiones deben ser enteros'}, status=400)
+    
+    if not 1 <= num_empleados <= ConfiguracionRuta.MAX_EMPLEADOS:
+        return JsonResponse({'error': f'num_empleados debe estar entre 1 y {ConfiguracionRuta.MAX_EMPLEADOS}'}, status=400)
+    
+    from core.utils.metricas_zonas import ESTRATEGIAS_SILHOUETTE
+    if data.get('silhouette_estrategia') and data['silhouette_estrategia'] not in ESTRATEGIAS_SILHOUETTE:
+        return JsonResponse({'error': f'Estrategia de silhouette inválida. Opciones: {", ".join(ESTRATEGIAS_SILHOUETTE)}'}, status=400)
+    
+    trabajo = TrabajoProcesamiento.objects.create(
+        tipo='benchmark',
+        colonia=colonia,
+        parametros={
+            'num_empleados': num_empleados,
+            'algoritmos': algoritmos,
+            'repeticiones': repeticiones,
+            'silhouette_estrategia': data.get('silhouette_estrategia')
+        },
+        creado_por=request.user
+    )
+    encolar_trabajo(trabajo)
+    
+    print(f"🏁 BENCHMARK: trabajo {trabajo.id} para colonia {colonia.nombre}, {len(algoritmos)} algoritmos x {repeticiones} repeticiones")
+    
+    return JsonResponse({
+        'success': True,
+        'job_id': trabajo.id,
+        'job_url': f'/accounts/trabajos/{trabajo.id}/',
+        'algoritmos': algoritmos,
+        'repeticiones': repeticiones
+    }, status=202)
+
+
 ### comparacion de algoritmos 
 @login_required
 @csrf_exempt
@@ -2472,6 +2582,11 @@ def visualizar_ruta(request):
             colonia_id = data.get('colonia_id')
             algoritmo = data.get('algoritmo', 'kernighan_lin')
             num_empleados = data.get('num_empleados', 2)
+            silhouette_estrategia = data.get('silhouette_estrategia')  # None = la de settings
+            
+            from core.utils.metricas_zonas import ESTRATEGIAS_SILHOUETTE
+            if silhouette_estrategia and silhouette_estrategia not in ESTRATEGIAS_SILHOUETTE:
+                return JsonResponse({'error': f'Estrategia de silhouette inválida. Opciones: {", ".join(ESTRATEGIAS_SILHOUETTE)}'}, status=400)
             
             if not colonia_id:
                 return JsonResponse({'error': 'ID de colonia requerido'}, status=400)
@@ -2491,7 +2606,8 @@ def visualizar_ruta(request):
             resultado = procesar_poligono_completo(
                 colonia_id=int(colonia_id),
                 num_employees=int(num_empleados),
-                algorithm=algoritmo
+                algorithm=algoritmo,
+                silhouette_estrategia=silhouette_estrategia
             )
             
             # Medir tiempo y memoria de fin
@@ -2509,43 +2625,44 @@ def visualizar_ruta(request):
             areas = resultado.get('areas', {})
             silhouette_score = resultado.get('silhouette_score', 0.0)
             
+            zonas = resultado.get('zonas', [])
+            
+            def ratio_min_max(valores):
+                """Relación (%) entre la zona más chica y la más grande"""
+                return round((min(valores) / max(valores)) * 100, 2) if valores and max(valores) > 0 else 0
+            
             # Calcular balance de zonas
             total_nodos = nodos.get('total', 0)
             nodos_z1 = nodos.get('zona1', 0)
             nodos_z2 = nodos.get('zona2', 0)
-            balance_zonas = round((min(nodos_z1, nodos_z2) / max(nodos_z1, nodos_z2)) * 100, 2) if max(nodos_z1, nodos_z2) > 0 else 0
+            balance_zonas = ratio_min_max([zona['nodos'] for zona in zonas])
             
             # Calcular eficiencia de rutas (basado en distribución de longitudes)
             long_z1 = longitudes.get('zona1_m', 0)
             long_z2 = longitudes.get('zona2_m', 0)
-            total_long = long_z1 + long_z2
-            eficiencia_rutas = round((min(long_z1, long_z2) / max(long_z1, long_z2)) * 100, 2) if max(long_z1, long_z2) > 0 else 0
+            total_long = sum(zona['longitud_m'] for zona in zonas)
+            eficiencia_rutas = ratio_min_max([zona['longitud_m'] for zona in zonas])
             
             # Calcular equidad de cargas (basado en áreas)
             area_z1 = areas.get('zona1_m2', 0)
             area_z2 = areas.get('zona2_m2', 0)
-            total_area = area_z1 + area_z2
-            equidad_cargas = round((min(area_z1, area_z2) / max(area_z1, area_z2)) * 100, 2) if max(area_z1, area_z2) > 0 else 0
+            total_area = sum(zona['area_m2'] for zona in zonas)
+            equidad_cargas = ratio_min_max([zona['area_m2'] for zona in zonas])
             
             # Calcular compacidad (basado en densidad de nodos)
             dens_nodos_z1 = resultado.get('densidades', {}).get('nodos_por_km2_z1', 0)
             dens_nodos_z2 = resultado.get('densidades', {}).get('nodos_por_km2_z2', 0)
-            compacidad = round((min(dens_nodos_z1, dens_nodos_z2) / max(dens_nodos_z1, dens_nodos_z2)) * 100, 2) if max(dens_nodos_z1, dens_nodos_z2) > 0 else 0
+            compacidad = ratio_min_max([zona['densidad_nodos_km2'] for zona in zonas])
             
             # Preparar datos de zonas
             zonas_data = {
-                'zona1': {
-                    'nodos': nodos_z1,
-                    'area_m2': area_z1,
-                    'longitud_m': long_z1,
-                    'densidad_nodos_km2': dens_nodos_z1
-                },
-                'zona2': {
-                    'nodos': nodos_z2,
-                    'area_m2': area_z2,
-                    'longitud_m': long_z2,
-                    'densidad_nodos_km2': dens_nodos_z2
+                f"zona{zona['zona']}": {
+                    'nodos': zona['nodos'],
+                    'area_m2': zona['area_m2'],
+                    'longitud_m': zona['longitud_m'],
+                    'densidad_nodos_km2': zona['densidad_nodos_km2']
                 }
+                for zona in zonas
             }
             
             # Guardar métricas en la base de datos
@@ -2585,7 +2702,8 @@ def visualizar_ruta(request):
                     metadatos_ejecucion={
                         'fecha_ejecucion': time.strftime('%Y-%m-%d %H:%M:%S'),
                         'usuario': request.user.username,
-                        'tipo_ejecucion': 'visualizacion_researcher'
+                        'tipo_ejecucion': 'visualizacion_researcher',
+                        'silhouette': resultado.get('silhouette')
                     },
                     notas=f"Ejecución desde gestión de algoritmos - {algoritmo}"
                 )
@@ -2597,8 +2715,7 @@ def visualizar_ruta(request):
             
             # Extraer datos del mapa para renderizar en frontend
             G = resultado.get('graph')
-            part1 = resultado.get('part1_nodes', set())
-            part2 = resultado.get('part2_nodes', set())
+            partes = resultado.get('partes', [])
             
             # Obtener centro del mapa
             if G and len(G.nodes()) > 0:
@@ -2608,23 +2725,15 @@ def visualizar_ruta(request):
             else:
                 center_lat, center_lon = 19.4326, -99.1332  # Default CDMX
             
-            # Preparar datos de rutas
-            rutas_data = {
-                'zona1': [],  # Roja
-                'zona2': []   # Azul
-            }
-            
-            if G:
-                for u, v, data in G.edges(data=True):
-                    if 'geometry' in data:
-                        coords = [[pt[1], pt[0]] for pt in data['geometry'].coords]
-                    else:
-                        coords = [[G.nodes[u]['y'], G.nodes[u]['x']], [G.nodes[v]['y'], G.nodes[v]['x']]]
-                    
-                    if u in part1 and v in part1:
-                        rutas_data['zona1'].append(coords)
-                    elif u in part2 and v in part2:
-                        rutas_data['zona2'].append(coords)
+            # Preparar datos de rutas (zona1 roja, zona2 azul, ... según COLORES_ZONAS) a partir
+            # de las líneas por zona que ya calculó el pipeline ([lon, lat] -> [lat, lon])
+            rutas_data = {f'zona{i + 1}': [] for i in range(len(partes))}
+            for feature in resultado.get('geojson', {}).get('features', []):
+                zona = feature['properties'].get('zona')
+                if zona and f'zona{zona}' in rutas_data:
+                    rutas_data[f'zona{zona}'] = [
+                        [[lat, lon] for lon, lat in linea] for linea in feature['geometry']['coordinates']
+                    ]
             
             return JsonResponse({
                 'success': True,
@@ -3234,76 +3343,116 @@ def obtener_rutas_empleado(request):
 
 @login_required
 def obtener_rutas_staff_supervision(request):
-    """API para obtener todas las rutas para supervisión del staff"""
+    """
+    API para obtener todas las rutas para supervisión del staff.
+
+    Paginada por cursor (orden fecha_creacion, id descendente): ?limite=N y
+    ?cursor=<siguiente_cursor de la página anterior>. Cada página se arma con
+    un número fijo de consultas sin importar cuántas configuraciones o
+    empleados tenga: configuraciones (con colonia y conteo de completadas),
+    empleados asignados y rutas completadas.
+    """
     if request.user.role != 'staff':
         return JsonResponse({'error': 'Acceso denegado'}, status=403)
     
     try:
+        from django.db.models import Count, Prefetch, Q
+        from django.db.models.fields.json import KeyTransform
+        from django.utils.dateparse import parse_datetime
         from core.models import ConfiguracionRuta, RutaCompletada
         from accounts.models import User
+        from core.utils.json_streaming import StreamingJsonResponse
+        from core.utils.paginacion import codificar_cursor, decodificar_cursor, leer_limite
+        
+        try:
+            limite = leer_limite(request.GET.get('limite'))
+            cursor = request.GET.get('cursor')
+            if cursor:
+                fecha_cursor, id_cursor = decodificar_cursor(cursor, 2)
+                fecha_cursor = parse_datetime(fecha_cursor)
+                if fecha_cursor is None or not isinstance(id_cursor, int):
+                    raise ValueError('Cursor inválido')
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
+        # Solo las columnas que se muestran; de mapa_calculado solo 'rutas' (sin la geometría)
+        configuraciones = (ConfiguracionRuta.objects
+                           .select_related('colonia')
+                           .only('id', 'fecha_creacion', 'algoritmo_usado', 'colonia', 'colonia__nombre')
+                           .annotate(rutas_mapa=KeyTransform('rutas', 'mapa_calculado'),
+                                     empleados_completados=Count('completadas__empleado', distinct=True))
+                           .prefetch_related(
+                               Prefetch('empleados_asignados',
+                                        queryset=User.objects.only('id', 'username'),
+                                        to_attr='empleados_supervision'),
+                               Prefetch('completadas',
+                                        queryset=RutaCompletada.objects.only(
+                                            'id', 'configuracion_ruta', 'empleado', 'tiempo_real_minutos',
+                                            'eficiencia_porcentaje', 'fecha_fin').order_by('-fecha_fin'),
+                                        to_attr='completadas_supervision'))
+                           .order_by('-fecha_creacion', '-id'))
         
         # Obtener configuracion_id del query parameter si se proporciona
         configuracion_id = request.GET.get('configuracion_id')
-        
         if configuracion_id:
             # Filtrar por configuración específica
-            try:
-                configuraciones = [ConfiguracionRuta.objects.get(id=configuracion_id)]
-            except ConfiguracionRuta.DoesNotExist:
-                return JsonResponse({'error': 'Configuración de ruta no encontrada'}, status=404)
-        else:
-            # Obtener todas las configuraciones de rutas
-            configuraciones = ConfiguracionRuta.objects.all().order_by('-fecha_creacion')
+            configuraciones = configuraciones.filter(id=configuracion_id)
+        elif cursor:
+            configuraciones = configuraciones.filter(
+                Q(fecha_creacion__lt=fecha_cursor) | Q(fecha_creacion=fecha_cursor, id__lt=id_cursor)
+            )
         
-        rutas_data = []
-        for config in configuraciones:
-            # Obtener empleados asignados
-            empleados_asignados = []
+        pagina = list(configuraciones[:limite + 1])
+        if configuracion_id and not pagina:
+            return JsonResponse({'error': 'Configuración de ruta no encontrada'}, status=404)
+        hay_mas = len(pagina) > limite
+        pagina = pagina[:limite]
+        siguiente_cursor = codificar_cursor(pagina[-1].fecha_creacion, pagina[-1].id) if hay_mas else None
+        
+        def empleados_de_configuracion(config):
+            # Ruta completada más reciente de cada empleado (ya vienen ordenadas por fecha_fin)
+            completadas = {}
+            for completada in config.completadas_supervision:
+                completadas.setdefault(completada.empleado_id, completada)
+            info_por_empleado = {r.get('empleado_id'): r for r in (config.rutas_mapa or [])}
             
-            # Obtener empleados desde la relación ManyToMany
-            for empleado in config.empleados_asignados.all():
-                completada = RutaCompletada.objects.filter(
-                    configuracion_ruta=config,
-                    empleado=empleado
-                ).first()
-                
-                # Obtener información de la ruta desde mapa_calculado
-                distancia_km = 0
-                num_nodos = 0
-                tiempo_estimado = 0
-                
-                if config.mapa_calculado and 'rutas' in config.mapa_calculado:
-                    for ruta_info in config.mapa_calculado['rutas']:
-                        if ruta_info.get('empleado_id') == empleado.id:
-                            distancia_km = ruta_info.get('distancia_km', 0)
-                            num_nodos = ruta_info.get('num_nodos', 0)
-                            tiempo_estimado = ruta_info.get('tiempo_estimado', 0)
-                            break
+            empleados_asignados = []
+            for empleado in config.empleados_supervision:
+                completada = completadas.get(empleado.id)
                 
+                # Información de la ruta desde mapa_calculado (claves actuales y anteriores)
+                ruta_info = info_por_empleado.get(empleado.id, {})
                 empleados_asignados.append({
                     'empleado_id': empleado.id,
                     'empleado_nombre': empleado.username,
                     'estado': 'completada' if completada else 'pendiente',
-                    'distancia_km': distancia_km,
-                    'num_nodos': num_nodos,
-                    'tiempo_estimado': tiempo_estimado,
+                    'distancia_km': ruta_info.get('distancia_km', ruta_info.get('distancia', 0)),
+                    'num_nodos': ruta_info.get('num_nodos', ruta_info.get('nodos', 0)),
+                    'tiempo_estimado': ruta_info.get('tiempo_estimado', 0),
                     'tiempo_real': completada.tiempo_real_minutos if completada else None,
                     'eficiencia': completada.eficiencia_porcentaje if completada else None,
                     'fecha_completada': completada.fecha_fin.strftime('%Y-%m-%d %H:%M') if completada else None
                 })
-            
-            if empleados_asignados:
-                rutas_data.append({
-                    'configuracion_id': config.id,
-                    'colonia': config.colonia.nombre,
-                    'fecha_creacion': config.fecha_creacion.strftime('%Y-%m-%d %H:%M'),
-                    'algoritmo': getattr(config, 'algoritmo_usado', 'kernighan_lin'),
-                    'empleados': empleados_asignados
-                })
+            return empleados_asignados
+        
+        def rutas_data():
+            for config in pagina:
+                empleados_asignados = empleados_de_configuracion(config)
+                if empleados_asignados:
+                    yield {
+                        'configuracion_id': config.id,
+                        'colonia': config.colonia.nombre,
+                        'fecha_creacion': config.fecha_creacion.strftime('%Y-%m-%d %H:%M'),
+                        'algoritmo': config.algoritmo_usado or 'kernighan_lin',
+                        'empleados_completados': config.empleados_completados,
+                        'empleados': empleados_asignados
+                    }
         
-        return JsonResponse({
+        return StreamingJsonResponse({
             'success': True,
-            'rutas': rutas_data
+            'limite': limite,
+            'siguiente_cursor': siguiente_cursor,
+            'rutas': rutas_data()
         })
         
     except Exception as e:
@@ -3342,4 +3491,52 @@ def get_all_colonias(request):
         
     except Exception as e:
         print(f"❌ Error obteniendo colonias: {str(e)}")
-        return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
+
+
+@login_required
+def colonias_en_punto(request):
+    """API: colonias que contienen el punto (lat, lon), usando el índice espacial"""
+    try:
+        lat = float(request.GET.get('lat'))
+        lon = float(request.GET.get('lon'))
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Parámetros lat y lon requeridos'}, status=400)
+    
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return JsonResponse({'error': 'Coordenadas fuera de rango'}, status=400)
+    
+    try:
+        from core.utils.indice_colonias import get_indice_colonias
+        colonias = get_indice_colonias().colonias_en_punto(lon, lat)
+        return JsonResponse({
+            'success': True,
+            'lat': lat,
+            'lon': lon,
+            'colonia': colonias[0] if colonias else None,
+            'colonias': colonias
+        })
+    except Exception as e:
+        print(f"❌ Error buscando colonia por punto: {str(e)}")
+        return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
+
+
+@login_required
+def colonias_superpuestas(request, colonia_id):
+    """API: colonias cuyo polígono se superpone con el de la colonia indicada"""
+    if request.user.role not in ['admin', 'staff']:
+        return JsonResponse({'error': 'Acceso denegado'}, status=403)
+    
+    try:
+        from core.utils.indice_colonias import get_indice_colonias
+        superpuestas = get_indice_colonias().colonias_superpuestas_a(colonia_id)
+        if superpuestas is None:
+            return JsonResponse({'error': 'Colonia no encontrada o sin polígono'}, status=404)
+        return JsonResponse({
+            'success': True,
+            'colonia_id': colonia_id,
+            'superpuestas': superpuestas
+        })
+    except Exception as e:
+        print(f"❌ Error buscando colonias superpuestas: {str(e)}")
+        return JsonResponse({'error': f'Error interno: {str(e)}'}, status=500)
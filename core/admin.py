@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ColoniaProcesada, ConfiguracionRuta, ChatMessage, ChatParticipant, EficienciaAlgoritmica
+from .models import ColoniaProcesada, ConfiguracionRuta, ChatMessage, ChatParticipant, EficienciaAlgoritmica, TrabajoProcesamiento
 
 @admin.register(ColoniaProcesada)
 class ColoniaProcesadaAdmin(admin.ModelAdmin):
@@ -107,7 +107,7 @@ class ChatParticipantAdmin(admin.ModelAdmin):
             'fields': ('configuracion_ruta', 'usuario', 'rol_en_chat')
         }),
         ('Estado y Configuración', {
-            'fields': ('ultimo_visto', 'notificaciones_activas')
+            'fields': ('ultimo_visto', 'ultimo_mensaje_leido_id', 'notificaciones_activas')
         }),
     )
     
@@ -207,3 +207,10 @@ class EficienciaAlgoritmicaAdmin(admin.ModelAdmin):
     def get_balance_calificacion(self, obj):
         return obj.get_balance_calificacion()
     get_balance_calificacion.short_description = 'Calificación Balance'
+
+
+@admin.register(TrabajoProcesamiento)
+class TrabajoProcesamientoAdmin(admin.ModelAdmin):
+    list_display = ['id', 'tipo', 'estado', 'progreso', 'colonia', 'configuracion_ruta', 'creado_por', 'fecha_creacion']
+    list_filter = ['tipo', 'estado', 'fecha_creacion']
+    readonly_fields = ['fecha_creacion', 'fecha_inicio', 'fecha_fin']
@@ -0,0 +1,34 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils.osm_local import cargar_extracto, ruta_extracto
+
+
+class Command(BaseCommand):
+    help = 'Carga un extracto regional de OSM (.osm.pbf u .osm) al almacén local para recortar grafos sin Overpass'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta al extracto .osm.pbf u .osm (XML)')
+        parser.add_argument('--db', default=None, help='Archivo SQLite destino (por defecto settings.OSM_EXTRACT_DB)')
+
+    def handle(self, *args, **options):
+        archivo = Path(options['archivo'])
+        if not archivo.exists():
+            raise CommandError(f"No existe el archivo {archivo}")
+        if not (archivo.name.endswith('.osm.pbf') or archivo.name.endswith('.osm')):
+            raise CommandError("El extracto debe ser .osm.pbf u .osm")
+
+        db_path = options['db'] or ruta_extracto()
+        self.stdout.write(f"Cargando {archivo.name} en {db_path}...")
+        inicio = time.perf_counter()
+        try:
+            resumen = cargar_extracto(archivo, db_path)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Extracto cargado en {time.perf_counter() - inicio:.1f}s: "
+            f"{resumen['nodos']} nodos leídos, {resumen['vias']} vías de calles indexadas"
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core.utils.precarga import MODULOS_PESADOS, medir_importacion
+
+
+class Command(BaseCommand):
+    help = 'Mide el costo de importación (tiempo y memoria) de las URLs del proyecto y de cada módulo del stack geo/ML'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modulos', nargs='*', help='Módulos a medir (por defecto el stack geo/ML completo)')
+
+    def handle(self, *args, **options):
+        # routes_project.urls es lo que importa un worker antes de atender su primera petición
+        modulos = options['modulos'] or ['routes_project.urls'] + MODULOS_PESADOS
+
+        self.stdout.write(f"{'Módulo':<40} {'Tiempo (s)':>11} {'RSS (MB)':>10}")
+        for modulo in modulos:
+            medicion = medir_importacion(modulo)
+            if 'error' in medicion:
+                self.stdout.write(self.style.ERROR(f"{modulo:<40} ❌ {medicion['error']}"))
+                continue
+            # ru_maxrss está en KB en Linux
+            self.stdout.write(f"{modulo:<40} {medicion['segundos']:>11.3f} {medicion['rss_kb'] / 1024:>10.1f}")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.utils.trabajos import barrer_trabajos_huerfanos
+
+
+class Command(BaseCommand):
+    help = ('Re-encola o marca como error los trabajos de procesamiento que quedaron sin avance '
+            '(worker reciclado o caído); los re-encolados se ejecutan en este proceso antes de salir')
+
+    def handle(self, *args, **options):
+        re_encolados, fallidos = barrer_trabajos_huerfanos()
+        self.stdout.write(self.style.SUCCESS(f'✅ {re_encolados} trabajo(s) re-encolado(s), {fallidos} marcado(s) como error'))
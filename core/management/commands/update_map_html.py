@@ -1,20 +1,31 @@
 from django.core.management.base import BaseCommand
 from core.models import ConfiguracionRuta
-from core.utils.main import procesar_poligono_completo
-import json
-import os
+from core.utils.geojson_rutas import tiene_geometria
+from core.utils.polilineas import codificar_geojson
+from core.utils.trabajos import calcular_rutas_configuracion
 
 
 class Command(BaseCommand):
-    help = 'Actualiza las rutas existentes con HTML del mapa'
+    help = 'Recalcula las rutas que aún no tienen geometría en mapa_calculado (y codifica las que la tienen como GeoJSON)'
 
     def handle(self, *args, **options):
-        # Obtener rutas sin mapa_html
-        rutas_sin_html = ConfiguracionRuta.objects.filter(mapa_html__isnull=True)
+        rutas = list(ConfiguracionRuta.objects.select_related('colonia'))
+
+        # Rutas con GeoJSON sin codificar: se pasan a polilíneas sin recalcular
+        for ruta in rutas:
+            mapa_calculado = ruta.mapa_calculado or {}
+            if mapa_calculado.get('geojson') and not mapa_calculado.get('geometria'):
+                mapa_calculado['geometria'] = codificar_geojson(mapa_calculado.pop('geojson'))
+                ruta.mapa_calculado = mapa_calculado
+                ruta.save(update_fields=['mapa_calculado'])
+                self.stdout.write(self.style.SUCCESS(f"  ✅ Geometría de la ruta {ruta.id} codificada como polilíneas"))
+
+        # Rutas calculadas antes del GeoJSON compacto (sin geometría en mapa_calculado)
+        rutas_sin_geojson = [ruta for ruta in rutas if not tiene_geometria(ruta.mapa_calculado)]
         
-        self.stdout.write(f"Encontradas {rutas_sin_html.count()} rutas sin HTML del mapa")
+        self.stdout.write(f"Encontradas {len(rutas_sin_geojson)} rutas sin GeoJSON del mapa")
         
-        for ruta in rutas_sin_html:
+        for ruta in rutas_sin_geojson:
             try:
                 self.stdout.write(f"Procesando ruta {ruta.id} - {ruta.colonia.nombre}")
                 
@@ -25,34 +36,10 @@ class Command(BaseCommand):
                     )
                     continue
                 
-                # Crear archivo temporal con el polígono
-                nombre_archivo = f"temp_update_{ruta.id}.json"
-                ruta_temp = os.path.join("core", "polygons", nombre_archivo)
-                
-                with open(ruta_temp, "w", encoding="utf-8") as f:
-                    json.dump(ruta.colonia.poligono_geojson, f)
-                
-                try:
-                    # Procesar con el algoritmo
-                    num_employees = ruta.empleados_asignados.count()
-                    resultado = procesar_poligono_completo(nombre_archivo, num_employees)
-                    
-                    # Actualizar el mapa_html
-                    if 'mapa_html_content' in resultado:
-                        ruta.mapa_html = resultado['mapa_html_content']
-                        ruta.save()
-                        self.stdout.write(
-                            self.style.SUCCESS(f"  ✅ HTML del mapa actualizado para ruta {ruta.id}")
-                        )
-                    else:
-                        self.stdout.write(
-                            self.style.ERROR(f"  ❌ No se pudo generar HTML para ruta {ruta.id}")
-                        )
-                        
-                finally:
-                    # Limpiar archivo temporal
-                    if os.path.exists(ruta_temp):
-                        os.remove(ruta_temp)
+                resumen = calcular_rutas_configuracion(ruta)
+                self.stdout.write(
+                    self.style.SUCCESS(f"  ✅ GeoJSON del mapa actualizado para ruta {ruta.id} ({resumen['num_zonas']} zonas)")
+                )
                         
             except Exception as e:
                 self.stdout.write(
@@ -61,4 +48,4 @@ class Command(BaseCommand):
         
         self.stdout.write(
             self.style.SUCCESS("Proceso de actualización completado")
-        ) 
\ No newline at end of file
+        )
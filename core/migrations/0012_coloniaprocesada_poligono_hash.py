@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+def calcular_hashes(apps, schema_editor):
+    from core.utils.graph_cache import hash_poligono
+    ColoniaProcesada = apps.get_model('core', 'ColoniaProcesada')
+    for colonia in ColoniaProcesada.objects.exclude(poligono_geojson__isnull=True):
+        colonia.poligono_hash = hash_poligono(colonia.poligono_geojson)
+        colonia.save(update_fields=['poligono_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_configuracionruta_algoritmo_usado_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coloniaprocesada',
+            name='poligono_hash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Hash del polígono usado como llave de la caché de grafos', max_length=40),
+        ),
+        migrations.RunPython(calcular_hashes, migrations.RunPython.noop),
+    ]
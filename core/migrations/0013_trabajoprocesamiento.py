@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-17 10:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0012_coloniaprocesada_poligono_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoProcesamiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('calcular_rutas', 'Calcular rutas de configuración')], default='calcular_rutas', max_length=30)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('progreso', models.PositiveSmallIntegerField(default=0, help_text='Avance del trabajo (0-100)')),
+                ('mensaje', models.CharField(blank=True, default='', help_text='Etapa actual del trabajo', max_length=255)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('colonia', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos', to='core.coloniaprocesada')),
+                ('configuracion_ruta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='trabajos', to='core.configuracionruta')),
+                ('creado_por', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trabajos_procesamiento', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Trabajo de Procesamiento',
+                'verbose_name_plural': 'Trabajos de Procesamiento',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_trabajoprocesamiento'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trabajoprocesamiento',
+            name='tipo',
+            field=models.CharField(choices=[('calcular_rutas', 'Calcular rutas de configuración'), ('benchmark', 'Benchmark de algoritmos')], default='calcular_rutas', max_length=30),
+        ),
+    ]
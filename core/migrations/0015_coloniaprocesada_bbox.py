@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+def calcular_bboxes(apps, schema_editor):
+    from core.utils.indice_colonias import bbox_poligono
+    ColoniaProcesada = apps.get_model('core', 'ColoniaProcesada')
+    for colonia in ColoniaProcesada.objects.exclude(poligono_geojson__isnull=True):
+        bbox = bbox_poligono(colonia.poligono_geojson)
+        if bbox is None:
+            continue
+        colonia.bbox_min_lon, colonia.bbox_min_lat, colonia.bbox_max_lon, colonia.bbox_max_lat = bbox
+        colonia.save(update_fields=['bbox_min_lon', 'bbox_min_lat', 'bbox_max_lon', 'bbox_max_lat'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_alter_trabajoprocesamiento_tipo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coloniaprocesada',
+            name='bbox_min_lon',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='coloniaprocesada',
+            name='bbox_min_lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='coloniaprocesada',
+            name='bbox_max_lon',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='coloniaprocesada',
+            name='bbox_max_lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='coloniaprocesada',
+            index=models.Index(fields=['bbox_min_lon', 'bbox_max_lon', 'bbox_min_lat', 'bbox_max_lat'], name='colonia_bbox_idx'),
+        ),
+        migrations.RunPython(calcular_bboxes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_coloniaprocesada_bbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['configuracion_ruta', 'id'], name='chat_ruta_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['configuracion_ruta', 'timestamp'], name='chat_ruta_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 12:00
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def marcas_desde_ultimo_visto(apps, schema_editor):
+    # Marca inicial: último mensaje de la ruta anterior a ultimo_visto, en un solo UPDATE
+    ChatMessage = apps.get_model('core', 'ChatMessage')
+    ChatParticipant = apps.get_model('core', 'ChatParticipant')
+    ultimo_visto = ChatMessage.objects.filter(
+        configuracion_ruta=OuterRef('configuracion_ruta'),
+        timestamp__lte=OuterRef('ultimo_visto'),
+    ).order_by('-id').values('id')[:1]
+    ChatParticipant.objects.update(ultimo_mensaje_leido_id=Coalesce(Subquery(ultimo_visto), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_chatmessage_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatparticipant',
+            name='ultimo_mensaje_leido_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(marcas_desde_ultimo_visto, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_alter_trabajoprocesamiento_tipo_dividir'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoprocesamiento',
+            name='fecha_latido',
+            field=models.DateTimeField(blank=True, help_text='Último avance registrado (para detectar trabajos huérfanos)', null=True),
+        ),
+        migrations.AddField(
+            model_name='trabajoprocesamiento',
+            name='intentos',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Veces que se re-encoló tras quedar sin avance'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.conf import settings
 from .storage import StaticMediaStorage
 import json
@@ -8,6 +10,11 @@ class ColoniaProcesada(models.Model):
     nombre_normalizado = models.CharField(max_length=255, unique=True)
     imagen = models.ImageField(upload_to='colonias/imagenes/', storage=StaticMediaStorage(), null=True, blank=True)
     poligono_geojson = models.JSONField(null=True, blank=True)
+    poligono_hash = models.CharField(max_length=40, blank=True, default='', editable=False, help_text='Hash del polígono usado como llave de la caché de grafos')
+    bbox_min_lon = models.FloatField(null=True, blank=True, editable=False)
+    bbox_min_lat = models.FloatField(null=True, blank=True, editable=False)
+    bbox_max_lon = models.FloatField(null=True, blank=True, editable=False)
+    bbox_max_lat = models.FloatField(null=True, blank=True, editable=False)
     datos_json = models.JSONField(null=True, blank=True)
     configuracion = models.JSONField(null=True, blank=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
@@ -18,6 +25,9 @@ class ColoniaProcesada(models.Model):
         verbose_name = "Colonia Procesada"
         verbose_name_plural = "Colonias Procesadas"
         ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['bbox_min_lon', 'bbox_max_lon', 'bbox_min_lat', 'bbox_max_lat'], name='colonia_bbox_idx'),
+        ]
     
     def __str__(self):
         return f"{self.nombre} - {self.fecha_creacion.strftime('%Y-%m-%d %H:%M')}"
@@ -26,7 +36,32 @@ class ColoniaProcesada(models.Model):
         # Normalizar el nombre para el nombre_normalizado
         if not self.nombre_normalizado:
             self.nombre_normalizado = self.nombre.strip().lower().replace(' ', '_')
+        
+        # Recalcular el hash del polígono e invalidar la caché de grafos si cambió
+        from core.utils.graph_cache import hash_poligono, eliminar_grafo_disco
+        hash_anterior = None
+        if self.pk:
+            hash_anterior = ColoniaProcesada.objects.filter(pk=self.pk).values_list('poligono_hash', flat=True).first()
+        self.poligono_hash = hash_poligono(self.poligono_geojson)
+        
+        # Bounding box persistido para el índice espacial de colonias
+        from core.utils.indice_colonias import bbox_poligono, get_indice_colonias
+        bbox = bbox_poligono(self.poligono_geojson) or (None, None, None, None)
+        self.bbox_min_lon, self.bbox_min_lat, self.bbox_max_lon, self.bbox_max_lat = bbox
+        
         super().save(*args, **kwargs)
+        if hash_anterior and hash_anterior != self.poligono_hash:
+            eliminar_grafo_disco(hash_anterior)
+            from core.utils.graph_cache import get_grafo_lru
+            get_grafo_lru().invalidar_colonia(self.pk)
+        get_indice_colonias().actualizar(self)
+    
+    def get_poligono_hash(self):
+        """Retorna el hash del polígono, calculándolo si aún no se ha guardado"""
+        if not self.poligono_hash and self.poligono_geojson:
+            from core.utils.graph_cache import hash_poligono
+            self.poligono_hash = hash_poligono(self.poligono_geojson)
+        return self.poligono_hash
     
     def get_poligono_coordinates(self):
         """Retorna las coordenadas del polígono en formato Leaflet"""
@@ -47,6 +82,20 @@ class ColoniaProcesada(models.Model):
         return None
 
 
+@receiver(post_delete, sender=ColoniaProcesada)
+def limpiar_caches_colonia(sender, instance, **kwargs):
+    """
+    Al borrar una colonia (también en borrados masivos o en cascada) se
+    eliminan su grafo en disco, sus grafos de la caché LRU del worker y su
+    entrada del índice espacial.
+    """
+    from core.utils.graph_cache import eliminar_grafo_disco, get_grafo_lru
+    from core.utils.indice_colonias import get_indice_colonias
+    eliminar_grafo_disco(instance.poligono_hash)
+    get_grafo_lru().invalidar_colonia(instance.pk)
+    get_indice_colonias().eliminar(instance.pk)
+
+
 class EficienciaAlgoritmica(models.Model):
     """Modelo para almacenar métricas de eficiencia de algoritmos de división"""
     
@@ -214,6 +263,9 @@ class EficienciaAlgoritmica(models.Model):
 
 class ConfiguracionRuta(models.Model):
     """Modelo para guardar las configuraciones de rutas asignadas por el staff"""
+    # Máximo de empleados (zonas) en los que se puede dividir una ruta
+    MAX_EMPLEADOS = 12
+    
     ESTADO_CHOICES = [
         ('pendiente', 'Pendiente'),
         ('activa', 'Activa'),
@@ -229,7 +281,7 @@ class ConfiguracionRuta(models.Model):
     notas = models.TextField(blank=True, null=True)
     datos_ruta = models.JSONField(null=True, blank=True)  # Para guardar información específica de la ruta
     mapa_calculado = models.JSONField(null=True, blank=True)  # Datos del mapa con rutas calculadas
-    mapa_html = models.TextField(null=True, blank=True)  # HTML completo del mapa para renderizar
+    mapa_html = models.TextField(null=True, blank=True)  # HTML del mapa; solo configuraciones anteriores a mapa_calculado['geojson']
     chat_asignado = models.CharField(max_length=255, blank=True, null=True)  # ID o referencia del chat
     tiempo_calculado = models.DurationField(null=True, blank=True)  # Tiempo estimado de la ruta
     algoritmo_usado = models.CharField(max_length=20, choices=EficienciaAlgoritmica.ALGORITMO_CHOICES, default='kernighan_lin', help_text='Algoritmo utilizado para dividir la ruta')
@@ -245,13 +297,29 @@ class ConfiguracionRuta(models.Model):
         empleados_str = ', '.join([emp.username for emp in self.empleados_asignados.all()])
         return f"Ruta en {self.colonia.nombre} - {empleados_str} ({self.estado})"
     
+    @classmethod
+    def visibles_para(cls, usuario):
+        """
+        Configuraciones cuyas rutas (mapa, GeoJSON, tiles) puede ver `usuario`:
+        el staff que las creó, los empleados asignados y los administradores
+        """
+        if not usuario.is_authenticated:
+            return cls.objects.none()
+        if usuario.role == 'admin':
+            return cls.objects.all()
+        if usuario.role == 'staff':
+            return cls.objects.filter(creado_por=usuario)
+        if usuario.role == 'employee':
+            return cls.objects.filter(empleados_asignados=usuario)
+        return cls.objects.none()
+    
     def get_empleados_count(self):
         """Retorna el número de empleados asignados"""
         return self.empleados_asignados.count()
     
     def can_add_employee(self):
-        """Verifica si se puede agregar más empleados (máximo 2)"""
-        return self.empleados_asignados.count() < 2
+        """Verifica si se puede agregar más empleados (máximo MAX_EMPLEADOS)"""
+        return self.empleados_asignados.count() < self.MAX_EMPLEADOS
     
     def get_tiempo_formateado(self):
         """Retorna el tiempo calculado en formato legible"""
@@ -315,10 +383,41 @@ class ChatMessage(models.Model):
         verbose_name = "Mensaje de Chat"
         verbose_name_plural = "Mensajes de Chat"
         ordering = ['timestamp']
+        indexes = [
+            # Paginación por id (historial y stream) y consultas por fecha dentro de una ruta
+            models.Index(fields=['configuracion_ruta', 'id'], name='chat_ruta_id_idx'),
+            models.Index(fields=['configuracion_ruta', 'timestamp'], name='chat_ruta_timestamp_idx'),
+        ]
     
     def __str__(self):
         return f"{self.usuario.username}: {self.contenido[:50]}... ({self.timestamp.strftime('%d/%m %H:%M')})"
-    
+
+    def save(self, *args, **kwargs):
+        es_nuevo = self._state.adding
+        super().save(*args, **kwargs)
+        if es_nuevo:
+            # Empujar el mensaje a los clientes conectados por SSE una vez confirmado
+            from django.db import transaction
+            from core.utils.chat_pubsub import publicar_mensaje
+            transaction.on_commit(lambda: publicar_mensaje(self))
+
+    def to_dict(self, usuario=None):
+        """Representación para el frontend; es_propio se calcula respecto a `usuario`"""
+        return {
+            'id': self.id,
+            'usuario': {
+                'id': self.usuario.id,
+                'username': self.usuario.username,
+                'role': self.usuario.role
+            },
+            'contenido': self.contenido,
+            'timestamp': self.timestamp.isoformat(),
+            'tiempo_relativo': self.get_tiempo_relativo(),
+            'tipo_mensaje': self.tipo_mensaje,
+            'metadatos': self.metadatos,
+            'es_propio': usuario is not None and self.usuario_id == usuario.id
+        }
+
     def get_tiempo_relativo(self):
         """Retorna tiempo relativo del mensaje"""
         from django.utils import timezone
@@ -339,12 +438,22 @@ class ChatMessage(models.Model):
             return self.timestamp.strftime('%d/%m/%Y %H:%M')
     
     def marcar_como_leido(self, usuario):
-        """Marca el mensaje como leído por un usuario específico"""
-        # Para simplicidad, usaremos un enfoque básico
-        # En el futuro se puede crear un modelo ChatMessageRead separado
-        if usuario != self.usuario:  # No marcar nuestros propios mensajes
-            self.es_leido = True
-            self.save()
+        """Marca el mensaje (y todos los anteriores de la ruta) como leído por `usuario`"""
+        # es_leido es global y no distingue participantes; la lectura se guarda
+        # como marca por participante (ChatParticipant.ultimo_mensaje_leido_id)
+        if usuario.id != self.usuario_id:  # No marcar nuestros propios mensajes
+            participante = ChatParticipant.objects.filter(
+                configuracion_ruta_id=self.configuracion_ruta_id, usuario=usuario
+            ).first()
+            if participante:
+                participante.marcar_leidos(self.id)
+    
+    def leido_por(self):
+        """Participantes (sin el autor) cuya marca de lectura ya alcanzó este mensaje"""
+        return ChatParticipant.objects.filter(
+            configuracion_ruta_id=self.configuracion_ruta_id,
+            ultimo_mensaje_leido_id__gte=self.id
+        ).exclude(usuario_id=self.usuario_id).select_related('usuario')
 
 
 class ChatParticipant(models.Model):
@@ -364,6 +473,8 @@ class ChatParticipant(models.Model):
         on_delete=models.CASCADE
     )
     ultimo_visto = models.DateTimeField(auto_now_add=True)
+    # Marca de lectura: todos los mensajes de la ruta con id <= este valor están leídos
+    ultimo_mensaje_leido_id = models.PositiveBigIntegerField(default=0)
     notificaciones_activas = models.BooleanField(default=True)
     rol_en_chat = models.CharField(max_length=20, choices=ROLE_CHOICES)
     
@@ -375,12 +486,53 @@ class ChatParticipant(models.Model):
     def __str__(self):
         return f"{self.usuario.username} en {self.configuracion_ruta.colonia.nombre}"
     
+    @classmethod
+    def con_no_leidos(cls, usuario):
+        """
+        Participaciones de `usuario` anotadas con `no_leidos` y `ultimo_mensaje_id`:
+        una sola consulta agrupada para todas sus rutas en lugar de un COUNT por ruta.
+        """
+        from django.db.models import Count, F, Max, Q
+        return cls.objects.filter(usuario=usuario).annotate(
+            no_leidos=Count(
+                'configuracion_ruta__mensajes_chat',
+                filter=Q(configuracion_ruta__mensajes_chat__id__gt=F('ultimo_mensaje_leido_id'))
+                & ~Q(configuracion_ruta__mensajes_chat__usuario=usuario)
+            ),
+            ultimo_mensaje_id=Max('configuracion_ruta__mensajes_chat__id')
+        )
+    
     def get_mensajes_no_leidos(self):
         """Retorna el número de mensajes no leídos para este participante"""
         return ChatMessage.objects.filter(
-            configuracion_ruta=self.configuracion_ruta,
-            timestamp__gt=self.ultimo_visto
-        ).exclude(usuario=self.usuario).count()
+            configuracion_ruta_id=self.configuracion_ruta_id,
+            id__gt=self.ultimo_mensaje_leido_id
+        ).exclude(usuario_id=self.usuario_id).count()
+    
+    def tiene_no_leidos(self, ultimo_mensaje_id):
+        """Comparación contra el último id de la ruta, sin contar mensajes"""
+        return bool(ultimo_mensaje_id) and ultimo_mensaje_id > self.ultimo_mensaje_leido_id
+    
+    def marcar_leidos(self, hasta_id):
+        """
+        Avanza la marca de lectura hasta `hasta_id` con un solo UPDATE (nunca
+        retrocede). Retorna True si cambió; en ese caso se publica el recibo
+        de lectura a los clientes conectados al chat.
+        """
+        from django.db import transaction
+        from django.utils import timezone
+        from core.utils.chat_pubsub import publicar_lectura
+        
+        ahora = timezone.now()
+        actualizados = ChatParticipant.objects.filter(
+            pk=self.pk, ultimo_mensaje_leido_id__lt=hasta_id
+        ).update(ultimo_mensaje_leido_id=hasta_id, ultimo_visto=ahora)
+        if not actualizados:
+            return False
+        self.ultimo_mensaje_leido_id = hasta_id
+        self.ultimo_visto = ahora
+        transaction.on_commit(lambda: publicar_lectura(self))
+        return True
     
     def actualizar_ultimo_visto(self):
         """Actualiza el timestamp de último visto"""
@@ -559,3 +711,67 @@ class ModeloPrediccionTiempo(models.Model):
         if self.r2_score:
             return round(self.r2_score * 100, 2)
         return 0.0
+
+
+class TrabajoProcesamiento(models.Model):
+    """Trabajo asíncrono de procesamiento de polígonos (división de rutas en segundo plano)"""
+    
+    TIPO_CHOICES = [
+        ('calcular_rutas', 'Calcular rutas de configuración'),
+        ('dividir_poligono', 'Dividir polígono entre empleados'),
+        ('benchmark', 'Benchmark de algoritmos'),
+    ]
+    
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+    
+    tipo = models.CharField(max_length=30, choices=TIPO_CHOICES, default='calcular_rutas')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    progreso = models.PositiveSmallIntegerField(default=0, help_text='Avance del trabajo (0-100)')
+    mensaje = models.CharField(max_length=255, blank=True, default='', help_text='Etapa actual del trabajo')
+    
+    colonia = models.ForeignKey(ColoniaProcesada, on_delete=models.CASCADE, related_name='trabajos')
+    configuracion_ruta = models.ForeignKey(ConfiguracionRuta, on_delete=models.CASCADE, related_name='trabajos', null=True, blank=True)
+    parametros = models.JSONField(default=dict, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, null=True)
+    
+    creado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='trabajos_procesamiento')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(null=True, blank=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    fecha_latido = models.DateTimeField(null=True, blank=True, help_text='Último avance registrado (para detectar trabajos huérfanos)')
+    intentos = models.PositiveSmallIntegerField(default=0, help_text='Veces que se re-encoló tras quedar sin avance')
+    
+    class Meta:
+        verbose_name = "Trabajo de Procesamiento"
+        verbose_name_plural = "Trabajos de Procesamiento"
+        ordering = ['-fecha_creacion']
+    
+    def __str__(self):
+        return f"Trabajo {self.id} ({self.get_tipo_display()}) - {self.get_estado_display()} {self.progreso}%"
+    
+    def esta_terminado(self):
+        """True si el trabajo ya no va a cambiar de estado"""
+        return self.estado in ('completado', 'error')
+    
+    def to_dict(self):
+        """Representación para el endpoint de estado"""
+        return {
+            'job_id': self.id,
+            'tipo': self.tipo,
+            'estado': self.estado,
+            'progreso': self.progreso,
+            'mensaje': self.mensaje,
+            'configuracion_id': self.configuracion_ruta_id,
+            'resultado': self.resultado,
+            'error': self.error,
+            'intentos': self.intentos,
+            'fecha_creacion': self.fecha_creacion.isoformat() if self.fecha_creacion else None,
+            'fecha_inicio': self.fecha_inicio.isoformat() if self.fecha_inicio else None,
+            'fecha_fin': self.fecha_fin.isoformat() if self.fecha_fin else None,
+        }
@@ -1,3 +1,798 @@
-from django.test import TestCase
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import networkx as nx
+import numpy as np
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from core.models import ColoniaProcesada, ConfiguracionRuta, EficienciaAlgoritmica, TrabajoProcesamiento
+from core.utils.benchmark import ejecutar_benchmark, guardar_resultados_benchmark
+from core.utils.graph_arrays import get_graph_arrays
+from core.utils.graph_cache import (
+    cargar_grafo_disco, clave_grafo, eliminar_grafo_disco, get_grafo_lru, guardar_grafo_disco, ruta_grafo_cache,
+)
+from core.utils.indice_colonias import IndiceColonias
+from core.utils.json_streaming import StreamingJsonResponse, _agrupar, iter_json
+from core.utils.main import (
+    _consultar_nominatim, _par_mas_lejano, _probar_variaciones, construir_grafo_calles, split_graph_kernighan_lin,
+    split_graph_random, split_graph_spectral, split_graph_voronoi,
+)
+from core.utils.metricas_zonas import calcular_metricas_zonas, calcular_silhouette, silhouette_muestreo
+from core.utils.nominatim_cache import CacheNominatim, LimitadorTasa, NoEncontradoNominatim, normalizar_consulta
+from core.utils.osm_local import cargar_extracto, cargar_osm_xml, fuente_grafo, grafo_desde_extracto
+from core.utils.polilineas import codificar_geojson, codificar_polilinea, decodificar_geojson, decodificar_polilinea
+from core.utils.trabajos import barrer_trabajos_huerfanos, ejecutar_trabajo
+
+
+def grafo_cuadricula(lado):
+    """Cuadrícula lado x lado con coordenadas x/y como las de OSMnx"""
+    G = nx.grid_2d_graph(lado, lado)
+    for (x, y), datos in G.nodes(data=True):
+        datos['x'] = float(x)
+        datos['y'] = float(y)
+    return G
+
+
+class KernighanLinBalanceTests(SimpleTestCase):
+    """split_graph_kernighan_lin: zonas balanceadas para cualquier k"""
+
+    def setUp(self):
+        self.G = grafo_cuadricula(30)
+
+    def test_tamanos_de_zona_balanceados(self):
+        for k in (3, 5, 7):
+            with self.subTest(k=k):
+                partes = split_graph_kernighan_lin(self.G, k)
+                tamanos = [len(parte) for parte in partes]
+                self.assertEqual(len(partes), k)
+                self.assertEqual(sum(tamanos), self.G.number_of_nodes())
+                self.assertLessEqual(max(tamanos) - min(tamanos), 1)
+
+
+class VoronoiTests(SimpleTestCase):
+    """_par_mas_lejano y split_graph_voronoi"""
+
+    def assertDiametro(self, coords):
+        from scipy.spatial.distance import pdist
+
+        i, j = _par_mas_lejano(coords)
+        self.assertAlmostEqual(np.linalg.norm(coords[i] - coords[j]), pdist(coords).max())
+
+    def test_par_mas_lejano_aleatorio(self):
+        rng = np.random.default_rng(7)
+        for n in (3, 10, 200, 2000):
+            with self.subTest(n=n):
+                self.assertDiametro(rng.normal(size=(n, 2)))
+
+    def test_par_mas_lejano_colineal(self):
+        # Qhull falla con puntos colineales: se usa el eje de mayor extensión
+        rng = np.random.default_rng(7)
+        t = rng.uniform(-5, 5, size=50)
+        for coords in (np.column_stack([t, 2 * t + 1]), np.column_stack([np.full(50, 3.0), t])):
+            with self.subTest(coords=coords[:2].tolist()):
+                self.assertDiametro(coords)
+
+    def test_voronoi_cubre_todos_los_nodos(self):
+        G = grafo_cuadricula(12)
+        for k in (2, 3, 5):
+            with self.subTest(k=k):
+                partes = split_graph_voronoi(G, k)
+                self.assertEqual(len(partes), k)
+                self.assertTrue(all(partes))
+                self.assertEqual(sum(len(parte) for parte in partes), G.number_of_nodes())
+                self.assertEqual(set().union(*partes), set(G.nodes()))
+
+
+class SpectralTests(SimpleTestCase):
+    """split_graph_spectral: zonas que siguen la conectividad del grafo"""
+
+    def setUp(self):
+        # Dos cuadrículas de 6x6 unidas por una sola calle
+        izquierda = grafo_cuadricula(6)
+        derecha = nx.relabel_nodes(grafo_cuadricula(6), lambda nodo: (nodo[0] + 10, nodo[1]))
+        for _, datos in derecha.nodes(data=True):
+            datos['x'] += 10
+        self.G = nx.union(izquierda, derecha)
+        self.G.add_edge((5, 0), (10, 0))
+        nx.set_edge_attributes(self.G, 100.0, 'length')
+
+    def aristas_corte(self, partes):
+        zona = {nodo: i for i, parte in enumerate(partes) for nodo in parte}
+        return sum(1 for u, v in self.G.edges() if zona[u] != zona[v])
+
+    def assertParticion(self, partes, k):
+        self.assertEqual(len(partes), k)
+        self.assertTrue(all(partes))
+        self.assertEqual(sum(len(parte) for parte in partes), self.G.number_of_nodes())
+        self.assertEqual(set().union(*partes), set(self.G.nodes()))
+
+    def test_dos_grupos(self):
+        partes = split_graph_spectral(self.G, 2)
+
+        self.assertParticion(partes, 2)
+        self.assertEqual(self.aristas_corte(partes), 1)
+        self.assertLess(self.aristas_corte(partes), self.aristas_corte(split_graph_random(self.G, 2)))
+
+    def test_respaldo_lobpcg(self):
+        from scipy.sparse.linalg import ArpackNoConvergence, lobpcg
+
+        no_converge = ArpackNoConvergence('sin convergencia', np.empty(0), np.empty((0, 0)))
+        with mock.patch('scipy.sparse.linalg.eigsh', side_effect=no_converge), \
+                mock.patch('scipy.sparse.linalg.lobpcg', wraps=lobpcg) as respaldo:
+            partes = split_graph_spectral(self.G, 3)
+
+        respaldo.assert_called_once()
+        self.assertParticion(partes, 3)
+        self.assertLess(self.aristas_corte(partes), self.aristas_corte(split_graph_random(self.G, 3)))
+
+    def test_nodos_aislados(self):
+        # grado == 0: sin fila en el Laplaciano normalizado, pero deben quedar en alguna zona
+        self.G.add_node('aislado_1', x=20.0, y=20.0)
+        self.G.add_node('aislado_2', x=-5.0, y=-5.0)
+
+        partes = split_graph_spectral(self.G, 2)
+
+        self.assertParticion(partes, 2)
+
+
+class MetricasZonasTests(SimpleTestCase):
+    """calcular_metricas_zonas sobre un grafo con longitudes, áreas y cortes conocidos"""
+
+    def setUp(self):
+        from pyproj import Transformer
+
+        # Nodos definidos en metros sobre UTM 14N (EPSG:32614) y convertidos a lon/lat
+        a_lonlat = Transformer.from_crs('EPSG:32614', 'EPSG:4326', always_xy=True)
+        metros = {
+            # Zona 0: cuadrado de 1 km x 1 km
+            1: (0, 0), 2: (1000, 0), 3: (1000, 1000), 4: (0, 1000),
+            # Zona 1: triángulo rectángulo de catetos 1 km (0.5 km²)
+            5: (2000, 0), 6: (3000, 0), 7: (2000, 1000),
+            # Zona 2: dos nodos (envolvente degenerada)
+            8: (4000, 0), 9: (5000, 0),
+        }
+        self.G = nx.Graph()
+        for nodo, (x, y) in metros.items():
+            lon, lat = a_lonlat.transform(500000 + x, 2150000 + y)
+            self.G.add_node(nodo, x=lon, y=lat)
+        self.G.add_edges_from([(1, 2), (2, 3), (3, 4), (4, 1)], length=1000.0)
+        self.G.add_edges_from([(5, 6), (5, 7)], length=1000.0)
+        self.G.add_edge(6, 7, length=1414.0)
+        self.G.add_edge(8, 9, length=1000.0)
+        # Aristas de corte: 0-1, 1-2 y 0-2
+        self.G.add_edge(2, 5, length=1000.0)
+        self.G.add_edge(6, 8, length=1000.0)
+        self.G.add_edge(3, 9, length=4123.0)
+        self.partes = [{1, 2, 3, 4}, {5, 6, 7}, {8, 9}]
+
+    def test_metricas_conocidas(self):
+        metricas = calcular_metricas_zonas(get_graph_arrays(self.G), self.partes)
+        zonas = metricas['zonas']
+
+        self.assertEqual(metricas['epsg'], 32614)
+        self.assertEqual(metricas['aristas_corte'], 3)
+        self.assertAlmostEqual(metricas['longitud_corte_m'], 6123.0)
+
+        self.assertEqual([z['nodos'] for z in zonas], [4, 3, 2])
+        self.assertEqual([z['longitud_m'] for z in zonas], [4000.0, 3414.0, 1000.0])
+        self.assertEqual([z['aristas_corte'] for z in zonas], [2, 2, 2])
+        self.assertAlmostEqual(zonas[0]['area_km2'], 1.0, places=6)
+        self.assertAlmostEqual(zonas[1]['area_km2'], 0.5, places=6)
+        self.assertEqual(zonas[2]['area_km2'], 0.0)
+
+        self.assertAlmostEqual(zonas[0]['densidad_nodos_km2'], 4.0, places=4)
+        self.assertAlmostEqual(zonas[0]['densidad_calles_m_km2'], 4000.0, places=2)
+        self.assertAlmostEqual(zonas[1]['densidad_nodos_km2'], 6.0, places=4)
+        self.assertAlmostEqual(zonas[1]['densidad_calles_m_km2'], 6828.0, places=2)
+        self.assertEqual(zonas[2]['densidad_nodos_km2'], 0)
+        self.assertEqual(zonas[2]['densidad_calles_m_km2'], 0)
+
+
+class SilhouetteTests(SimpleTestCase):
+    """calcular_silhouette / silhouette_muestreo por estrategia"""
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        centros = np.array([[0, 0], [4, 0], [0, 4]])
+        self.labels = np.repeat([0, 1, 2], [50, 80, 30])
+        self.X = centros[self.labels] + rng.normal(size=(len(self.labels), 2))
+
+    def test_muestreo_completo_igual_a_sklearn(self):
+        from sklearn.metrics import silhouette_score
+
+        score, (inferior, superior), m = silhouette_muestreo(self.X, self.labels, tamano_muestra=len(self.labels))
+
+        self.assertEqual(m, len(self.labels))
+        self.assertAlmostEqual(score, silhouette_score(self.X, self.labels), places=10)
+        self.assertAlmostEqual(inferior, score, places=10)
+        self.assertAlmostEqual(superior, score, places=10)
+
+    def test_auto_cambia_en_umbral(self):
+        n = len(self.labels)
+        self.assertEqual(calcular_silhouette(self.X, self.labels, 'auto', umbral_exacto=n)['estrategia'], 'exacta')
+
+        detalle = calcular_silhouette(self.X, self.labels, 'auto', umbral_exacto=n - 1, tamano_muestra=60)
+        self.assertEqual(detalle['estrategia'], 'muestreo')
+        self.assertLess(detalle['muestra'], n)
+        self.assertLessEqual(detalle['intervalo_confianza'][0], detalle['score'])
+        self.assertGreaterEqual(detalle['intervalo_confianza'][1], detalle['score'])
+
+    def test_estrategia_desconocida(self):
+        with self.assertRaises(ValueError):
+            calcular_silhouette(self.X, self.labels, 'aproximada')
+
+
+class PolilineasTests(SimpleTestCase):
+    """Formato de polilíneas codificadas de Google"""
+
+    # Vector de referencia de la documentación de Google (lat, lon) -> [lon, lat]
+    REFERENCIA = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    PUNTOS = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+
+    def test_vector_de_referencia(self):
+        self.assertEqual(codificar_polilinea(self.PUNTOS), self.REFERENCIA)
+        decodificados = decodificar_polilinea(self.REFERENCIA)
+        self.assertEqual(len(decodificados), 3)
+        for punto, esperado in zip(decodificados, self.PUNTOS):
+            self.assertAlmostEqual(punto[0], esperado[0], places=5)
+            self.assertAlmostEqual(punto[1], esperado[1], places=5)
+
+    def test_ida_y_vuelta_geojson(self):
+        geojson = {'type': 'FeatureCollection', 'features': [
+            {'type': 'Feature', 'properties': {'zona': 1, 'color': '#ff0000'}, 'geometry': {
+                'type': 'MultiLineString',
+                'coordinates': [
+                    [[-99.16012, 19.41231], [-99.15987, 19.41302]],
+                    [[-99.15987, 19.41302], [-99.15921, 19.41377]],
+                    [[-99.15500, 19.41000], [-99.15400, 19.41100], [-99.15300, 19.41000]],
+                ]}},
+            {'type': 'Feature', 'properties': {'zona': 2}, 'geometry': {'type': 'MultiLineString', 'coordinates': []}},
+        ]}
+
+        compacto = codificar_geojson(geojson, precision=5, tolerancia_m=0)
+        decodificado = decodificar_geojson(compacto)
+
+        self.assertEqual([f['properties'] for f in decodificado['features']], [{'zona': 1, 'color': '#ff0000'}, {'zona': 2}])
+        # Las dos primeras aristas se unen en una sola línea
+        lineas = sorted(decodificado['features'][0]['geometry']['coordinates'])
+        self.assertEqual(lineas, sorted([
+            [[-99.16012, 19.41231], [-99.15987, 19.41302], [-99.15921, 19.41377]],
+            [[-99.155, 19.41], [-99.154, 19.411], [-99.153, 19.41]],
+        ]))
+        self.assertEqual(decodificado['features'][1]['geometry']['coordinates'], [])
+        self.assertEqual(codificar_geojson(decodificado, precision=5, tolerancia_m=0), compacto)
+
+
+class JsonStreamingTests(SimpleTestCase):
+    """iter_json / StreamingJsonResponse producen JSON válido por partes"""
+
+    def setUp(self):
+        self.fecha = datetime(2024, 5, 17, 8, 30)
+        self.monto = Decimal('12.50')
+
+    def datos(self):
+        def calles(zona):
+            for i in range(7):
+                yield {'zona': zona, 'nombre': f'Calle ñandú {i}', 'coords': [[-99.1 + j, 19.4] for j in range(i)]}
+
+        return {
+            'rutas': (
+                {'id': zona, 'calles': calles(zona), 'vacio': iter([]), 'extra': {}}
+                for zona in range(3)
+            ),
+            'vacios': {'dict': {}, 'lista': [], 'tupla': ()},
+            'fecha': self.fecha,
+            'monto': self.monto,
+            'largo': list(range(13)),
+            1: None,
+        }
+
+    def esperado(self):
+        return {
+            'rutas': [
+                {'id': zona, 'vacio': [], 'extra': {}, 'calles': [
+                    {'zona': zona, 'nombre': f'Calle ñandú {i}', 'coords': [[-99.1 + j, 19.4] for j in range(i)]}
+                    for i in range(7)
+                ]}
+                for zona in range(3)
+            ],
+            'vacios': {'dict': {}, 'lista': [], 'tupla': []},
+            'fecha': str(self.fecha),
+            'monto': str(self.monto),
+            'largo': list(range(13)),
+            '1': None,
+        }
+
+    def test_iter_json_es_json_valido(self):
+        # Listas más cortas, de longitud exacta, múltiplo y con sobrante respecto al trozo
+        for trozo in (4, 6, 13, 500):
+            with self.subTest(trozo=trozo), mock.patch('core.utils.json_streaming.ELEMENTOS_POR_TROZO', trozo):
+                self.assertEqual(json.loads(''.join(iter_json(self.datos()))), self.esperado())
+
+    def test_vacios(self):
+        for valor in ({}, [], (), iter([]), (x for x in ())):
+            with self.subTest(valor=valor):
+                self.assertEqual(json.loads(''.join(iter_json(valor))), {} if isinstance(valor, dict) else [])
+
+    def test_respuesta_en_fragmentos(self):
+        response = StreamingJsonResponse(self.datos())
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content).decode('utf-8')), self.esperado())
+
+        # Fragmentos de pocos bytes: los cortes caen dentro de claves, números y caracteres multibyte
+        for tamano in (1, 7, 100):
+            with self.subTest(tamano=tamano):
+                fragmentos = list(_agrupar(iter_json(self.datos()), tamano))
+                self.assertGreater(len(fragmentos), 10)
+                self.assertEqual(json.loads(b''.join(fragmentos).decode('utf-8')), self.esperado())
+
+
+class TrabajosHuerfanosTests(TestCase):
+    """barrer_trabajos_huerfanos: recuperación de trabajos de workers reciclados"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='x', role='staff')
+        self.colonia = ColoniaProcesada.objects.create(nombre='Colonia Trabajos', creado_por=self.staff)
+
+    def crear_trabajo(self, estado, minutos_sin_latido, intentos=0):
+        trabajo = TrabajoProcesamiento.objects.create(
+            tipo='dividir_poligono', colonia=self.colonia, creado_por=self.staff, estado=estado, intentos=intentos)
+        TrabajoProcesamiento.objects.filter(id=trabajo.id).update(
+            fecha_latido=timezone.now() - timedelta(minutes=minutos_sin_latido))
+        return trabajo
+
+    def test_re_encola_y_luego_marca_error(self):
+        atorado = self.crear_trabajo('en_proceso', 60)
+        agotado = self.crear_trabajo('en_proceso', 60, intentos=1)
+        vivo = self.crear_trabajo('en_proceso', 1)
+
+        self.assertEqual(barrer_trabajos_huerfanos(), (1, 1))
+
+        atorado.refresh_from_db()
+        agotado.refresh_from_db()
+        vivo.refresh_from_db()
+        self.assertEqual((atorado.estado, atorado.intentos), ('pendiente', 1))
+        self.assertEqual(agotado.estado, 'error')
+        self.assertEqual(vivo.estado, 'en_proceso')
+
+    def test_no_ejecuta_un_trabajo_ya_reclamado(self):
+        trabajo = self.crear_trabajo('en_proceso', 1)
+        ejecutar_trabajo(trabajo.id)
+
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'en_proceso')
+        self.assertEqual(trabajo.mensaje, '')
+
+
+class RutasAccesoTests(TestCase):
+    """rutas_geojson / mapa_rutas: solo para quien tiene acceso a la configuración"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='x', role='staff')
+        self.empleado = User.objects.create_user(username='empleado', password='x', role='employee')
+        colonia = ColoniaProcesada.objects.create(nombre='Colonia Rutas', creado_por=self.staff)
+        self.config = ConfiguracionRuta.objects.create(colonia=colonia, creado_por=self.staff)
+        self.config.empleados_asignados.add(self.empleado)
+        self.urls = [f'/api/rutas/{self.config.id}/geojson/', f'/api/rutas/{self.config.id}/mapa/']
+
+    def test_anonimo_va_al_login(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_solo_usuarios_con_acceso(self):
+        otro = User.objects.create_user(username='otro', password='x', role='employee')
+        for usuario, esperado in ((otro, 404), (self.empleado, 200), (self.staff, 200)):
+            self.client.force_login(usuario)
+            for url in self.urls:
+                with self.subTest(usuario=usuario.username, url=url):
+                    self.assertEqual(self.client.get(url).status_code, esperado)
+
+
+class TileRutasTests(TestCase):
+    """tile_rutas: acceso, tiles vacíos sin caché y zoom máximo"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='x', role='staff')
+        colonia = ColoniaProcesada.objects.create(nombre='Colonia Tiles', creado_por=self.staff)
+        self.config = ConfiguracionRuta.objects.create(colonia=colonia, creado_por=self.staff, mapa_calculado={
+            'version': 'prueba',
+            'geojson': {'type': 'FeatureCollection', 'features': [{
+                'type': 'Feature',
+                'properties': {'zona': 1, 'color': 'red'},
+                'geometry': {'type': 'MultiLineString', 'coordinates': [[[-99.1600, 19.4200], [-99.1590, 19.4210]]]},
+            }]},
+        })
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.cache = Path(directorio.name)
+        parche = mock.patch('core.utils.tiles.TILES_CACHE_DIR', self.cache)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def url_tile(self, z, lon, lat):
+        n = 2 ** z
+        x = int((lon + 180) / 360 * n)
+        y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+        return f'/tiles/{self.config.id}/{z}/{x}/{y}'
+
+    def test_anonimo_va_al_login(self):
+        self.assertEqual(self.client.get(self.url_tile(15, -99.1595, 19.4205)).status_code, 302)
+
+    def test_solo_se_guardan_tiles_con_calles(self):
+        self.client.force_login(self.staff)
+
+        response = self.client.get(self.url_tile(15, -99.1595, 19.4205))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['features']), 1)
+
+        self.assertEqual(self.client.get(self.url_tile(15, -3.70, 40.42)).status_code, 204)
+        self.assertEqual(len(list(self.cache.rglob('*.geojson'))), 1)
+
+    def test_zoom_maximo(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(self.url_tile(20, -99.1595, 19.4205)).status_code, 400)
+
+
+class LimitadorNominatimTests(SimpleTestCase):
+    """LimitadorTasa: un solo presupuesto para todos los procesos"""
+
+    def test_instancias_comparten_el_presupuesto(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        db = Path(directorio.name) / 'nominatim.sqlite3'
+        # Dos instancias sobre la misma base = dos workers de gunicorn
+        limitadores = [LimitadorTasa(tasa=20, capacidad=1, db_path=db) for _ in range(2)]
+
+        inicio = time.monotonic()
+        for i in range(5):
+            limitadores[i % 2].adquirir()
+        self.assertGreaterEqual(time.monotonic() - inicio, 4 / 20 - 0.01)
+
+
+class CacheNegativaNominatimTests(SimpleTestCase):
+    """Solo se guarda "no encontrado" si todas las variaciones respondieron"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.cache = CacheNominatim(db_path=Path(directorio.name) / 'nominatim.sqlite3')
+
+    def peticiones(self, fallidas):
+        def peticion(consulta, cancelado=None):
+            if consulta in fallidas:
+                raise RuntimeError('Error en la petición HTTP: 503')
+            return []
+        return mock.patch('core.utils.main._peticion_nominatim', side_effect=peticion)
+
+    def test_variacion_fallida_no_se_guarda(self):
+        with self.peticiones({'Roma, CDMX'}):
+            with self.assertRaises(RuntimeError) as error:
+                self.cache.buscar('Roma', _consultar_nominatim)
+        self.assertNotIsInstance(error.exception, NoEncontradoNominatim)
+        self.assertIsNone(self.cache._leer(normalizar_consulta('Roma')))
+
+    def test_todas_sin_resultados_se_guarda(self):
+        with self.peticiones(set()):
+            with self.assertRaises(NoEncontradoNominatim):
+                self.cache.buscar('Roma', _consultar_nominatim)
+        self.assertEqual(self.cache._leer(normalizar_consulta('Roma'))[0], 0)
+
+
+class PrimerResultadoNominatimTests(SimpleTestCase):
+    """_probar_variaciones: al primer resultado las demás variaciones devuelven su token"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.limitador = LimitadorTasa(tasa=1, capacidad=1, db_path=Path(directorio.name) / 'nominatim.sqlite3')
+
+    @override_settings(NOMINATIM_MAX_CONCURRENTES=4)
+    def test_cancelacion_no_consume_tokens(self):
+        respuesta = mock.Mock(status_code=200)
+        respuesta.json.return_value = [{'display_name': 'Roma Norte'}]
+        variaciones = ['Roma', 'Roma, CDMX', 'Colonia Roma', 'Roma, Ciudad de México']
+
+        inicio = time.monotonic()
+        with mock.patch('core.utils.main.get_limitador_nominatim', return_value=self.limitador), \
+                mock.patch('core.utils.main.requests.get', return_value=respuesta) as get:
+            data, variacion = _probar_variaciones(variaciones)
+            # Los hilos cancelados despiertan en cuanto hay resultado, sin dormir su turno
+            for hilo in threading.enumerate():
+                if hilo.name.startswith('nominatim'):
+                    hilo.join(timeout=5)
+        self.assertLess(time.monotonic() - inicio, 1)
+
+        self.assertEqual(data, respuesta.json.return_value)
+        self.assertIn(variacion, variaciones)
+        get.assert_called_once()
+        # Solo se gastó el token de la petición enviada: la siguiente espera a lo más 1 s, no 4
+        self.assertLessEqual(self.limitador._reservar(), 1)
+
+
+class IndiceColoniasTests(TestCase):
+    """colonias_en_punto: candidatos por bounding box persistido"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='x', role='staff')
+
+    def crear_colonia(self, nombre, min_lon, min_lat, max_lon, max_lat):
+        anillo = [[min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat], [min_lon, max_lat], [min_lon, min_lat]]
+        return ColoniaProcesada.objects.create(nombre=nombre, creado_por=self.staff, poligono_geojson={
+            'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Polygon', 'coordinates': [anillo]}})
+
+    def test_colonias_en_punto(self):
+        grande = self.crear_colonia('Grande', -99.20, 19.40, -99.10, 19.50)
+        chica = self.crear_colonia('Chica', -99.16, 19.44, -99.14, 19.46)
+        self.crear_colonia('Lejana', -98.00, 20.00, -97.90, 20.10)
+        indice = IndiceColonias()
+
+        # Solo se leen los polígonos de las colonias cuyo bounding box contiene el punto
+        with self.assertNumQueries(2):
+            encontradas = indice.colonias_en_punto(-99.15, 19.45)
+        self.assertEqual([c['id'] for c in encontradas], [chica.id, grande.id])
+        self.assertEqual(set(indice._entradas), {chica.id, grande.id})
+
+        with self.assertNumQueries(1):
+            self.assertEqual([c['id'] for c in indice.colonias_en_punto(-99.18, 19.41)], [grande.id])
+
+
+class ExtractoOSMXmlTests(SimpleTestCase):
+    """cargar_osm_xml: lectura en streaming de un extracto .osm"""
+
+    def test_nodos_y_vias(self):
+        contenido = (
+            '<?xml version="1.0"?><osm version="0.6">'
+            '<node id="1" lat="19.40" lon="-99.10"><tag k="name" v="esquina"/></node>'
+            '<node id="2" lat="19.41" lon="-99.11"/>'
+            '<way id="10"><nd ref="1"/><nd ref="2"/><tag k="highway" v="residential"/></way>'
+            '<relation id="20"><member type="way" ref="10" role=""/></relation>'
+            '</osm>'
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.osm', delete=False) as archivo:
+            archivo.write(contenido)
+        self.addCleanup(Path(archivo.name).unlink)
+        cargador = mock.Mock()
+
+        cargar_osm_xml(archivo.name, cargador)
+
+        self.assertEqual([c.args for c in cargador.agregar_nodo.call_args_list], [(1, -99.10, 19.40), (2, -99.11, 19.41)])
+        cargador.agregar_via.assert_called_once_with(10, [1, 2], {'highway': 'residential'})
+
+
+class RecargaExtractoTests(SimpleTestCase):
+    """cargar_extracto reemplaza el almacén de forma atómica"""
+
+    CONTENIDO = (
+        '<?xml version="1.0"?><osm version="0.6">'
+        '<node id="1" lat="19.400" lon="-99.100"/>'
+        '<node id="2" lat="19.401" lon="-99.100"/>'
+        '<node id="3" lat="19.402" lon="-99.100"/>'
+        '<way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><tag k="highway" v="residential"/></way>'
+        '</osm>'
+    )
+    POLIGONO = {'type': 'Polygon', 'coordinates': [[
+        [-99.101, 19.399], [-99.099, 19.399], [-99.099, 19.403], [-99.101, 19.403], [-99.101, 19.399]]]}
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = Path(directorio.name)
+        self.archivo = self.directorio / 'region.osm'
+        self.archivo.write_text(self.CONTENIDO)
+        self.db_path = self.directorio / 'extracto.sqlite3'
+
+    def test_lectura_durante_recarga(self):
+        cargar_extracto(self.archivo, self.db_path)
+        leidos = []
+
+        def cargar_y_leer(archivo, cargador):
+            cargar_osm_xml(archivo, cargador)
+            # A media carga el extracto anterior sigue completo y con su R*Tree
+            leidos.append(grafo_desde_extracto(self.POLIGONO, 'walk', self.db_path))
+
+        with mock.patch('core.utils.osm_local.cargar_osm_xml', side_effect=cargar_y_leer):
+            cargar_extracto(self.archivo, self.db_path)
+
+        self.assertEqual(leidos[0].number_of_edges(), 1)
+        self.assertEqual(grafo_desde_extracto(self.POLIGONO, 'walk', self.db_path).number_of_edges(), 1)
+        self.assertEqual(sorted(p.name for p in self.directorio.iterdir()), ['extracto.sqlite3', 'region.osm'])
+
+    def test_error_conserva_extracto_anterior(self):
+        cargar_extracto(self.archivo, self.db_path)
+        with mock.patch('core.utils.osm_local.cargar_osm_xml', side_effect=ValueError('XML truncado')):
+            with self.assertRaises(ValueError):
+                cargar_extracto(self.archivo, self.db_path)
+
+        self.assertFalse(self.db_path.with_suffix('.tmp').exists())
+        self.assertEqual(grafo_desde_extracto(self.POLIGONO, 'walk', self.db_path).number_of_edges(), 1)
+
+
+class FuenteGrafoCacheTests(SimpleTestCase):
+    """La fuente del grafo (Overpass o extracto local y su fecha) es parte de la llave de caché"""
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = Path(directorio.name)
+        self.extracto = self.directorio / 'extracto.sqlite3'
+        self.extracto.write_bytes(b'')
+
+    def test_llaves_por_fuente(self):
+        with override_settings(OSM_FUENTE='overpass', OSM_EXTRACT_DB=str(self.extracto)):
+            self.assertEqual(fuente_grafo(), 'overpass')
+        with override_settings(OSM_FUENTE='auto', OSM_EXTRACT_DB=str(self.extracto)):
+            local = fuente_grafo()
+            self.assertTrue(local.startswith('local-'))
+            # Recargar el extracto cambia la llave
+            os.utime(self.extracto, ns=(0, 10 ** 9))
+            self.assertNotEqual(fuente_grafo(), local)
+
+    def test_eliminar_borra_todas_las_fuentes(self):
+        with mock.patch('core.utils.graph_cache.GRAPH_CACHE_DIR', self.directorio):
+            G = nx.path_graph(3)
+            for fuente in ('overpass', 'local-1'):
+                guardar_grafo_disco(clave_grafo('abc', fuente), G)
+            self.assertIsNotNone(cargar_grafo_disco(clave_grafo('abc', 'overpass')))
+
+            self.assertTrue(eliminar_grafo_disco('abc'))
+            self.assertEqual(list(self.directorio.glob('*.pkl.gz')), [])
+
+
+class CacheGrafosColoniaTests(TestCase):
+    """Borrar una colonia saca sus grafos de la caché LRU del worker"""
+
+    def test_borrado_invalida_lru(self):
+        staff = User.objects.create_user(username='staff', password='x', role='staff')
+        colonia = ColoniaProcesada.objects.create(nombre='Colonia Grafo', creado_por=staff, poligono_geojson={
+            'type': 'Polygon', 'coordinates': [[[0, 0], [0, 1], [1, 1], [0, 0]]]})
+        lru = get_grafo_lru()
+        clave = (colonia.id, colonia.poligono_hash, 'walk', 'overpass')
+        lru.put(clave, nx.path_graph(3))
+        self.addCleanup(lru.invalidar_colonia, colonia.id)
+
+        # Borrado masivo: no pasa por ColoniaProcesada.delete()
+        ColoniaProcesada.objects.filter(id=colonia.id).delete()
+
+        self.assertIsNone(lru.get(clave))
+
+
+@override_settings(OSM_FUENTE='overpass')
+class GrafoDiscoTests(TestCase):
+    """Almacén en disco de grafos: reutilización, invalidación por polígono y archivos corruptos"""
+
+    POLIGONO = {'type': 'Feature', 'properties': {}, 'geometry': {
+        'type': 'Polygon', 'coordinates': [[[-99.17, 19.41], [-99.16, 19.41], [-99.16, 19.42], [-99.17, 19.41]]]}}
+
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = Path(directorio.name)
+        parche = mock.patch('core.utils.graph_cache.GRAPH_CACHE_DIR', self.directorio)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+        descargado = nx.MultiDiGraph()
+        descargado.add_edge(1, 2, length=120.0)
+        descargado.add_edge(2, 3, length=80.0)
+        self.descarga = mock.patch('core.utils.main.ox.graph_from_polygon', return_value=descargado)
+        self.longitudes = mock.patch('core.utils.main.add_edge_lengths', side_effect=lambda G: G)
+
+    def archivos(self):
+        return sorted(archivo.name for archivo in self.directorio.glob('*.pkl.gz'))
+
+    def test_segunda_llamada_usa_disco(self):
+        with self.descarga as descarga, self.longitudes:
+            primero = construir_grafo_calles(self.POLIGONO)
+            segundo = construir_grafo_calles(self.POLIGONO)
+
+        descarga.assert_called_once()
+        self.assertEqual(len(self.archivos()), 1)
+        self.assertEqual(sorted(segundo.edges(data='length')), sorted(primero.edges(data='length')))
+
+    def test_poligono_editado_borra_grafo_anterior(self):
+        staff = User.objects.create_user(username='staff', password='x', role='staff')
+        colonia = ColoniaProcesada.objects.create(nombre='Colonia Editada', creado_por=staff,
+                                                  poligono_geojson=self.POLIGONO)
+        self.addCleanup(get_grafo_lru().invalidar_colonia, colonia.id)
+        hash_anterior = colonia.poligono_hash
+        with self.descarga, self.longitudes:
+            construir_grafo_calles(colonia.poligono_geojson)
+        self.assertEqual(self.archivos(), [f'{clave_grafo(hash_anterior, "overpass")}.pkl.gz'])
+
+        colonia.poligono_geojson = {'type': 'Feature', 'properties': {}, 'geometry': {
+            'type': 'Polygon', 'coordinates': [[[-99.17, 19.41], [-99.15, 19.41], [-99.15, 19.43], [-99.17, 19.41]]]}}
+        colonia.save()
+
+        self.assertNotEqual(colonia.poligono_hash, hash_anterior)
+        self.assertEqual(self.archivos(), [])
+
+    def test_archivo_corrupto_se_descarta(self):
+        clave = clave_grafo('abc', 'overpass')
+        ruta_grafo_cache(clave).write_bytes(b'no es un gzip')
+
+        self.assertIsNone(cargar_grafo_disco(clave))
+        self.assertEqual(self.archivos(), [])
+
+
+class BenchmarkTests(TestCase):
+    """ejecutar_benchmark / guardar_resultados_benchmark sobre un grafo sintético"""
+
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', password='x', role='staff')
+        self.colonia = ColoniaProcesada.objects.create(nombre='Colonia Benchmark', creado_por=self.staff)
+        self.G = nx.convert_node_labels_to_integers(grafo_cuadricula(6))
+        for _, datos in self.G.nodes(data=True):
+            datos['x'] = -99.1 + datos['x'] * 0.001
+            datos['y'] = 19.4 + datos['y'] * 0.001
+        for _, _, datos in self.G.edges(data=True):
+            datos['length'] = 100.0
+
+    def test_resultados_y_registros(self):
+        llamadas = []
+        # Intervalo mínimo: arrancar el pool toma más que eso, así que debe haber latidos sin resultados nuevos
+        with mock.patch('core.utils.benchmark.INTERVALO_LATIDO_S', 0.01):
+            resultados = ejecutar_benchmark(self.G, 2, ['random', 'kmeans'], repeticiones=3, max_procesos=1,
+                                            progreso=lambda porcentaje, mensaje='': llamadas.append(porcentaje))
+
+        self.assertEqual([r['algoritmo'] for r in resultados], ['random', 'kmeans'])
+        for resultado in resultados:
+            self.assertNotIn('error', resultado)
+            self.assertEqual(resultado['repeticiones'], 3)
+            self.assertEqual(len(resultado['tiempo_pared_s']['muestras']), 3)
+            self.assertEqual(len(resultado['tiempo_cpu_s']['muestras']), 3)
+            self.assertEqual(len(resultado['memoria_pico_mb']['muestras']), 1)
+            self.assertGreater(resultado['memoria_pico_mb']['mediana'], 0)
+            self.assertEqual(len(resultado['zonas']), 2)
+            self.assertEqual(sum(z['nodos'] for z in resultado['zonas']), 36)
+            self.assertGreaterEqual(resultado['aristas_corte'], 1)
+        self.assertGreater(len(llamadas), 2)
+        self.assertEqual(llamadas[-1], 90)
+
+        registros = guardar_resultados_benchmark(resultados + [{'algoritmo': 'spectral', 'error': 'falló'}],
+                                                 self.colonia, self.staff, 2, self.G.number_of_edges())
+
+        self.assertEqual(len(registros), 2)
+        self.assertEqual(EficienciaAlgoritmica.objects.filter(colonia=self.colonia).count(), 2)
+        registro = EficienciaAlgoritmica.objects.get(colonia=self.colonia, algoritmo_tipo='kmeans')
+        self.assertEqual(registro.total_nodos, 36)
+        self.assertEqual(registro.total_aristas, 60)
+        self.assertEqual(registro.nodos_zona1 + registro.nodos_zona2, 36)
+        self.assertEqual(registro.tiempo_ejecucion_segundos, resultados[1]['tiempo_pared_s']['mediana'])
+        self.assertEqual(registro.metadatos_ejecucion['repeticiones'], 3)
+        self.assertEqual(registro.metadatos_ejecucion['aristas_corte'], resultados[1]['aristas_corte'])
+
+
+class ImportacionPerezosaTests(SimpleTestCase):
+    """Cargar el URLconf no debe importar el stack geo/ML (core/utils/precarga.py)"""
+
+    PESADOS = ('osmnx', 'geopandas', 'sklearn', 'folium', 'matplotlib')
+
+    def test_urlconf_sin_modulos_pesados(self):
+        script = (
+            "import json, sys\n"
+            "import django\n"
+            "django.setup()\n"
+            "import routes_project.urls\n"
+            f"print(json.dumps([m for m in {self.PESADOS!r} if m in sys.modules]))\n"
+        )
+        entorno = dict(os.environ, DJANGO_SETTINGS_MODULE='routes_project.settings')
+        # Intérprete nuevo: en este proceso otras pruebas ya importaron esos módulos
+        salida = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                timeout=120, env=entorno, cwd=settings.BASE_DIR)
+
+        self.assertEqual(salida.returncode, 0, salida.stderr)
+        self.assertEqual(json.loads(salida.stdout.strip().splitlines()[-1]), [])
@@ -13,4 +13,9 @@ urlpatterns = [
     # API endpoints for serving maps without authentication
     path('api/maps/', views.list_available_maps, name='list_available_maps'),
     path('api/maps/<str:map_filename>', views.serve_map_html, name='serve_map_html'),
+    
+    # Rutas como GeoJSON compacto y visor compartido
+    path('api/rutas/<int:configuracion_id>/geojson/', views.rutas_geojson, name='rutas_geojson'),
+    path('api/rutas/<int:configuracion_id>/mapa/', views.mapa_rutas, name='mapa_rutas'),
+    path('tiles/<int:configuracion_id>/<int:z>/<int:x>/<int:y>', views.tile_rutas, name='tile_rutas'),
 ]
@@ -0,0 +1,199 @@
+import multiprocessing
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, as_completed
+
+import numpy as np
+
+# Grafo del worker del pool; se recibe una sola vez en el initializer
+_grafo_worker = None
+
+# Cada cuántos segundos se reporta progreso (latido del trabajo) mientras un
+# algoritmo largo sigue corriendo, para que barrer_trabajos_huerfanos no lo
+# tome por huérfano
+INTERVALO_LATIDO_S = 30
+
+
+def _inicializar_worker(G):
+    global _grafo_worker
+    _grafo_worker = G
+
+
+def resumen_estadistico(valores):
+    """Mediana, rango intercuartílico (IQR), mínimo, máximo y muestras de una lista de mediciones"""
+    arreglo = np.asarray(valores, dtype=np.float64)
+    q1, mediana, q3 = np.percentile(arreglo, [25, 50, 75])
+    return {
+        'mediana': round(float(mediana), 6),
+        'iqr': round(float(q3 - q1), 6),
+        'min': round(float(arreglo.min()), 6),
+        'max': round(float(arreglo.max()), 6),
+        'muestras': [round(float(v), 6) for v in arreglo],
+    }
+
+
+def medir_algoritmo(algoritmo, num_empleados, repeticiones=5, silhouette_estrategia=None):
+    """
+    Mide un algoritmo sobre el grafo del worker (aislado en su propio proceso).
+
+    Cada repetición registra tiempo de pared (perf_counter) y tiempo de CPU del
+    proceso (process_time) sin tracemalloc activo, porque el rastreo de
+    asignaciones inflaría ambos tiempos; el pico de memoria asignada durante
+    la división se mide aparte, en una pasada adicional con tracemalloc. La
+    vista vectorizada del grafo se construye antes de medir, igual que en
+    procesar_poligono_completo, donde se comparte entre etapas.
+    """
+    from core.utils.main import split_graph, calcular_silhouette_detalle, construir_zonas
+    from core.utils.graph_arrays import get_graph_arrays
+    from core.utils.metricas_zonas import calcular_metricas_zonas, calcular_scores_calidad
+
+    G = _grafo_worker
+    arrays = get_graph_arrays(G)
+
+    tiempos_pared, tiempos_cpu = [], []
+    partes = None
+    for _ in range(max(1, int(repeticiones))):
+        inicio_pared = time.perf_counter()
+        inicio_cpu = time.process_time()
+        partes = split_graph(G, num_empleados, algoritmo, arrays=arrays)
+        tiempos_cpu.append(time.process_time() - inicio_cpu)
+        tiempos_pared.append(time.perf_counter() - inicio_pared)
+
+    # Pasada de memoria, fuera de las mediciones de tiempo
+    tracemalloc.start()
+    try:
+        split_graph(G, num_empleados, algoritmo, arrays=arrays)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    picos_mb = [pico / 1024 / 1024]
+
+    # Métricas de calidad de la última división (los algoritmos usan semilla fija)
+    metricas = calcular_metricas_zonas(arrays, partes)
+    zonas = construir_zonas(partes, metricas)
+    silhouette = calcular_silhouette_detalle(G, partes, arrays=arrays, estrategia=silhouette_estrategia)
+
+    return {
+        'algoritmo': algoritmo,
+        'proceso_id': os.getpid(),
+        'repeticiones': len(tiempos_pared),
+        'tiempo_pared_s': resumen_estadistico(tiempos_pared),
+        'tiempo_cpu_s': resumen_estadistico(tiempos_cpu),
+        'memoria_pico_mb': resumen_estadistico(picos_mb),
+        'zonas': zonas,
+        'scores': calcular_scores_calidad(zonas, len(G)),
+        'silhouette': silhouette,
+        'aristas_corte': metricas['aristas_corte'],
+    }
+
+
+def _medir_en_worker(args):
+    return medir_algoritmo(*args)
+
+
+def ejecutar_benchmark(G, num_empleados, algoritmos, repeticiones=5, max_procesos=None,
+                       silhouette_estrategia=None, progreso=None):
+    """
+    Ejecuta todos los `algoritmos` sobre el mismo grafo en un pool de procesos.
+
+    El grafo se construye una vez (en el proceso que llama) y se envía a cada
+    worker al iniciar; cada algoritmo se mide en un proceso separado del
+    servidor web, así las mediciones no se mezclan con su memoria.
+    Mientras espera resultados llama a `progreso` al menos cada
+    INTERVALO_LATIDO_S segundos.
+    Retorna una lista de resultados de medir_algoritmo en el orden de `algoritmos`.
+    """
+    max_procesos = max_procesos or min(len(algoritmos), os.cpu_count() or 1)
+    contexto = multiprocessing.get_context('spawn')
+    resultados = {}
+    with ProcessPoolExecutor(max_workers=max_procesos, mp_context=contexto,
+                             initializer=_inicializar_worker, initargs=(G,)) as pool:
+        futuros = {
+            pool.submit(_medir_en_worker, (algoritmo, num_empleados, repeticiones, silhouette_estrategia)): algoritmo
+            for algoritmo in algoritmos
+        }
+        pendientes = set(futuros)
+        while pendientes:
+            try:
+                for futuro in as_completed(pendientes, timeout=INTERVALO_LATIDO_S):
+                    pendientes.discard(futuro)
+                    algoritmo = futuros[futuro]
+                    try:
+                        resultados[algoritmo] = futuro.result()
+                        print(f"⏱️ BENCHMARK {algoritmo}: mediana={resultados[algoritmo]['tiempo_pared_s']['mediana']:.4f}s, "
+                              f"pico={resultados[algoritmo]['memoria_pico_mb']['mediana']:.2f}MB")
+                    except Exception as e:
+                        print(f"❌ BENCHMARK {algoritmo}: {str(e)}")
+                        resultados[algoritmo] = {'algoritmo': algoritmo, 'error': str(e)}
+                    if progreso:
+                        progreso(10 + int(80 * len(resultados) / len(algoritmos)),
+                                 f'{len(resultados)}/{len(algoritmos)} algoritmos medidos')
+            except TimeoutError:
+                # Ningún algoritmo terminó en el intervalo: solo renovar el latido
+                if progreso:
+                    progreso(10 + int(80 * len(resultados) / len(algoritmos)),
+                             f'{len(resultados)}/{len(algoritmos)} algoritmos medidos')
+    return [resultados[algoritmo] for algoritmo in algoritmos]
+
+
+def guardar_resultados_benchmark(resultados, colonia, usuario, num_empleados, total_aristas):
+    """Inserta en una sola operación (bulk_create) un registro de EficienciaAlgoritmica por algoritmo medido"""
+    from core.models import EficienciaAlgoritmica
+
+    registros = []
+    for resultado in resultados:
+        if 'error' in resultado:
+            continue
+        zonas = resultado['zonas']
+
+        def zona(i, campo):
+            return zonas[i][campo] if i < len(zonas) else 0
+
+        registros.append(EficienciaAlgoritmica(
+            colonia=colonia,
+            usuario_ejecutor=usuario,
+            algoritmo_tipo=resultado['algoritmo'],
+            num_empleados=num_empleados,
+            tiempo_ejecucion_segundos=resultado['tiempo_pared_s']['mediana'],
+            memoria_usada_mb=resultado['memoria_pico_mb']['mediana'],
+            balance_zonas_porcentaje=resultado['scores']['balance_zonas'],
+            eficiencia_rutas_porcentaje=resultado['scores']['eficiencia_rutas'],
+            equidad_cargas_porcentaje=resultado['scores']['equidad_cargas'],
+            compacidad_porcentaje=resultado['scores']['compacidad'],
+            silhouette_score=resultado['silhouette']['score'],
+            total_nodos=sum(z['nodos'] for z in zonas),
+            total_aristas=total_aristas,
+            nodos_zona1=zona(0, 'nodos'),
+            nodos_zona2=zona(1, 'nodos'),
+            area_total_m2=sum(z['area_m2'] for z in zonas),
+            area_zona1_m2=zona(0, 'area_m2'),
+            area_zona2_m2=zona(1, 'area_m2'),
+            longitud_total_m=sum(z['longitud_m'] for z in zonas),
+            longitud_zona1_m=zona(0, 'longitud_m'),
+            longitud_zona2_m=zona(1, 'longitud_m'),
+            densidad_nodos_zona1_por_km2=zona(0, 'densidad_nodos_km2'),
+            densidad_nodos_zona2_por_km2=zona(1, 'densidad_nodos_km2'),
+            densidad_calles_zona1_m_por_km2=zona(0, 'densidad_calles_m_km2'),
+            densidad_calles_zona2_m_por_km2=zona(1, 'densidad_calles_m_km2'),
+            zonas_generadas=zonas,
+            parametros_algoritmo={
+                'colonia_id': colonia.id,
+                'colonia_nombre': colonia.nombre,
+                'algoritmo_tipo': resultado['algoritmo'],
+                'num_empleados': num_empleados
+            },
+            metadatos_ejecucion={
+                'tipo_ejecucion': 'benchmark',
+                'repeticiones': resultado['repeticiones'],
+                'proceso_id': resultado['proceso_id'],
+                'tiempo_pared_s': resultado['tiempo_pared_s'],
+                'tiempo_cpu_s': resultado['tiempo_cpu_s'],
+                'memoria_pico_mb': resultado['memoria_pico_mb'],
+                'aristas_corte': resultado['aristas_corte'],
+                'silhouette': resultado['silhouette']
+            },
+            notas=f"Benchmark ({resultado['repeticiones']} repeticiones) ejecutado por {usuario.username}"
+        ))
+
+    return EficienciaAlgoritmica.objects.bulk_create(registros)
@@ -0,0 +1,164 @@
+import json
+import queue
+import threading
+
+# Mensajes pendientes por suscriptor; si un cliente lento llena su cola se descartan
+# (al reconectar, Last-Event-ID recupera lo perdido desde la base de datos)
+MAXIMO_PENDIENTES = 200
+PREFIJO_CANAL = 'chat:ruta:'
+
+
+def _config(nombre, defecto):
+    try:
+        from django.conf import settings
+        return getattr(settings, nombre, defecto)
+    except Exception:
+        return defecto
+
+
+class SuscripcionLocal:
+    """Cola de mensajes de una ruta para un cliente conectado"""
+
+    def __init__(self, bus, ruta_id):
+        self._bus = bus
+        self.ruta_id = ruta_id
+        self._cola = queue.Queue(maxsize=MAXIMO_PENDIENTES)
+
+    def entregar(self, mensaje):
+        try:
+            self._cola.put_nowait(mensaje)
+        except queue.Full:
+            pass
+
+    def esperar(self, timeout):
+        """Mensajes recibidos (espera hasta `timeout` segundos por el primero)"""
+        try:
+            mensajes = [self._cola.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                mensajes.append(self._cola.get_nowait())
+            except queue.Empty:
+                return mensajes
+
+    def cerrar(self):
+        self._bus._quitar(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class BusChatLocal:
+    """
+    Pub/sub en memoria del proceso. Solo entrega a clientes conectados al
+    mismo worker que guardó el mensaje; con varios procesos usar Redis
+    (CHAT_PUBSUB_URL).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscriptores = {}
+
+    def publicar(self, ruta_id, mensaje):
+        with self._lock:
+            suscriptores = list(self._suscriptores.get(ruta_id, ()))
+        for suscripcion in suscriptores:
+            suscripcion.entregar(mensaje)
+
+    def suscribir(self, ruta_id):
+        suscripcion = SuscripcionLocal(self, ruta_id)
+        with self._lock:
+            self._suscriptores.setdefault(ruta_id, set()).add(suscripcion)
+        return suscripcion
+
+    def _quitar(self, suscripcion):
+        with self._lock:
+            suscriptores = self._suscriptores.get(suscripcion.ruta_id)
+            if suscriptores is not None:
+                suscriptores.discard(suscripcion)
+                if not suscriptores:
+                    del self._suscriptores[suscripcion.ruta_id]
+
+
+class SuscripcionRedis:
+    def __init__(self, cliente, ruta_id):
+        self.ruta_id = ruta_id
+        self._pubsub = cliente.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(f'{PREFIJO_CANAL}{ruta_id}')
+
+    def esperar(self, timeout):
+        mensajes = []
+        evento = self._pubsub.get_message(timeout=timeout)
+        while evento is not None:
+            mensajes.append(json.loads(evento['data']))
+            evento = self._pubsub.get_message(timeout=0)
+        return mensajes
+
+    def cerrar(self):
+        self._pubsub.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class BusChatRedis:
+    """Mismo contrato que BusChatLocal sobre Redis Pub/Sub (requiere el paquete redis)"""
+
+    def __init__(self, url):
+        import redis
+        self._cliente = redis.Redis.from_url(url)
+
+    def publicar(self, ruta_id, mensaje):
+        self._cliente.publish(f'{PREFIJO_CANAL}{ruta_id}', json.dumps(mensaje, default=str))
+
+    def suscribir(self, ruta_id):
+        return SuscripcionRedis(self._cliente, ruta_id)
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus_chat():
+    """Bus de mensajes de chat del proceso: Redis si CHAT_PUBSUB_URL está configurado, si no en memoria"""
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            url = _config('CHAT_PUBSUB_URL', '')
+            if url:
+                try:
+                    _bus = BusChatRedis(url)
+                    print(f"📡 Chat: pub/sub en Redis ({url})")
+                except ImportError:
+                    print("⚠️ CHAT_PUBSUB_URL configurado pero el paquete redis no está instalado; se usa el bus en memoria")
+            if _bus is None:
+                _bus = BusChatLocal()
+        return _bus
+
+
+def publicar_mensaje(mensaje):
+    """Publica un ChatMessage ya guardado a los clientes suscritos a su ruta"""
+    try:
+        get_bus_chat().publicar(mensaje.configuracion_ruta_id, mensaje.to_dict())
+    except Exception as e:
+        # El mensaje ya está en la base de datos; los clientes lo recuperan al reconectar
+        print(f"⚠️ No se pudo publicar el mensaje {mensaje.id}: {e}")
+
+
+def publicar_lectura(participante):
+    """Publica el avance de la marca de lectura de un participante (recibos de "visto")"""
+    try:
+        get_bus_chat().publicar(participante.configuracion_ruta_id, {
+            'evento': 'lectura',
+            'usuario_id': participante.usuario_id,
+            'ultimo_mensaje_leido_id': participante.ultimo_mensaje_leido_id,
+        })
+    except Exception as e:
+        print(f"⚠️ No se pudo publicar la lectura del participante {participante.id}: {e}")
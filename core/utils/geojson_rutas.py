@@ -0,0 +1,103 @@
+# Decimales de las coordenadas guardadas (6 decimales ≈ 0.1 m)
+PRECISION_COORDENADAS = 6
+
+COLOR_CORTE = 'gray'
+
+
+def _coords_arista(G, u, v, data, precision=PRECISION_COORDENADAS):
+    """Coordenadas [lon, lat] de una arista (geometría real si existe)"""
+    if 'geometry' in data:
+        puntos = data['geometry'].coords
+    else:
+        puntos = ((G.nodes[u]['x'], G.nodes[u]['y']), (G.nodes[v]['x'], G.nodes[v]['y']))
+    return [[round(x, precision), round(y, precision)] for x, y in puntos]
+
+
+def lineas_por_zona(G, partes, precision=PRECISION_COORDENADAS):
+    """
+    Recorre las aristas una sola vez y retorna (lineas, corte): `lineas[i]` son
+    las líneas [lon, lat] internas a la zona i y `corte` las que unen zonas.
+
+    Es la única pasada por las aristas del pipeline: procesar_poligono_completo
+    la guarda en resultado['geojson'] y de ahí salen el mapa de folium, el JS
+    de las rutas, mapa_calculado y las respuestas de las vistas.
+    """
+    zona_de = {n: i for i, parte in enumerate(partes) for n in parte}
+    lineas = [[] for _ in partes]
+    corte = []
+    for u, v, data in G.edges(data=True):
+        zona_u = zona_de.get(u)
+        zona_v = zona_de.get(v)
+        if zona_u is None or zona_v is None:
+            continue
+        coords = _coords_arista(G, u, v, data, precision)
+        if zona_u == zona_v:
+            lineas[zona_u].append(coords)
+        else:
+            corte.append(coords)
+    return lineas, corte
+
+
+def geojson_zonas(G, partes, propiedades=None, incluir_corte=True):
+    """
+    FeatureCollection con una MultiLineString por zona (propiedades zona y
+    color, más `propiedades[i]` si se indican) y, opcionalmente, una con las
+    aristas que cruzan zonas. Es la geometría que se guarda (codificada) en
+    mapa_calculado['geometria'] en lugar del HTML de folium.
+    """
+    from core.utils.main import color_zona
+
+    lineas, corte = lineas_por_zona(G, partes)
+    features = []
+    for i, lineas_zona in enumerate(lineas):
+        props = {'zona': i + 1, 'color': color_zona(i)}
+        if propiedades and i < len(propiedades):
+            props.update(propiedades[i])
+        features.append({
+            'type': 'Feature',
+            'properties': props,
+            'geometry': {'type': 'MultiLineString', 'coordinates': lineas_zona},
+        })
+    if incluir_corte and corte:
+        features.append({
+            'type': 'Feature',
+            'properties': {'zona': None, 'color': COLOR_CORTE, 'corte': True},
+            'geometry': {'type': 'MultiLineString', 'coordinates': corte},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def tiene_geometria(mapa_calculado):
+    """True si el mapa_calculado guarda la geometría de las zonas (no solo 'puntos' antiguos)"""
+    return bool(mapa_calculado and (mapa_calculado.get('geometria') or mapa_calculado.get('geojson')))
+
+
+def geojson_de_mapa_calculado(mapa_calculado):
+    """
+    GeoJSON de las rutas de un mapa_calculado. Las configuraciones nuevas
+    guardan 'geometria' (polilíneas codificadas, ver core/utils/polilineas.py);
+    las anteriores 'geojson' o solo 'puntos' ([lat, lon]) por ruta, que se
+    convierten al vuelo.
+    """
+    if not mapa_calculado:
+        return {'type': 'FeatureCollection', 'features': []}
+    if mapa_calculado.get('geometria'):
+        from core.utils.polilineas import decodificar_geojson
+        return decodificar_geojson(mapa_calculado['geometria'])
+    if mapa_calculado.get('geojson'):
+        return mapa_calculado['geojson']
+
+    features = []
+    for i, ruta in enumerate(mapa_calculado.get('rutas', [])):
+        lineas = [[[lon, lat] for lat, lon in linea] for linea in ruta.get('puntos', [])]
+        features.append({
+            'type': 'Feature',
+            'properties': {
+                'zona': i + 1,
+                'color': ruta.get('color_ruta'),
+                'empleado_id': ruta.get('empleado_id'),
+                'empleado_nombre': ruta.get('empleado_nombre'),
+            },
+            'geometry': {'type': 'MultiLineString', 'coordinates': lineas},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
@@ -0,0 +1,85 @@
+import threading
+import weakref
+
+import numpy as np
+
+
+class GraphArrays:
+    """
+    Vista vectorizada de un grafo de calles, construida una sola vez.
+
+    Contiene el índice nodo -> posición, las coordenadas [x, y] en float64 y
+    los extremos y longitudes de las aristas como arreglos de NumPy, para que
+    los algoritmos de división y las métricas no repitan recorridos de
+    G.nodes() / G.edges() con búsquedas en diccionarios por nodo.
+
+    Es de solo lectura: igual que el grafo de la caché LRU, se comparte entre
+    peticiones.
+    """
+
+    def __init__(self, G):
+        self.nodes = list(G.nodes())
+        self.indice = {node: i for i, node in enumerate(self.nodes)}
+
+        # Nodos sin coordenadas quedan en [0, 0]
+        datos = G.nodes
+        self.coords = np.array(
+            [(datos[n]['x'], datos[n]['y']) if 'x' in datos[n] and 'y' in datos[n] else (0.0, 0.0)
+             for n in self.nodes],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+
+        num_aristas = G.number_of_edges()
+        self.u = np.empty(num_aristas, dtype=np.int64)
+        self.v = np.empty(num_aristas, dtype=np.int64)
+        self.longitudes = np.empty(num_aristas, dtype=np.float64)
+        indice = self.indice
+        for e, (u, v, longitud) in enumerate(G.edges(data='length', default=0.0)):
+            self.u[e] = indice[u]
+            self.v[e] = indice[v]
+            self.longitudes[e] = float(longitud or 0.0)
+
+    @property
+    def num_nodos(self):
+        return len(self.nodes)
+
+    @property
+    def num_aristas(self):
+        return len(self.u)
+
+    def indices(self, nodos):
+        """Posiciones de `nodos` en los arreglos"""
+        indice = self.indice
+        return np.fromiter((indice[n] for n in nodos), dtype=np.int64, count=len(nodos))
+
+    def coords_de(self, nodos):
+        """Arreglo (n, 2) de coordenadas de un subconjunto de nodos (en el orden dado)"""
+        return self.coords[self.indices(nodos)]
+
+    def etiquetas(self, partes):
+        """Arreglo con el índice de zona de cada nodo; -1 para nodos sin zona"""
+        labels = np.full(len(self.nodes), -1, dtype=np.int64)
+        for i, parte in enumerate(partes):
+            if parte:
+                labels[self.indices(list(parte))] = i
+        return labels
+
+
+_arreglos_por_grafo = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def get_graph_arrays(G) -> GraphArrays:
+    """
+    Retorna los GraphArrays del grafo, construyéndolos la primera vez.
+
+    Se guardan con referencia débil al grafo, de modo que viven lo mismo que
+    el grafo en la caché LRU y se reutilizan entre peticiones.
+    """
+    with _lock:
+        arrays = _arreglos_por_grafo.get(G)
+    if arrays is None:
+        arrays = GraphArrays(G)
+        with _lock:
+            _arreglos_por_grafo[G] = arrays
+    return arrays
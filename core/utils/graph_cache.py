@@ -0,0 +1,198 @@
+import gzip
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# Directorio del almacén de grafos (junto a core/cache de Nominatim)
+GRAPH_CACHE_DIR = Path(__file__).resolve().parent.parent / "graph_cache"
+
+
+def hash_poligono(geojson, network_type='walk') -> str:
+    """
+    Calcula la llave del almacén para un polígono GeoJSON y un tipo de red.
+
+    Se serializa solo la geometría de forma canónica (llaves ordenadas, sin
+    espacios), de modo que cualquier cambio en el polígono produce otra llave.
+    """
+    if not geojson:
+        return ''
+    geometry = geojson.get('geometry', geojson) if isinstance(geojson, dict) else geojson
+    canonico = json.dumps(geometry, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(f"{network_type}:{canonico}".encode('utf-8')).hexdigest()
+
+
+def clave_grafo(clave_poligono: str, fuente: str) -> str:
+    """
+    Llave del almacén para el grafo de un polígono construido desde `fuente`
+    (ver osm_local.fuente_grafo): el extracto local y Overpass no comparten
+    entradas. Empieza con el hash del polígono para poder borrar todas las
+    fuentes de una colonia con eliminar_grafo_disco(hash).
+    """
+    return f"{clave_poligono}.{fuente}" if clave_poligono else ''
+
+
+def ruta_grafo_cache(clave: str) -> Path:
+    """Retorna la ruta del archivo binario para una llave"""
+    return GRAPH_CACHE_DIR / f"{clave}.pkl.gz"
+
+
+def cargar_grafo_disco(clave: str):
+    """Carga un grafo del almacén en disco. Retorna None si no existe o está corrupto."""
+    if not clave:
+        return None
+    archivo = ruta_grafo_cache(clave)
+    if not archivo.exists():
+        return None
+    try:
+        with gzip.open(archivo, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        print(f"⚠️ Caché de grafo corrupta ({archivo.name}): {str(e)} - se descarta")
+        eliminar_grafo_disco(clave)
+        return None
+
+
+def guardar_grafo_disco(clave: str, G) -> None:
+    """
+    Guarda el grafo en formato binario (pickle comprimido con gzip).
+
+    La escritura es atómica: se escribe a un archivo temporal en el mismo
+    directorio y luego se renombra, para que otro worker nunca lea un archivo
+    a medias.
+    """
+    if not clave:
+        return
+    GRAPH_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=GRAPH_CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1) as f:
+            pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, ruta_grafo_cache(clave))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def eliminar_grafo_disco(clave: str) -> bool:
+    """
+    Elimina la entrada del almacén y, si `clave` es el hash de un polígono,
+    las de todas sus fuentes (clave_grafo). Retorna True si existía alguna.
+    """
+    if not clave:
+        return False
+    eliminado = False
+    for archivo in [ruta_grafo_cache(clave), *GRAPH_CACHE_DIR.glob(f"{clave}.*.pkl.gz")]:
+        try:
+            archivo.unlink()
+            eliminado = True
+        except FileNotFoundError:
+            pass
+    return eliminado
+
+
+# ================================
+# CACHÉ LRU EN MEMORIA (POR WORKER)
+# ================================
+
+# Costo aproximado en bytes de cada elemento de un nx.Graph de OSMnx
+BYTES_POR_NODO = 700
+BYTES_POR_ARISTA = 900
+BYTES_POR_COORDENADA = 80  # vértices de la LineString 'geometry' de la arista
+
+
+def estimar_tamano_grafo(G) -> int:
+    """Estimación barata (sin recorrer atributos con sys.getsizeof) del tamaño en bytes de un grafo"""
+    total = len(G) * BYTES_POR_NODO + G.number_of_edges() * BYTES_POR_ARISTA
+    for _, _, geom in G.edges(data='geometry'):
+        if geom is not None:
+            total += len(geom.coords) * BYTES_POR_COORDENADA
+    return total
+
+
+class GraphLRUCache:
+    """
+    Caché LRU de grafos construidos, acotada por memoria estimada.
+
+    Vive en el proceso (una por worker de gunicorn). Los grafos se comparten
+    entre vistas, por lo que quien los obtenga no debe modificarlos.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()  # clave -> (grafo, tamaño)
+        self._lock = threading.Lock()
+        self.bytes_usados = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.hits += 1
+            return entrada[0]
+
+    def put(self, clave, G):
+        tamano = estimar_tamano_grafo(G)
+        with self._lock:
+            if clave in self._entradas:
+                self.bytes_usados -= self._entradas.pop(clave)[1]
+            if tamano > self.max_bytes:
+                # Un grafo más grande que todo el presupuesto no se guarda
+                return
+            self._entradas[clave] = (G, tamano)
+            self.bytes_usados += tamano
+            while self.bytes_usados > self.max_bytes and self._entradas:
+                _, (_, tamano_viejo) = self._entradas.popitem(last=False)
+                self.bytes_usados -= tamano_viejo
+                self.evictions += 1
+
+    def invalidar_colonia(self, colonia_id):
+        """Elimina todas las versiones en memoria de una colonia"""
+        with self._lock:
+            for clave in [c for c in self._entradas if c[0] == colonia_id]:
+                self.bytes_usados -= self._entradas.pop(clave)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
+            self.bytes_usados = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entradas': len(self._entradas),
+                'bytes_usados': self.bytes_usados,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_grafo_lru = None
+
+
+def get_grafo_lru() -> GraphLRUCache:
+    """Retorna la caché LRU del worker, creándola con el límite de settings.GRAPH_LRU_MAX_MB"""
+    global _grafo_lru
+    if _grafo_lru is None:
+        try:
+            from django.conf import settings
+            max_mb = getattr(settings, 'GRAPH_LRU_MAX_MB', 256)
+        except Exception:
+            max_mb = 256
+        _grafo_lru = GraphLRUCache(int(max_mb) * 1024 * 1024)
+    return _grafo_lru
@@ -0,0 +1,218 @@
+import threading
+import time
+
+# Segundos entre verificaciones de cambios hechos por otros procesos
+INTERVALO_SINCRONIZACION = 5
+
+
+def geometria_poligono(geojson):
+    """Geometría shapely (válida) de un GeoJSON Feature o geometría; None si no hay polígono"""
+    if not geojson:
+        return None
+    import shapely
+    from shapely.geometry import shape
+
+    try:
+        geometria = shape(geojson.get('geometry', geojson))
+    except Exception:
+        return None
+    if geometria.is_empty:
+        return None
+    if not geometria.is_valid:
+        geometria = shapely.make_valid(geometria)
+    return geometria
+
+
+def bbox_poligono(geojson):
+    """(min_lon, min_lat, max_lon, max_lat) del polígono, o None"""
+    geometria = geometria_poligono(geojson)
+    return tuple(float(v) for v in geometria.bounds) if geometria is not None else None
+
+
+class IndiceColonias:
+    """
+    Índice espacial (STRtree de shapely) sobre los polígonos de ColoniaProcesada.
+
+    Se mantiene en memoria por proceso: los polígonos se parsean una sola vez
+    y solo se vuelven a leer los de colonias nuevas o cuyo poligono_hash
+    cambió. save() del modelo y su señal post_delete lo actualizan en el mismo
+    proceso; los cambios de otros workers se detectan comparando el conteo y
+    la última fecha de modificación, como máximo cada INTERVALO_SINCRONIZACION
+    segundos.
+    El bounding box de cada colonia queda además persistido en la tabla
+    (bbox_min_lon, ...): las búsquedas por punto filtran los candidatos con
+    una consulta indexada, sin esperar a la sincronización ni construir el
+    STRtree, y solo parsean los polígonos candidatos que no tengan en memoria.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entradas = {}  # colonia_id -> (poligono_hash, nombre, geometría)
+        self._tree = None
+        self._ids = []
+        self._firma = None
+        self._ultima_sincronizacion = 0.0
+
+    # ---------- mantenimiento ----------
+
+    def actualizar(self, colonia):
+        """Agrega o reemplaza una colonia (llamado desde ColoniaProcesada.save)"""
+        geometria = geometria_poligono(colonia.poligono_geojson)
+        with self._lock:
+            if geometria is None:
+                self._entradas.pop(colonia.pk, None)
+            else:
+                self._entradas[colonia.pk] = (colonia.poligono_hash, colonia.nombre, geometria)
+            self._tree = None
+            self._firma = None
+
+    def eliminar(self, colonia_id):
+        """Quita una colonia (llamado desde la señal post_delete de ColoniaProcesada)"""
+        with self._lock:
+            if self._entradas.pop(colonia_id, None) is not None:
+                self._tree = None
+            self._firma = None
+
+    def _firma_actual(self):
+        from django.db.models import Count, Max
+        from core.models import ColoniaProcesada
+        firma = ColoniaProcesada.objects.aggregate(total=Count('id'), ultima=Max('fecha_modificacion'))
+        return firma['total'], firma['ultima']
+
+    def _sincronizar(self):
+        """Relee de la base de datos solo las colonias nuevas o modificadas"""
+        ahora = time.monotonic()
+        if self._firma is not None and ahora - self._ultima_sincronizacion < INTERVALO_SINCRONIZACION:
+            return
+        self._ultima_sincronizacion = ahora
+
+        firma = self._firma_actual()
+        if firma == self._firma:
+            return
+
+        from core.models import ColoniaProcesada
+        filas = ColoniaProcesada.objects.exclude(poligono_geojson__isnull=True).values_list('id', 'poligono_hash', 'nombre')
+        vigentes = {colonia_id: (poligono_hash, nombre) for colonia_id, poligono_hash, nombre in filas}
+
+        eliminadas = set(self._entradas) - set(vigentes)
+        pendientes = [
+            colonia_id for colonia_id, (poligono_hash, _) in vigentes.items()
+            if colonia_id not in self._entradas or self._entradas[colonia_id][0] != poligono_hash
+        ]
+        for colonia_id in eliminadas:
+            del self._entradas[colonia_id]
+        for colonia_id, poligono_hash, nombre, geojson in ColoniaProcesada.objects.filter(id__in=pendientes).values_list(
+                'id', 'poligono_hash', 'nombre', 'poligono_geojson'):
+            geometria = geometria_poligono(geojson)
+            if geometria is not None:
+                self._entradas[colonia_id] = (poligono_hash, nombre, geometria)
+        # Los nombres pueden cambiar sin cambiar el polígono
+        for colonia_id, (poligono_hash, nombre) in vigentes.items():
+            entrada = self._entradas.get(colonia_id)
+            if entrada and entrada[1] != nombre:
+                self._entradas[colonia_id] = (entrada[0], nombre, entrada[2])
+
+        if eliminadas or pendientes or self._tree is None:
+            self._tree = None
+            print(f"🧭 Índice de colonias sincronizado: {len(self._entradas)} polígonos "
+                  f"({len(pendientes)} leídos, {len(eliminadas)} eliminados)")
+        self._firma = firma
+
+    def _arbol(self):
+        self._sincronizar()
+        if self._tree is None:
+            from shapely import STRtree
+            self._ids = list(self._entradas)
+            self._tree = STRtree([self._entradas[i][2] for i in self._ids])
+        return self._tree
+
+    # ---------- consultas ----------
+
+    def colonias_en_punto(self, lon, lat):
+        """
+        Colonias cuyo polígono contiene (o toca) el punto, de la más pequeña a
+        la más grande (la primera es la más específica).
+
+        Los candidatos salen de la base de datos por su bounding box (índice
+        colonia_bbox_idx), así que la respuesta refleja al momento los cambios
+        de otros workers; solo se leen y parsean los polígonos candidatos que
+        no estén ya en memoria con el mismo poligono_hash.
+        """
+        from shapely.geometry import Point
+        from core.models import ColoniaProcesada
+
+        candidatas = list(ColoniaProcesada.objects.filter(
+            bbox_min_lon__lte=lon, bbox_max_lon__gte=lon, bbox_min_lat__lte=lat, bbox_max_lat__gte=lat
+        ).values_list('id', 'poligono_hash', 'nombre'))
+
+        with self._lock:
+            faltantes = [
+                colonia_id for colonia_id, poligono_hash, _ in candidatas
+                if colonia_id not in self._entradas or self._entradas[colonia_id][0] != poligono_hash
+            ]
+        if faltantes:
+            leidas = ColoniaProcesada.objects.filter(id__in=faltantes).values_list(
+                'id', 'poligono_hash', 'nombre', 'poligono_geojson')
+            with self._lock:
+                for colonia_id, poligono_hash, nombre, geojson in leidas:
+                    geometria = geometria_poligono(geojson)
+                    if geometria is not None:
+                        self._entradas[colonia_id] = (poligono_hash, nombre, geometria)
+                        self._tree = None
+
+        punto = Point(lon, lat)
+        encontradas = []
+        with self._lock:
+            for colonia_id, _, nombre in candidatas:
+                entrada = self._entradas.get(colonia_id)
+                if entrada is not None and entrada[2].intersects(punto):
+                    encontradas.append((entrada[2].area, colonia_id, nombre))
+        encontradas.sort(key=lambda e: e[0])
+        return [{'id': colonia_id, 'nombre': nombre} for _, colonia_id, nombre in encontradas]
+
+    def colonias_superpuestas(self, geometria, excluir_id=None):
+        """
+        Colonias cuyo polígono se superpone (interiores que se intersectan) con
+        `geometria`, con la fracción del área de `geometria` que cubre cada una.
+        """
+        with self._lock:
+            tree = self._arbol()
+            indices = tree.query(geometria, predicate='intersects')
+            resultado = []
+            for i in indices:
+                colonia_id = self._ids[i]
+                if colonia_id == excluir_id:
+                    continue
+                _, nombre, otra = self._entradas[colonia_id]
+                interseccion = geometria.intersection(otra).area
+                if interseccion <= 0:
+                    continue  # solo comparten borde
+                resultado.append({
+                    'id': colonia_id,
+                    'nombre': nombre,
+                    'fraccion_superpuesta': round(interseccion / geometria.area, 4) if geometria.area else 0,
+                })
+            resultado.sort(key=lambda r: r['fraccion_superpuesta'], reverse=True)
+            return resultado
+
+    def colonias_superpuestas_a(self, colonia_id):
+        """Colonias que se superponen con la colonia `colonia_id`; None si no está indexada"""
+        with self._lock:
+            self._arbol()
+            entrada = self._entradas.get(colonia_id)
+            if entrada is None:
+                return None
+            return self.colonias_superpuestas(entrada[2], excluir_id=colonia_id)
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def get_indice_colonias() -> IndiceColonias:
+    """Índice espacial de colonias del proceso"""
+    global _indice
+    with _indice_lock:
+        if _indice is None:
+            _indice = IndiceColonias()
+        return _indice
@@ -0,0 +1,89 @@
+import json
+import types
+
+from django.http import StreamingHttpResponse
+
+# Tamaño aproximado (bytes) de cada fragmento que se entrega al servidor
+TAMANO_FRAGMENTO = 64 * 1024
+# Listas más largas que esto se serializan por partes (p. ej. arreglos de calles)
+ELEMENTOS_POR_TROZO = 500
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def _es_iterable_perezoso(valor):
+    return isinstance(valor, (types.GeneratorType, map, filter)) or (
+        hasattr(valor, '__next__') and hasattr(valor, '__iter__'))
+
+
+def iter_json(valor):
+    """
+    Serializa `valor` a JSON por partes. Los generadores/iteradores se
+    consumen elemento por elemento (se escriben como listas) y las listas
+    largas se codifican en trozos, así nunca se arma el documento completo
+    en memoria.
+    """
+    if isinstance(valor, dict):
+        yield '{'
+        primero = True
+        for clave, item in valor.items():
+            if not primero:
+                yield ','
+            primero = False
+            yield _encoder.encode(str(clave))
+            yield ':'
+            yield from iter_json(item)
+        yield '}'
+    elif _es_iterable_perezoso(valor):
+        yield '['
+        primero = True
+        for item in valor:
+            if not primero:
+                yield ','
+            primero = False
+            yield from iter_json(item)
+        yield ']'
+    elif isinstance(valor, (list, tuple)) and any(isinstance(item, dict) or _es_iterable_perezoso(item) for item in valor):
+        yield '['
+        for j, item in enumerate(valor):
+            if j:
+                yield ','
+            yield from iter_json(item)
+        yield ']'
+    elif isinstance(valor, (list, tuple)) and len(valor) > ELEMENTOS_POR_TROZO:
+        # Arreglos largos (geometría): se codifican de ELEMENTOS_POR_TROZO en ELEMENTOS_POR_TROZO
+        yield '['
+        for inicio in range(0, len(valor), ELEMENTOS_POR_TROZO):
+            if inicio:
+                yield ','
+            yield _encoder.encode(list(valor[inicio:inicio + ELEMENTOS_POR_TROZO]))[1:-1]
+        yield ']'
+    else:
+        yield _encoder.encode(valor)
+
+
+def _agrupar(partes, tamano=TAMANO_FRAGMENTO):
+    """Junta las partes pequeñas de iter_json en fragmentos de ~`tamano` bytes"""
+    buffer = []
+    acumulado = 0
+    for parte in partes:
+        buffer.append(parte)
+        acumulado += len(parte)
+        if acumulado >= tamano:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            acumulado = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """
+    Como JsonResponse, pero el cuerpo se genera mientras se envía: las
+    listas pueden ser generadores (p. ej. sobre queryset.iterator()) y la
+    memoria del worker queda acotada sin importar el tamaño de la respuesta.
+    """
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(_agrupar(iter_json(data)), **kwargs)
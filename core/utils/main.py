@@ -13,237 +13,377 @@ from shapely.geometry import Point
 #from editor_launcher import launch_polygon_editor,shutdown_server
 from pathlib import Path
 from osmnx.distance import add_edge_lengths
+from core.utils.graph_cache import hash_poligono, clave_grafo, cargar_grafo_disco, guardar_grafo_disco, get_grafo_lru
+from core.utils.graph_arrays import get_graph_arrays
+from core.utils.metricas_zonas import calcular_metricas_zonas
+from core.utils.osm_local import grafo_desde_extracto, fuente_grafo
+from core.utils.nominatim_cache import get_cache_nominatim, get_limitador_nominatim, NoEncontradoNominatim
+from core.utils.geojson_rutas import geojson_zonas
 
 def sanitize_filename(name: str) -> str:
     return re.sub(r'\W+', '_', name.lower())
 
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+NOMINATIM_HEADERS = {"User-Agent": "mi-aplicacion-ceneval"}
+
+
+def _variaciones_nombre(place_name: str):
+    """Variaciones del nombre que se prueban cuando la búsqueda original no da resultados"""
+    variations = [
+        place_name.replace("colonia ", ""),
+        place_name.replace("colonia", ""),
+        place_name + ", México",
+        place_name + ", CDMX"
+    ]
+    return [v for v in dict.fromkeys(variations) if v.strip() and v != place_name]
+
+
+def _peticion_nominatim(consulta: str, cancelado=None):
+    """
+    Una petición a Nominatim (tomando un token del limitador de 1 req/s).
+    Retorna la lista de resultados, o None si se canceló antes de enviarla
+    (en ese caso el token reservado se devuelve al limitador).
+    """
+    if cancelado is not None and cancelado.is_set():
+        return None
+    if not get_limitador_nominatim().adquirir(cancelado):
+        return None
+    params = {
+        "q": consulta,
+        "format": "json",
+        "limit": 5,  # Aumentar límite para obtener más opciones
+        "polygon_geojson": 1,
+        "countrycodes": "mx"  # Limitar a México
+    }
+    response = requests.get(NOMINATIM_URL, params=params, headers=NOMINATIM_HEADERS, timeout=10)
+    if response.status_code != 200:
+        raise RuntimeError(f"Error en la petición HTTP: {response.status_code}")
+    return response.json()
+
+
+def _probar_variaciones(variaciones):
+    """
+    Prueba las variaciones en paralelo (como máximo NOMINATIM_MAX_CONCURRENTES
+    a la vez; el limitador sigue espaciando los envíos a 1 req/s) y retorna
+    (resultados, variación) de la primera que responda con resultados.
+    Las variaciones que aún no se enviaron se cancelan y devuelven al
+    limitador el token que tenían reservado.
+
+    Solo retorna (None, None) si todas las variaciones respondieron sin
+    resultados: si alguna falló (red, HTTP) se lanza su error, para que la
+    caché no guarde como "no encontrado" una búsqueda incompleta.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from django.conf import settings
+    import threading
+
+    cancelado = threading.Event()
+    max_workers = max(1, min(len(variaciones), int(getattr(settings, 'NOMINATIM_MAX_CONCURRENTES', 4))))
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='nominatim')
+    errores = []
+    try:
+        futuros = {pool.submit(_peticion_nominatim, variacion, cancelado): variacion for variacion in variaciones}
+        for futuro in as_completed(futuros):
+            variacion = futuros[futuro]
+            try:
+                data = futuro.result()
+            except Exception as e:
+                errores.append(e)
+                continue
+            if data:
+                cancelado.set()
+                print(f"Encontrado con variación: {variacion}")
+                return data, variacion
+    finally:
+        cancelado.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if errores:
+        print(f"⚠️ {len(errores)} de {len(variaciones)} variaciones fallaron; no se guarda como no encontrado")
+        raise errores[0]
+    return None, None
+
+
+def _consultar_nominatim(place_name: str, variacion_previa=None):
+    """
+    Consulta Nominatim respetando el límite de 1 req/s. Primero se intenta la
+    variación que funcionó la vez anterior (si existe) o el nombre original;
+    si no hay resultados, el resto de variaciones se prueban en paralelo.
+    Retorna (resultados, variación usada).
+    """
+    primera = variacion_previa or place_name
+    restantes = [v for v in dict.fromkeys([place_name] + _variaciones_nombre(place_name)) if v != primera]
+
+    try:
+        data = _peticion_nominatim(primera)
+        variacion = primera
+        if not data:
+            print(f"Intentando {len(restantes)} variaciones en paralelo: {restantes}")
+            data, variacion = _probar_variaciones(restantes)
+
+        if not data:
+            raise NoEncontradoNominatim(f"No se encontró '{place_name}' en Nominatim. Sugerencias: verifica el nombre, agrega el estado o usa nombres más específicos.")
+
+        # Usar el primer resultado
+        return ([data[0]] if isinstance(data, list) else [data]), variacion
+
+    except requests.exceptions.Timeout:
+        raise RuntimeError(f"Timeout al buscar '{place_name}' en Nominatim. Verifica tu conexión a internet.")
+    except requests.exceptions.RequestException as e:
+        raise RuntimeError(f"Error de conexión: {str(e)}")
+
+
 def download_bbox(place_name: str):
+    """
+    Retorna la lista de resultados de Nominatim (con bounding box y polígono)
+    para un nombre de colonia, usando la caché SQLite de core/cache.
+    """
     print(f"Descargando bounding box de {place_name}...")
-    base_cache_dir = Path(__file__).resolve().parent.parent / "cache"
-    base_cache_dir.mkdir(parents=True, exist_ok=True)
+    return get_cache_nominatim().buscar(place_name, _consultar_nominatim)
 
-    cache_file = base_cache_dir / f"{sanitize_filename(place_name)}.json"
+# Paleta de colores por zona (la misma que usa getRouteColor en los dashboards)
+COLORES_ZONAS = ['#e74c3c', '#3498db', '#2ecc71', '#f39c12', '#9b59b6', '#1abc9c']
 
-    if cache_file.exists():
-        with open(cache_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    else:
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            "q": place_name,
-            "format": "json",
-            "limit": 5,  # Aumentar límite para obtener más opciones
-            "polygon_geojson": 1,
-            "countrycodes": "mx"  # Limitar a México
-        }
-        headers = {"User-Agent": "mi-aplicacion-ceneval"}
-        
-        try:
-            response = requests.get(url, params=params, headers=headers, timeout=10)
-            if response.status_code != 200:
-                raise RuntimeError(f"Error en la petición HTTP: {response.status_code}")
-            
-            data = response.json()
-            if not data:
-                # Intentar con variaciones del nombre
-                variations = [
-                    place_name.replace("colonia ", ""),
-                    place_name.replace("colonia", ""),
-                    place_name + ", México",
-                    place_name + ", CDMX"
-                ]
-                
-                for variation in variations:
-                    if variation != place_name:
-                        print(f"Intentando variación: {variation}")
-                        params["q"] = variation
-                        response = requests.get(url, params=params, headers=headers, timeout=10)
-                        if response.status_code == 200:
-                            data = response.json()
-                            if data:
-                                print(f"Encontrado con variación: {variation}")
-                                break
-                
-                if not data:
-                    raise RuntimeError(f"No se encontró '{place_name}' en Nominatim. Sugerencias: verifica el nombre, agrega el estado o usa nombres más específicos.")
-            
-            # Usar el primer resultado
-            data = [data[0]] if isinstance(data, list) else [data]
-            
-            with open(cache_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2)
-            print(f"Guardado en {cache_file}")
-                
-        except requests.exceptions.Timeout:
-            raise RuntimeError(f"Timeout al buscar '{place_name}' en Nominatim. Verifica tu conexión a internet.")
-        except requests.exceptions.RequestException as e:
-            raise RuntimeError(f"Error de conexión: {str(e)}")
-
-    return cache_file
-
-def split_graph(G, num_employees=2, algorithm='kernighan_lin'):
+
+def color_zona(indice):
+    """Retorna el color de la zona `indice` (base 0), ciclando la paleta"""
+    return COLORES_ZONAS[indice % len(COLORES_ZONAS)]
+
+
+def _etiquetas_a_partes(node_list, labels, k):
+    """Convierte un arreglo de etiquetas 0..k-1 en una lista de k sets de nodos"""
+    partes = [set() for _ in range(k)]
+    for node, label in zip(node_list, labels):
+        partes[int(label)].add(node)
+    return partes
+
+
+def split_graph(G, num_employees=2, algorithm='kernighan_lin', arrays=None):
     """
-    Divide el grafo en zonas según el número de empleados y algoritmo especificado
-    - Si num_employees = 1: toda la ruta va a part1
-    - Si num_employees >= 2: divide en dos usando el algoritmo especificado
+    Divide el grafo en una zona por empleado según el algoritmo especificado.
+
+    Retorna una lista de `num_employees` sets de nodos (siempre esa longitud;
+    una zona puede quedar vacía si el grafo tiene menos nodos que empleados).
+    `arrays` son los GraphArrays del grafo; si no se pasan se obtienen de la caché.
+    - Si num_employees = 1: toda la ruta va a una sola zona
+    - Si num_employees >= 2: divide en k zonas con el algoritmo especificado
     """
+    k = max(1, int(num_employees))
     print("=" * 60)
     print(f"🚀 INICIANDO DIVISIÓN DE GRAFO")
     print(f"📊 Grafo: {len(G.nodes())} nodos, {len(G.edges())} aristas")
-    print(f"👥 Empleados: {num_employees}")
+    print(f"👥 Empleados: {k}")
     print(f"🔧 Algoritmo solicitado: '{algorithm}'")
     print("=" * 60)
     
-    if num_employees == 1:
+    if k == 1:
         # Si solo hay un empleado, asignar toda la ruta
-        part1 = set(G.nodes())
-        part2 = set()  # Vacío
+        partes = [set(G.nodes())]
         print("✅ MODO UN EMPLEADO: Asignando toda la ruta al empleado único")
-        print(f"📈 Resultado: part1={len(part1)} nodos, part2={len(part2)} nodos")
-        return part1, part2
+        print(f"📈 Resultado: zona1={len(partes[0])} nodos")
+        return partes
     
-    print(f"🔄 MODO MÚLTIPLES EMPLEADOS: Ejecutando algoritmo '{algorithm}'")
+    print(f"🔄 MODO MÚLTIPLES EMPLEADOS: Ejecutando algoritmo '{algorithm}' con k={k}")
+    arrays = arrays or get_graph_arrays(G)
     
     # Algoritmos de división para múltiples empleados
     if algorithm == 'kernighan_lin' or algorithm == 'current':
-        print("🔥 EJECUTANDO ALGORITMO KERNIGHAN-LIN REAL")
-        part1, part2 = kernighan_lin_bisection(G)
-        print(f"✅ Kernighan-Lin completado: {len(part1)} y {len(part2)} nodos")
+        partes = split_graph_kernighan_lin(G, k, arrays)
     
     elif algorithm == 'kmeans':
-        part1, part2 = split_graph_kmeans(G)
+        partes = split_graph_kmeans(G, k, arrays)
     
     elif algorithm == 'voronoi':
-        part1, part2 = split_graph_voronoi(G)
+        partes = split_graph_voronoi(G, k, arrays)
     
     elif algorithm == 'random':
-        part1, part2 = split_graph_random(G)
+        partes = split_graph_random(G, k, arrays)
     
     elif algorithm == 'dbscan':
-        part1, part2 = split_graph_dbscan(G)
+        partes = split_graph_dbscan(G, k, arrays)
     
     elif algorithm == 'spectral':
-        part1, part2 = split_graph_spectral(G)
+        partes = split_graph_spectral(G, k, arrays)
     
     else:
         # Fallback al algoritmo por defecto
         print(f"⚠️ ALGORITMO DESCONOCIDO '{algorithm}' - Usando Kernighan-Lin como fallback")
-        print("🔥 EJECUTANDO ALGORITMO KERNIGHAN-LIN REAL (FALLBACK)")
-        part1, part2 = kernighan_lin_bisection(G)
-        print(f"✅ Fallback Kernighan-Lin completado: {len(part1)} y {len(part2)} nodos")
+        partes = split_graph_kernighan_lin(G, k, arrays)
     
     # Validación final
     total_original = len(G.nodes())
-    total_dividido = len(part1) + len(part2)
+    total_dividido = sum(len(parte) for parte in partes)
     if total_original != total_dividido:
         print(f"❌ ERROR: Nodos perdidos! Original={total_original}, Dividido={total_dividido}")
     else:
         print(f"✅ VALIDACIÓN: Todos los nodos contabilizados ({total_dividido}/{total_original})")
+    print(f"📈 Resultado: {', '.join(f'zona{i + 1}={len(p)}' for i, p in enumerate(partes))}")
     
     print("=" * 60)
-    return part1, part2
+    return partes
 
-def split_graph_kmeans(G):
-    """División usando K-means clustering en coordenadas de nodos"""
-    print("🔥 EJECUTANDO ALGORITMO K-MEANS REAL")
-    from sklearn.cluster import KMeans
+def _particion_inicial_proporcional(arrays, node_list, fraccion):
+    """
+    Partición inicial geométrica para Kernighan-Lin: ordena los nodos sobre el
+    eje principal de sus coordenadas y corta en `fraccion` del total.
+    """
     import numpy as np
-    
-    # Extraer coordenadas de los nodos
-    coords = []
+    coords = arrays.coords_de(node_list)
+    centrado = coords - coords.mean(axis=0)
+    # Eje principal = vector propio de mayor valor propio de la covarianza 2x2
+    _, vectores = np.linalg.eigh(centrado.T @ centrado)
+    proyeccion = centrado @ vectores[:, -1]
+    orden = np.argsort(proyeccion, kind='stable')
+    corte = int(round(len(node_list) * fraccion))
+    corte = min(max(corte, 1), len(node_list) - 1)
+    return (
+        {node_list[i] for i in orden[:corte]},
+        {node_list[i] for i in orden[corte:]},
+    )
+
+def split_graph_kernighan_lin(G, k=2, arrays=None, max_iter=10):
+    """
+    División k-way por bisección recursiva con Kernighan-Lin.
+
+    En cada nivel se parte en k1 = k // 2 y k2 = k - k1 zonas. La partición
+    inicial es geométrica y proporcional a k1/k; como Kernighan-Lin solo
+    intercambia pares de nodos, conserva esos tamaños y las zonas finales
+    quedan balanceadas aun con k impar.
+    """
+    print(f"🔥 EJECUTANDO ALGORITMO KERNIGHAN-LIN REAL (k={k})")
     node_list = list(G.nodes())
-    print(f"📊 K-means procesando {len(node_list)} nodos")
-    
-    for node in node_list:
-        if 'x' in G.nodes[node] and 'y' in G.nodes[node]:
-            coords.append([G.nodes[node]['x'], G.nodes[node]['y']])
+    if k <= 1 or len(node_list) < 2:
+        return [set(node_list)] + [set() for _ in range(k - 1)]
+    
+    k1 = k // 2
+    k2 = k - k1
+    arrays = arrays or get_graph_arrays(G)
+    inicial = _particion_inicial_proporcional(arrays, node_list, k1 / k)
+    part1, part2 = kernighan_lin_bisection(G, partition=inicial, max_iter=max_iter)
+    # networkx no garantiza devolver las mitades en el orden de `partition`:
+    # part1 es la que más se traslapa con el conjunto inicial de k1 zonas
+    if len(part1 & inicial[0]) < len(part2 & inicial[0]):
+        part1, part2 = part2, part1
+    print(f"✅ Kernighan-Lin (k={k}): {len(part1)} y {len(part2)} nodos")
+    
+    partes = []
+    for parte, k_sub in ((part1, k1), (part2, k2)):
+        if k_sub == 1:
+            partes.append(set(parte))
         else:
-            # Si no hay coordenadas, usar posición por defecto
-            coords.append([0, 0])
+            partes.extend(split_graph_kernighan_lin(G.subgraph(parte), k_sub, arrays, max_iter))
+    return partes
+
+def split_graph_kmeans(G, k=2, arrays=None):
+    """División usando K-means clustering en coordenadas de nodos"""
+    print(f"🔥 EJECUTANDO ALGORITMO K-MEANS REAL (k={k})")
+    from sklearn.cluster import KMeans
     
-    coords = np.array(coords)
+    # Coordenadas de los nodos (GraphArrays compartidos)
+    arrays = arrays or get_graph_arrays(G)
+    node_list = arrays.nodes
+    print(f"📊 K-means procesando {len(node_list)} nodos")
+    coords = arrays.coords
     print(f"📍 K-means: Coordenadas extraídas, forma: {coords.shape}")
     
-    # Aplicar K-means con k=2
-    print("🎯 K-means: Ejecutando clustering con k=2...")
-    kmeans = KMeans(n_clusters=2, random_state=42, n_init=10)
+    if len(node_list) < k:
+        return split_graph_random(G, k, arrays)
+    
+    print(f"🎯 K-means: Ejecutando clustering con k={k}...")
+    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
     labels = kmeans.fit_predict(coords)
     
     # Dividir nodos según las etiquetas
-    part1 = set()
-    part2 = set()
+    partes = _etiquetas_a_partes(node_list, labels, k)
     
-    for i, node in enumerate(node_list):
-        if labels[i] == 0:
-            part1.add(node)
-        else:
-            part2.add(node)
-    
-    print(f"✅ K-means completado: Cluster 1 = {len(part1)} nodos, Cluster 2 = {len(part2)} nodos")
+    print(f"✅ K-means completado: {[len(p) for p in partes]} nodos por cluster")
     print(f"📈 K-means: Centros = {kmeans.cluster_centers_}")
     
-    return part1, part2
+    return partes
+
+def _par_mas_lejano(coords):
+    """
+    Encuentra los índices del par de puntos más lejanos (diámetro) en O(n log n).
 
-def split_graph_voronoi(G):
-    """División usando diagramas de Voronoi basados en centros de masa"""
-    print("🔥 EJECUTANDO ALGORITMO VORONOI REAL")
+    El par más lejano siempre está sobre la envolvente convexa, así que se
+    calcula la envolvente (Qhull) y se recorre con rotating calipers en O(h).
+    """
     import numpy as np
-    from scipy.spatial.distance import cdist
+    from scipy.spatial import ConvexHull
     
-    # Extraer coordenadas de los nodos
-    coords = []
-    node_list = list(G.nodes())
-    print(f"📊 Voronoi procesando {len(node_list)} nodos")
-    
-    for node in node_list:
-        if 'x' in G.nodes[node] and 'y' in G.nodes[node]:
-            coords.append([G.nodes[node]['x'], G.nodes[node]['y']])
-        else:
-            coords.append([0, 0])
+    try:
+        hull = ConvexHull(coords)
+    except Exception:
+        # Puntos colineales o repetidos: los extremos del eje con mayor extensión
+        eje = int(np.argmax(coords.max(axis=0) - coords.min(axis=0)))
+        return int(coords[:, eje].argmin()), int(coords[:, eje].argmax())
+    
+    indices = hull.vertices  # en 2D vienen en orden antihorario
+    pts = coords[indices].tolist()
+    h = len(pts)
+    
+    def distancia_a_arista(a, b, c):
+        # Doble del área del triángulo abc (proporcional a la distancia de c a la arista ab)
+        return abs((b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0]))
+    
+    mejor_d2, mejor_i, mejor_j = -1.0, 0, 0
+    j = 1
+    for i in range(h):
+        sig = (i + 1) % h
+        # Avanzar el punto antípoda mientras se aleje de la arista (i, sig)
+        while distancia_a_arista(pts[i], pts[sig], pts[(j + 1) % h]) > distancia_a_arista(pts[i], pts[sig], pts[j]):
+            j = (j + 1) % h
+        for c in (i, sig):
+            d2 = (pts[c][0] - pts[j][0]) ** 2 + (pts[c][1] - pts[j][1]) ** 2
+            if d2 > mejor_d2:
+                mejor_d2, mejor_i, mejor_j = d2, c, j
+    
+    return int(indices[mejor_i]), int(indices[mejor_j])
+
+def split_graph_voronoi(G, k=2, arrays=None):
+    """División usando diagramas de Voronoi con k semillas separadas al máximo"""
+    print(f"🔥 EJECUTANDO ALGORITMO VORONOI REAL (k={k})")
+    import numpy as np
+    from scipy.spatial import cKDTree
     
-    coords = np.array(coords)
+    # Coordenadas de los nodos (GraphArrays compartidos)
+    arrays = arrays or get_graph_arrays(G)
+    node_list = arrays.nodes
+    print(f"📊 Voronoi procesando {len(node_list)} nodos")
+    coords = arrays.coords
     print(f"📍 Voronoi: Coordenadas extraídas, forma: {coords.shape}")
     
-    if len(coords) < 2:
+    if len(coords) < k:
         print("⚠️ Voronoi: Muy pocos nodos, usando división simple")
-        mid = len(node_list) // 2
-        part1 = set(node_list[:mid])
-        part2 = set(node_list[mid:])
-        return part1, part2
-    
-    # Encontrar dos puntos extremos como semillas de Voronoi
-    print("🎯 Voronoi: Calculando matriz de distancias...")
-    distances = cdist(coords, coords)
-    i, j = np.unravel_index(distances.argmax(), distances.shape)
-    
-    seed1 = coords[i]
-    seed2 = coords[j]
-    max_distance = distances[i, j]
-    
-    print(f"🌱 Voronoi: Semillas seleccionadas - Seed1: {seed1}, Seed2: {seed2}")
-    print(f"📏 Voronoi: Distancia máxima entre semillas: {max_distance:.2f}")
-    
-    # Asignar cada nodo al centro más cercano (Voronoi)
-    part1 = set()
-    part2 = set()
-    
-    for idx, node in enumerate(node_list):
-        coord = coords[idx]
-        dist1 = np.linalg.norm(coord - seed1)
-        dist2 = np.linalg.norm(coord - seed2)
-        
-        if dist1 <= dist2:
-            part1.add(node)
-        else:
-            part2.add(node)
+        return split_graph_random(G, k, arrays)
     
-    print(f"✅ Voronoi completado: Región 1 = {len(part1)} nodos, Región 2 = {len(part2)} nodos")
+    # Encontrar dos puntos extremos como primeras semillas de Voronoi (envolvente convexa)
+    print("🎯 Voronoi: Calculando par más lejano sobre la envolvente convexa...")
+    i, j = _par_mas_lejano(coords)
+    semillas = [i, j]
+    print(f"📏 Voronoi: Distancia máxima entre semillas: {np.linalg.norm(coords[i] - coords[j]):.6f}")
     
-    return part1, part2
+    # Semillas restantes por muestreo del punto más lejano (farthest-point sampling), O(n) por semilla
+    dist_min = np.minimum(np.linalg.norm(coords - coords[i], axis=1),
+                          np.linalg.norm(coords - coords[j], axis=1))
+    while len(semillas) < k:
+        siguiente = int(dist_min.argmax())
+        semillas.append(siguiente)
+        dist_min = np.minimum(dist_min, np.linalg.norm(coords - coords[siguiente], axis=1))
+    semillas = semillas[:k]
+    print(f"🌱 Voronoi: Semillas seleccionadas - {coords[semillas].tolist()}")
+    
+    # Asignar cada nodo a la semilla más cercana (Voronoi) en una sola consulta al KD-tree
+    _, labels = cKDTree(coords[semillas]).query(coords)
+    partes = _etiquetas_a_partes(node_list, labels, k)
+    
+    print(f"✅ Voronoi completado: {[len(p) for p in partes]} nodos por región")
+    
+    return partes
 
-def split_graph_random(G):
+def split_graph_random(G, k=2, arrays=None):
     """División aleatoria pero balanceada de los nodos"""
-    print("🔥 EJECUTANDO ALGORITMO RANDOM REAL")
+    print(f"🔥 EJECUTANDO ALGORITMO RANDOM REAL (k={k})")
     import random
     
     node_list = list(G.nodes())
@@ -254,38 +394,31 @@ def split_graph_random(G):
     print("🎲 Random: Mezclando nodos aleatoriamente con semilla=42")
     random.shuffle(node_list)  # Mezclar aleatoriamente
     
-    # Dividir aproximadamente por la mitad
-    mid = len(node_list) // 2
-    part1 = set(node_list[:mid])
-    part2 = set(node_list[mid:])
+    # Dividir en k bloques consecutivos de tamaño casi igual
+    n = len(node_list)
+    partes = [set(node_list[i * n // k:(i + 1) * n // k]) for i in range(k)]
     
-    print(f"✅ Random completado: Parte 1 = {len(part1)} nodos, Parte 2 = {len(part2)} nodos")
-    print(f"📝 Random: División en índice {mid} de {len(node_list)} nodos totales")
+    print(f"✅ Random completado: {[len(p) for p in partes]} nodos por parte")
     
-    return part1, part2
+    return partes
 
-def split_graph_dbscan(G):
+def split_graph_dbscan(G, k=2, arrays=None):
     """División usando DBSCAN clustering basado en densidad"""
-    print("🔥 EJECUTANDO ALGORITMO DBSCAN REAL")
+    print(f"🔥 EJECUTANDO ALGORITMO DBSCAN REAL (k={k})")
     from sklearn.cluster import DBSCAN
     import numpy as np
     from sklearn.preprocessing import StandardScaler
     
-    # Extraer coordenadas de los nodos
-    coords = []
-    node_list = list(G.nodes())
+    # Coordenadas de los nodos (GraphArrays compartidos)
+    arrays = arrays or get_graph_arrays(G)
+    node_list = arrays.nodes
     print(f"📊 DBSCAN procesando {len(node_list)} nodos")
-    
-    for node in node_list:
-        if 'x' in G.nodes[node] and 'y' in G.nodes[node]:
-            coords.append([G.nodes[node]['x'], G.nodes[node]['y']])
-        else:
-            # Si no hay coordenadas, usar posición por defecto
-            coords.append([0, 0])
-    
-    coords = np.array(coords)
+    coords = arrays.coords
     print(f"📍 DBSCAN: Coordenadas extraídas, forma: {coords.shape}")
     
+    if len(node_list) < k:
+        return split_graph_random(G, k, arrays)
+    
     # Normalizar coordenadas para mejor rendimiento de DBSCAN
     scaler = StandardScaler()
     coords_scaled = scaler.fit_transform(coords)
@@ -308,107 +441,198 @@ def split_graph_dbscan(G):
     # Analizar resultados
     unique_labels = set(labels)
     n_clusters = len(unique_labels) - (1 if -1 in labels else 0)
-    n_noise = list(labels).count(-1)
+    n_noise = int(np.sum(labels == -1))
     
     print(f"📊 DBSCAN: {n_clusters} clusters detectados, {n_noise} puntos de ruido")
     
-    # Si DBSCAN detecta más de 2 clusters, usar K-means como fallback
-    if n_clusters > 2:
-        print("⚠️ DBSCAN detectó más de 2 clusters, usando K-means como fallback")
-        return split_graph_kmeans(G)
-    
-    # Si DBSCAN detecta solo 1 cluster, dividir manualmente
-    if n_clusters == 1:
-        print("⚠️ DBSCAN detectó solo 1 cluster, dividiendo manualmente")
-        mid = len(node_list) // 2
-        part1 = set(node_list[:mid])
-        part2 = set(node_list[mid:])
-    else:
-        # Dividir nodos según las etiquetas de DBSCAN
-        part1 = set()
-        part2 = set()
-        
-        for i, node in enumerate(node_list):
-            if labels[i] == 0:
-                part1.add(node)
-            elif labels[i] == 1:
-                part2.add(node)
-            else:
-                # Puntos de ruido (-1) se asignan al cluster más cercano
-                if len(part1) <= len(part2):
-                    part1.add(node)
-                else:
-                    part2.add(node)
+    # Si DBSCAN no detecta exactamente k clusters, usar K-means como fallback
+    if n_clusters != k:
+        print(f"⚠️ DBSCAN detectó {n_clusters} clusters (se requieren {k}), usando K-means como fallback")
+        return split_graph_kmeans(G, k, arrays)
+    
+    # Puntos de ruido (-1) se asignan al centroide de cluster más cercano
+    if n_noise:
+        centroides = np.array([coords_scaled[labels == c].mean(axis=0) for c in range(k)])
+        ruido = labels == -1
+        dist = ((coords_scaled[ruido, None, :] - centroides[None, :, :]) ** 2).sum(axis=2)
+        labels = labels.copy()
+        labels[ruido] = dist.argmin(axis=1)
+    
+    partes = _etiquetas_a_partes(node_list, labels, k)
     
-    print(f"✅ DBSCAN completado: Cluster 1 = {len(part1)} nodos, Cluster 2 = {len(part2)} nodos")
+    print(f"✅ DBSCAN completado: {[len(p) for p in partes]} nodos por cluster")
     print(f"📈 DBSCAN: Clusters detectados = {n_clusters}, Puntos de ruido = {n_noise}")
     
-    return part1, part2
+    return partes
 
-def split_graph_spectral(G):
-    """División usando Spectral Clustering basado en conectividad"""
-    print("🔥 EJECUTANDO ALGORITMO SPECTRAL CLUSTERING REAL")
-    from sklearn.cluster import SpectralClustering
+def split_graph_spectral(G, k=2, arrays=None):
+    """
+    División espectral sobre el Laplaciano normalizado del propio grafo de calles.
+
+    La afinidad entre nodos vecinos es inversa a la longitud de la calle que
+    los une, por lo que las zonas siguen la conectividad real. La matriz es
+    dispersa (O(E) memoria) y los k eigenvectores se obtienen con ARPACK
+    (LOBPCG como respaldo si no converge).
+    """
+    print(f"🔥 EJECUTANDO ALGORITMO SPECTRAL CLUSTERING REAL (k={k})")
     import numpy as np
-    from sklearn.metrics.pairwise import rbf_kernel
-    
-    # Extraer coordenadas de los nodos
-    coords = []
-    node_list = list(G.nodes())
-    print(f"📊 Spectral Clustering procesando {len(node_list)} nodos")
-    
-    for node in node_list:
-        if 'x' in G.nodes[node] and 'y' in G.nodes[node]:
-            coords.append([G.nodes[node]['x'], G.nodes[node]['y']])
-        else:
-            # Si no hay coordenadas, usar posición por defecto
-            coords.append([0, 0])
+    import scipy.sparse as sp
+    from scipy.sparse.linalg import eigsh, lobpcg, ArpackNoConvergence
+    from sklearn.cluster import KMeans
     
-    coords = np.array(coords)
-    print(f"📍 Spectral: Coordenadas extraídas, forma: {coords.shape}")
+    arrays = arrays or get_graph_arrays(G)
+    node_list = arrays.nodes
+    n = len(node_list)
+    print(f"📊 Spectral Clustering procesando {n} nodos")
     
     # Si hay muy pocos nodos, usar K-means como fallback
-    if len(coords) < 10:
+    if n < max(10, k + 2) or arrays.num_aristas == 0:
         print("⚠️ Spectral: Muy pocos nodos, usando K-means como fallback")
-        return split_graph_kmeans(G)
-    
-    # Calcular matriz de similitud usando kernel RBF
-    print("🎯 Spectral: Calculando matriz de similitud...")
-    gamma = 1.0 / (coords.var() * coords.shape[1])  # Parámetro gamma automático
-    affinity_matrix = rbf_kernel(coords, gamma=gamma)
-    
-    print(f"📊 Spectral: Matriz de similitud calculada, gamma={gamma:.4f}")
-    
-    # Aplicar Spectral Clustering
-    print("🎯 Spectral: Ejecutando clustering espectral...")
-    spectral = SpectralClustering(
-        n_clusters=2,
-        affinity='precomputed',
-        random_state=42,
-        assign_labels='kmeans'
-    )
-    labels = spectral.fit_predict(affinity_matrix)
+        return split_graph_kmeans(G, k, arrays)
+    
+    # Matriz de adyacencia dispersa con pesos 1/longitud (normalizados por la mediana)
+    print("🎯 Spectral: Construyendo Laplaciano disperso...")
+    sin_lazos = arrays.u != arrays.v
+    filas = arrays.u[sin_lazos]
+    columnas = arrays.v[sin_lazos]
+    longitudes = np.maximum(arrays.longitudes[sin_lazos], 1.0)  # evitar pesos infinitos en aristas de longitud 0
+    pesos = np.median(longitudes) / longitudes
+    
+    A = sp.coo_matrix(
+        (np.concatenate([pesos, pesos]), (np.concatenate([filas, columnas]), np.concatenate([columnas, filas]))),
+        shape=(n, n)
+    ).tocsr()
+    
+    # Forma normalizada D^-1/2 A D^-1/2: sus eigenvalores mayores son los menores de L_sym = I - D^-1/2 A D^-1/2
+    grado = np.asarray(A.sum(axis=1)).ravel()
+    inv_sqrt = np.zeros_like(grado)
+    inv_sqrt[grado > 0] = 1.0 / np.sqrt(grado[grado > 0])
+    D_inv_sqrt = sp.diags(inv_sqrt)
+    M = (D_inv_sqrt @ A @ D_inv_sqrt).tocsr()
+    print(f"📊 Spectral: Laplaciano disperso {n}x{n} con {M.nnz} entradas no nulas")
+    
+    print("🎯 Spectral: Calculando eigenvectores (ARPACK)...")
+    try:
+        _, vectores = eigsh(M, k=k, which='LA', tol=1e-6, maxiter=n * 20)
+    except ArpackNoConvergence:
+        print("⚠️ Spectral: ARPACK no convergió, usando LOBPCG")
+        rng = np.random.default_rng(42)
+        X = rng.standard_normal((n, k))
+        _, vectores = lobpcg(M, X, largest=True, tol=1e-5, maxiter=500)
     
-    # Dividir nodos según las etiquetas
-    part1 = set()
-    part2 = set()
+    # Embedding normalizado por filas (Ng-Jordan-Weiss) y k-means sobre él
+    embedding = D_inv_sqrt @ vectores
+    normas = np.linalg.norm(embedding, axis=1, keepdims=True)
+    embedding = embedding / np.where(normas > 0, normas, 1.0)
     
-    for i, node in enumerate(node_list):
-        if labels[i] == 0:
-            part1.add(node)
-        else:
-            part2.add(node)
+    print("🎯 Spectral: Asignando clusters con k-means sobre el embedding...")
+    labels = KMeans(n_clusters=k, random_state=42, n_init=10).fit_predict(embedding)
     
-    print(f"✅ Spectral Clustering completado: Cluster 1 = {len(part1)} nodos, Cluster 2 = {len(part2)} nodos")
+    partes = _etiquetas_a_partes(node_list, labels, k)
+    
+    print(f"✅ Spectral Clustering completado: {[len(p) for p in partes]} nodos por cluster")
     print(f"📈 Spectral: Eigenvalores calculados, clusters asignados")
     
-    return part1, part2
+    return partes
+
+
+def construir_grafo_calles(geojson, network_type='walk'):
+    """
+    Construye el grafo no dirigido de calles de un polígono GeoJSON.
+
+    Usa el almacén en disco de core/graph_cache, direccionado por el hash del
+    polígono, el tipo de red y la fuente, para no repetir la descarga de OSM ni
+    el cálculo de longitudes cuando la misma colonia se procesa varias veces.
+
+    Si hay un extracto OSM cargado (manage.py cargar_extracto_osm) el grafo se
+    recorta localmente en lugar de consultar Overpass; la fuente (y la fecha
+    del extracto) van en la llave, así que cambiar OSM_FUENTE o recargar el
+    extracto no reutiliza grafos de la otra fuente.
+    """
+    fuente = fuente_grafo()
+    clave = clave_grafo(hash_poligono(geojson, network_type), fuente)
+    G = cargar_grafo_disco(clave)
+    if G is not None:
+        print(f"⚡ Grafo cargado de caché en disco ({clave[:10]}): {len(G.nodes())} nodos, {len(G.edges())} aristas")
+        return G
+
+    if fuente != 'overpass':
+        print(f"🗂️ Recortando grafo de calles del extracto OSM local...")
+        G = grafo_desde_extracto(geojson, network_type=network_type)
+    else:
+        print(f"🗺️ Convirtiendo geometría y descargando grafo de calles...")
+        geometry = shape(geojson["geometry"])
+        G = ox.graph_from_polygon(geometry, network_type=network_type)
+        G = add_edge_lengths(G)
+        G = nx.Graph(G)  # convertir a grafo no dirigido
+
+    try:
+        guardar_grafo_disco(clave, G)
+        print(f"💾 Grafo guardado en caché en disco ({clave[:10]})")
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar el grafo en caché: {str(e)}")
+    return G
 
 
-def procesar_poligono_completo(colonia_id: int, num_employees=2, algorithm='kernighan_lin'):
+def obtener_grafo_colonia(colonia, network_type='walk'):
+    """
+    Retorna el grafo de calles de una colonia usando la caché LRU del worker.
+
+    La llave es (colonia.id, hash del polígono, tipo de red, fuente), así que
+    un polígono editado o un cambio de fuente nunca reutiliza el grafo
+    anterior. En caso de fallo se recurre al almacén en disco y, por último,
+    a la descarga de OSM.
+    """
+    lru = get_grafo_lru()
+    clave = (colonia.id, colonia.get_poligono_hash(), network_type, fuente_grafo())
+    G = lru.get(clave)
+    if G is None:
+        G = construir_grafo_calles(colonia.poligono_geojson, network_type=network_type)
+        lru.put(clave, G)
+    else:
+        print(f"⚡ Grafo reutilizado de caché en memoria para colonia {colonia.id}")
+    stats = lru.stats()
+    print(f"📦 Caché LRU de grafos: {stats['entradas']} entradas, {stats['bytes_usados'] / 1024 / 1024:.1f} MB, hits={stats['hits']}, misses={stats['misses']}")
+    return G
+
+
+def construir_zonas(partes, metricas):
+    """Lista de zonas (una por parte) con color y métricas redondeadas, como la reportan las vistas"""
+    zonas = []
+    for i, parte in enumerate(partes):
+        metrica = metricas['zonas'][i]
+        area = metrica['area_km2']
+        longitud = metrica['longitud_m']
+        dens_nodos = metrica['densidad_nodos_km2']
+        dens_calles = metrica['densidad_calles_m_km2']
+        zonas.append({
+            "zona": i + 1,
+            "color": color_zona(i),
+            "nodos": len(parte),
+            "longitud_m": round(longitud, 2),
+            "area_m2": round(area, 2),
+            "densidad_nodos_km2": round(dens_nodos, 2),
+            "densidad_calles_m_km2": round(dens_calles, 2),
+            "aristas_corte": metrica['aristas_corte'],
+        })
+        print(f"🗺️ Zona {i + 1}: {len(parte)} nodos, {longitud:.2f} m de calles, {area:.2f} m², "
+              f"{dens_nodos:.2f} nodos/km², {dens_calles:.2f} m/km²")
+    return zonas
+
+
+def procesar_poligono_completo(colonia_id: int, num_employees=2, algorithm='kernighan_lin', silhouette_estrategia=None, progreso=None):
     """
     Procesa un polígono usando datos de la base de datos en lugar de archivos físicos
+
+    `silhouette_estrategia` elige cómo se calcula el Silhouette Score
+    ('auto', 'exacta', 'muestreo', 'simplificada'); por defecto la de settings.
+    `progreso(porcentaje, mensaje)` se llama al terminar cada etapa (lo usan
+    los trabajos asíncronos para reportar avance).
     """
+    def reportar(porcentaje, mensaje):
+        if progreso:
+            progreso(porcentaje, mensaje)
+
     print("🎯" + "=" * 70)
     print(f"🌟 PROCESAMIENTO COMPLETO DE POLÍGONO INICIADO")
     print(f"🆔 Colonia ID: {colonia_id}")
@@ -439,146 +663,101 @@ def procesar_poligono_completo(colonia_id: int, num_employees=2, algorithm='kern
         print(f"❌ COLONIA NO ENCONTRADA con ID: {colonia_id}")
         raise FileNotFoundError(f"No se encontró la colonia con ID: {colonia_id}")
 
-    print(f"🗺️ Convirtiendo geometría y descargando grafo de calles...")
-    geometry = shape(geojson["geometry"])
-    G = ox.graph_from_polygon(geometry, network_type='walk')
-    G = add_edge_lengths(G)
-    G = nx.Graph(G)  # convertir a grafo no dirigido
+    reportar(5, 'Obteniendo grafo de calles')
+    G = obtener_grafo_colonia(colonia, network_type='walk')
 
     print(f"🏗️ Grafo construido: {len(G.nodes())} nodos, {len(G.edges())} aristas")
     print(f"🚀 Iniciando división con algoritmo '{algorithm}'...")
 
-    part1, part2 = split_graph(G, num_employees, algorithm)
+    # Vista vectorizada del grafo, compartida por la división y las métricas
+    arrays = get_graph_arrays(G)
+
+    reportar(30, f'Dividiendo grafo con {algorithm}')
+    partes = split_graph(G, num_employees, algorithm, arrays=arrays)
     
-    # Calcular Silhouette Score
-    silhouette_score = calcular_silhouette_score(G, part1, part2)
+    reportar(55, 'Calculando métricas de zonas')
     
-    long1, long2 = calcular_longitud_por_zona(G, part1, part2)
-    area1, area2 = calcular_area_por_zona(G, part1, part2)
-
-    dens_nodos1 = len(part1) / area1 if area1 else 0
-    dens_nodos2 = len(part2) / area2 if area2 else 0
-    dens_calles1 = long1 / area1 if area1 else 0
-    dens_calles2 = long2 / area2 if area2 else 0
-
-    mapa_result = draw_graph_folium(G, part1, part2, place_name=f"colonia_{colonia_id}")
+    # Calcular Silhouette Score con la estrategia configurada (exacta, muestreo o simplificada)
+    silhouette = calcular_silhouette_detalle(G, partes, arrays=arrays, estrategia=silhouette_estrategia)
+    silhouette_score = silhouette['score']
+    
+    # Longitudes, áreas, densidades y aristas de corte de todas las zonas en una pasada
+    metricas = calcular_metricas_zonas(arrays, partes)
 
+    reportar(75, 'Generando mapa')
+    # Rutas como GeoJSON compacto (una MultiLineString por zona); se dibuja en el cliente
+    rutas_geojson = geojson_zonas(G, partes)
 
-       
-       # Estadísticas de nodos
     print(f"📊 Total de nodos: {len(G.nodes)}")
-    print(f"🔴 Zona 1 (vendedor A): {len(part1)} nodos")
-    print(f"🔵 Zona 2 (vendedor B): {len(part2)} nodos")
-
-    # Estadísticas de longitud
-    print(f"🛣️ Longitud total zona 1 (rojo): {long1:.2f} m")
-    print(f"🛣️ Longitud total zona 2 (azul): {long2:.2f} m")
-    
-    
-    print(f"📐 Área zona 1 (rojo): {area1:.2f} m²")
-    print(f"📐 Área zona 2 (azul): {area2:.2f} m²")
-    
-   
-    print(f"🔗 Densidad de nodos zona 1: {dens_nodos1:.2f} nodos/km²")
-    print(f"🔗 Densidad de nodos zona 2: {dens_nodos2:.2f} nodos/km²")
-    print(f"🚏 Densidad de calles zona 1: {dens_calles1:.2f} m/km²")
-    print(f"🚏 Densidad de calles zona 2: {dens_calles2:.2f} m/km²")
+    zonas = construir_zonas(partes, metricas)
+    print(f"✂️ Aristas de corte entre zonas: {metricas['aristas_corte']} ({metricas['longitud_corte_m']:.2f} m), EPSG:{metricas['epsg']}")
 
-    return {
+    # Claves planas zona1..zonaN (al menos zona1 y zona2) para compatibilidad con las vistas
+    resultado = {
         "status": "ok",
-        "mapa_html": mapa_result['file_path'],
-        "mapa_html_content": mapa_result['html_content'],
-        "nodos": {
-            "zona1": len(part1),
-            "zona2": len(part2),
-            "total": len(G.nodes),
-        },
-        "longitudes": {
-            "zona1_m": round(long1, 2),
-            "zona2_m": round(long2, 2)
-        },
-        "areas": {
-            "zona1_m2": round(area1, 2),
-            "zona2_m2": round(area2, 2)
-        },
-        "densidades": {
-            "nodos_por_km2_z1": round(dens_nodos1, 2),
-            "nodos_por_km2_z2": round(dens_nodos2, 2),
-            "calles_m_por_km2_z1": round(dens_calles1, 2),
-            "calles_m_por_km2_z2": round(dens_calles2, 2)
-        },
+        "geojson": rutas_geojson,
+        "nodos": {"total": len(G.nodes)},
+        "longitudes": {},
+        "areas": {},
+        "densidades": {},
+        "zonas": zonas,
+        "num_zonas": len(partes),
+        "aristas_corte": metricas['aristas_corte'],
+        "longitud_corte_m": round(metricas['longitud_corte_m'], 2),
         "silhouette_score": silhouette_score,
-        "part1_nodes": part1,
-        "part2_nodes": part2,
+        "silhouette": silhouette,
+        "partes": partes,
         "graph": G
     }
-
-
-def draw_partitioned_graph(G, part1, part2):
-    print("Dibujando el grafo con zonas en rojo y azul...")
-    color_map = ['red' if node in part1 else 'blue' for node in G.nodes()]
+    for i in range(max(2, len(zonas))):
+        zona = zonas[i] if i < len(zonas) else None
+        n = i + 1
+        resultado["nodos"][f"zona{n}"] = zona["nodos"] if zona else 0
+        resultado["longitudes"][f"zona{n}_m"] = zona["longitud_m"] if zona else 0
+        resultado["areas"][f"zona{n}_m2"] = zona["area_m2"] if zona else 0
+        resultado["densidades"][f"nodos_por_km2_z{n}"] = zona["densidad_nodos_km2"] if zona else 0
+        resultado["densidades"][f"calles_m_por_km2_z{n}"] = zona["densidad_calles_m_km2"] if zona else 0
+    return resultado
+
+
+def draw_partitioned_graph(G, partes):
+    print("Dibujando el grafo con una zona por color...")
+    zona_de = {n: i for i, parte in enumerate(partes) for n in parte}
+    color_map = [color_zona(zona_de.get(node, 0)) for node in G.nodes()]
     nx.draw(G, node_color=color_map, node_size=10, edge_color='gray', with_labels=False)
     plt.show()
 
-def calcular_longitud_por_zona(G, part1, part2):
-    total_part1 = 0
-    total_part2 = 0
-    for u, v, data in G.edges(data=True):
-        length = data.get("length", 0)
-        if u in part1 and v in part1:
-            total_part1 += length
-        elif u in part2 and v in part2:
-            total_part2 += length
-    return total_part1, total_part2
-
-def calcular_area_por_zona(G, part1, part2):
-    def area_de_particion(nodos):
-        puntos = [Point((G.nodes[n]['x'], G.nodes[n]['y'])) for n in nodos]
-        gdf = gpd.GeoDataFrame(geometry=puntos, crs="EPSG:4326")
-        gdf = gdf.to_crs(epsg=32614)  # UTM zona 14N
-        union_geom = gdf.geometry.union_all()
-        hull = union_geom.convex_hull
-        return hull.area / 1_000_000 if hull.area else 0
-    return area_de_particion(part1), area_de_particion(part2)
-
-def generate_route_js(G, part1, part2):
-    """Genera el JavaScript para las rutas del mapa"""
-    js_lines = []
-    
-    # Generar rutas para zona 1 (roja)
-    route1_segments = []
-    for u, v, data in G.edges(data=True):
-        if u in part1 and v in part1:
-            if 'geometry' in data:
-                coords = [[pt[1], pt[0]] for pt in data['geometry'].coords]  # [lat, lon] para Leaflet
-            else:
-                coords = [[G.nodes[u]['y'], G.nodes[u]['x']], [G.nodes[v]['y'], G.nodes[v]['x']]]
-            route1_segments.append(coords)
-    
-    if route1_segments:
-        js_lines.append("// Ruta zona 1 (roja)")
-        for i, segment in enumerate(route1_segments):
-            js_lines.append(f"L.polyline({segment}, {{color: 'red', weight: 3, opacity: 0.7}}).addTo(map);")
-    
-    # Generar rutas para zona 2 (azul)
-    route2_segments = []
-    for u, v, data in G.edges(data=True):
-        if u in part2 and v in part2:
-            if 'geometry' in data:
-                coords = [[pt[1], pt[0]] for pt in data['geometry'].coords]  # [lat, lon] para Leaflet
-            else:
-                coords = [[G.nodes[u]['y'], G.nodes[u]['x']], [G.nodes[v]['y'], G.nodes[v]['x']]]
-            route2_segments.append(coords)
-    
-    if route2_segments:
-        js_lines.append("// Ruta zona 2 (azul)")
-        for i, segment in enumerate(route2_segments):
-            js_lines.append(f"L.polyline({segment}, {{color: 'blue', weight: 3, opacity: 0.7}}).addTo(map);")
-    
-    return "\n        ".join(js_lines)
+def _zona_por_nodo(partes):
+    """Diccionario nodo -> índice de zona"""
+    return {n: i for i, parte in enumerate(partes) for n in parte}
+
+def calcular_longitud_por_zona(G, partes, arrays=None):
+    """Longitud de calles (m) internas a cada zona; las aristas que cruzan zonas no cuentan"""
+    arrays = arrays or get_graph_arrays(G)
+    return [zona['longitud_m'] for zona in calcular_metricas_zonas(arrays, partes)['zonas']]
 
-def draw_graph_folium(G, part1, part2, place_name="colonia", output_html=None):
+def calcular_area_por_zona(G, partes, arrays=None):
+    """Área de la envolvente convexa de cada zona, proyectada a la zona UTM del polígono"""
+    arrays = arrays or get_graph_arrays(G)
+    return [zona['area_km2'] for zona in calcular_metricas_zonas(arrays, partes)['zonas']]
+
+def generate_route_js(G, partes, rutas_geojson=None):
+    """
+    Genera el JavaScript para las rutas del mapa: una sola capa L.geoJSON con
+    todas las zonas. `rutas_geojson` (el de procesar_poligono_completo) evita
+    volver a recorrer las aristas.
+    """
+    if rutas_geojson is None:
+        rutas_geojson = geojson_zonas(G, partes)
+    return (f"L.geoJSON({json.dumps(rutas_geojson, separators=(',', ':'))}, {{"
+            f"style: function (f) {{ return {{color: f.properties.color, weight: 3, opacity: 0.7}}; }}"
+            f"}}).addTo(map);")
+
+def draw_graph_folium(G, partes, place_name="colonia", output_html=None, rutas_geojson=None):
     print("Generando mapa interactivo con folium...")
+    # Una sola pasada por las aristas para el HTML de folium y el JS incrustado
+    if rutas_geojson is None:
+        rutas_geojson = geojson_zonas(G, partes)
     base_mapa_dir = Path(__file__).resolve().parent.parent / "mapas_division"
     base_mapa_dir.mkdir(parents=True, exist_ok=True)
     filename = output_html or f"mapa_{sanitize_filename(place_name)}.html"
@@ -587,32 +766,16 @@ def draw_graph_folium(G, part1, part2, place_name="colonia", output_html=None):
     centro = list(G.nodes(data=True))[0][1]
     m = folium.Map(location=[centro['y'], centro['x']], zoom_start=16)
 
-    # Dibujar calles respetando la geometría real
-    for u, v, data in G.edges(data=True):
-        if 'geometry' in data:
-            coords = [(pt[1], pt[0]) for pt in data['geometry'].coords]
-        else:
-            coords = [(G.nodes[u]['y'], G.nodes[u]['x']), (G.nodes[v]['y'], G.nodes[v]['x'])]
-
-        # Colorear calles según la zona
-        if u in part1 and v in part1:
-            color = 'red'
-        elif u in part2 and v in part2:
-            color = 'blue'
-        else:
-            color = 'gray'
-
-        folium.PolyLine(coords, color=color, weight=3, opacity=0.7).add_to(m)
+    # Calles con su geometría real en una sola capa GeoJSON, coloreadas por zona (gris si cruzan zonas)
+    folium.GeoJson(
+        rutas_geojson,
+        style_function=lambda feature: {'color': feature['properties']['color'], 'weight': 3, 'opacity': 0.7}
+    ).add_to(m)
 
     # Guardar el archivo HTML
     m.save(nombre_archivo)
     
-    # Leer el contenido HTML generado y optimizarlo para la base de datos
-    with open(nombre_archivo, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    # Crear una versión optimizada del HTML para la base de datos
-    # Extraer solo la parte del mapa sin las dependencias externas
+    # Versión reducida para incrustar en otra página (sin dependencias externas)
     optimized_html = f"""
     <div class="folium-map" id="map_{sanitize_filename(place_name)}" style="width: 100%; height: 400px;"></div>
     <script>
@@ -630,7 +793,7 @@ def draw_graph_folium(G, part1, part2, place_name="colonia", output_html=None):
         }}).addTo(map);
         
         // Agregar rutas
-        {generate_route_js(G, part1, part2)}
+        {generate_route_js(G, partes, rutas_geojson)}
     </script>
     """
     
@@ -640,62 +803,57 @@ def draw_graph_folium(G, part1, part2, place_name="colonia", output_html=None):
     }
 
 
-def calcular_silhouette_score(G, part1, part2):
+def _config_silhouette():
+    """Estrategia, umbral para el cálculo exacto y tamaño de muestra desde settings"""
+    try:
+        from django.conf import settings
+        return (getattr(settings, 'SILHOUETTE_ESTRATEGIA', 'auto'),
+                getattr(settings, 'SILHOUETTE_UMBRAL_EXACTO', 5000),
+                getattr(settings, 'SILHOUETTE_TAMANO_MUESTRA', 2000))
+    except Exception:
+        return 'auto', 5000, 2000
+
+
+def calcular_silhouette_detalle(G, partes, arrays=None, estrategia=None):
     """
     Calcula el Silhouette Score para evaluar la calidad del clustering de nodos.
     
     Args:
         G: NetworkX graph
-        part1: set de nodos de la zona 1
-        part2: set de nodos de la zona 2
+        partes: lista de sets de nodos, uno por zona
+        arrays: GraphArrays del grafo (opcional)
+        estrategia: 'auto', 'exacta', 'muestreo' o 'simplificada'
+            (por defecto settings.SILHOUETTE_ESTRATEGIA)
     
     Returns:
-        float: Silhouette Score entre -1 y 1
+        dict: score (entre -1 y 1), estrategia usada, n, muestra e intervalo_confianza
     """
+    estrategia_config, umbral_exacto, tamano_muestra = _config_silhouette()
+    estrategia = estrategia or estrategia_config
+    detalle = {'score': 0.0, 'estrategia': estrategia, 'n': 0, 'muestra': 0, 'intervalo_confianza': None}
     try:
-        from sklearn.metrics import silhouette_score
+        from core.utils.metricas_zonas import calcular_silhouette
         import numpy as np
         
-        print("🎯 CALCULANDO SILHOUETTE SCORE...")
+        print(f"🎯 CALCULANDO SILHOUETTE SCORE (estrategia={estrategia})...")
         
-        # Si solo hay una zona, el score es perfecto
-        if len(part1) == 0 or len(part2) == 0:
+        # Si solo hay una zona con nodos, el score es perfecto
+        if sum(1 for parte in partes if parte) < 2:
             print("✅ Una sola zona detectada - Silhouette Score = 1.0")
-            return 1.0
-        
-        # Extraer coordenadas de todos los nodos
-        coords = []
-        labels = []
-        node_list = list(G.nodes())
+            detalle.update(score=1.0, estrategia='zona_unica')
+            return detalle
         
-        for node in node_list:
-            if 'x' in G.nodes[node] and 'y' in G.nodes[node]:
-                coords.append([G.nodes[node]['x'], G.nodes[node]['y']])
-                if node in part1:
-                    labels.append(0)  # Zona 1
-                elif node in part2:
-                    labels.append(1)  # Zona 2
-                else:
-                    # Nodos no asignados (no debería pasar)
-                    labels.append(-1)
-            else:
-                print(f"⚠️ Nodo {node} sin coordenadas, usando [0,0]")
-                coords.append([0, 0])
-                if node in part1:
-                    labels.append(0)
-                elif node in part2:
-                    labels.append(1)
-                else:
-                    labels.append(-1)
-        
-        coords = np.array(coords)
-        labels = np.array(labels)
+        # Coordenadas y etiqueta de zona de todos los nodos
+        arrays = arrays or get_graph_arrays(G)
+        coords = arrays.coords
+        # Nodos no asignados (no debería pasar) quedan con etiqueta -1
+        labels = arrays.etiquetas(partes)
         
         # Filtrar nodos válidos (asignados a alguna zona)
         valid_mask = labels != -1
         if not np.any(valid_mask):
             print("❌ No hay nodos válidos para calcular Silhouette Score")
-            return 0.0
+            return detalle
         
         coords_valid = coords[valid_mask]
         labels_valid = labels[valid_mask]
@@ -704,16 +862,21 @@ def calcular_silhouette_score(G, part1, part2):
         unique_labels = np.unique(labels_valid)
         if len(unique_labels) < 2:
             print("❌ Solo hay un cluster - Silhouette Score = 1.0")
-            return 1.0
+            detalle.update(score=1.0, estrategia='zona_unica')
+            return detalle
         
         if len(coords_valid) < 3:
             print("❌ Muy pocos puntos para calcular Silhouette Score")
-            return 0.0
+            return detalle
         
         # Calcular Silhouette Score
         try:
-            score = silhouette_score(coords_valid, labels_valid, metric='euclidean')
-            print(f"✅ Silhouette Score calculado: {score:.4f}")
+            detalle = calcular_silhouette(coords_valid, labels_valid, estrategia=estrategia,
+                                          umbral_exacto=umbral_exacto, tamano_muestra=tamano_muestra)
+            score = detalle['score']
+            print(f"✅ Silhouette Score calculado: {score:.4f} "
+                  f"(estrategia={detalle['estrategia']}, muestra={detalle['muestra']}/{detalle['n']}, "
+                  f"IC95={detalle['intervalo_confianza']})")
             
             # Interpretación del score
             if score >= 0.7:
@@ -728,15 +891,22 @@ def calcular_silhouette_score(G, part1, part2):
                 interpretacion = "Clustering incorrecto"
             
             print(f"📊 Interpretación: {interpretacion}")
-            return round(score, 4)
+            detalle['score'] = round(score, 4)
+            return detalle
             
         except Exception as e:
             print(f"❌ Error calculando Silhouette Score: {str(e)}")
-            return 0.0
+            return detalle
             
     except ImportError:
         print("❌ sklearn no disponible - usando score estimado")
-        return 0.75  # Score estimado conservador
+        detalle.update(score=0.75, estrategia='estimado')  # Score estimado conservador
+        return detalle
     except Exception as e:
         print(f"❌ Error general en cálculo de Silhouette Score: {str(e)}")
-        return 0.0
+        return detalle
+
+
+def calcular_silhouette_score(G, partes, arrays=None, estrategia=None):
+    """Silhouette Score (float entre -1 y 1); ver calcular_silhouette_detalle"""
+    return calcular_silhouette_detalle(G, partes, arrays=arrays, estrategia=estrategia)['score']
@@ -0,0 +1,258 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+def epsg_utm_para(lon: float, lat: float) -> int:
+    """
+    Código EPSG de la zona UTM (WGS84) que contiene el punto (lon, lat).
+
+    Se elige por polígono en lugar de fijar EPSG:32614 (UTM 14N), que solo es
+    correcto para el centro de México y distorsiona las áreas en el resto.
+    """
+    zona = int((lon + 180) // 6) % 60 + 1
+    return (32600 if lat >= 0 else 32700) + zona
+
+
+@lru_cache(maxsize=16)
+def _transformador(epsg: int):
+    from pyproj import Transformer
+    return Transformer.from_crs("EPSG:4326", f"EPSG:{epsg}", always_xy=True)
+
+
+def proyectar_coordenadas(coords, epsg=None):
+    """
+    Proyecta un arreglo (n, 2) de [lon, lat] a metros en una sola llamada vectorizada.
+
+    Si no se indica `epsg`, se usa la zona UTM del centro de las coordenadas.
+    Retorna (arreglo proyectado, epsg usado).
+    """
+    if epsg is None:
+        centro = coords.mean(axis=0) if len(coords) else (0.0, 0.0)
+        epsg = epsg_utm_para(float(centro[0]), float(centro[1]))
+    x, y = _transformador(epsg).transform(coords[:, 0], coords[:, 1])
+    return np.column_stack([x, y]), epsg
+
+
+def area_envolvente_m2(puntos) -> float:
+    """Área (m²) de la envolvente convexa de puntos ya proyectados; 0 si es degenerada"""
+    if len(puntos) < 3:
+        return 0.0
+    from scipy.spatial import ConvexHull
+    try:
+        return float(ConvexHull(puntos).volume)  # en 2D 'volume' es el área
+    except Exception:
+        # Puntos colineales o repetidos
+        return 0.0
+
+
+def calcular_metricas_zonas(arrays, partes, epsg=None):
+    """
+    Métricas de N zonas a partir de los GraphArrays y un arreglo de etiquetas.
+
+    Retorna un diccionario con:
+        - zonas: lista con nodos, longitud_m, area_km2, densidad_nodos_km2,
+          densidad_calles_m_km2 y aristas_corte de cada zona
+        - aristas_corte / longitud_corte_m: aristas que unen zonas distintas
+        - epsg: proyección usada para las áreas
+    """
+    k = len(partes)
+    labels = arrays.etiquetas(partes)
+
+    # Longitud interna y aristas de corte por zona (una pasada vectorizada sobre las aristas)
+    zona_u = labels[arrays.u]
+    zona_v = labels[arrays.v]
+    asignadas = (zona_u >= 0) & (zona_v >= 0)
+    internas = asignadas & (zona_u == zona_v)
+    corte = asignadas & (zona_u != zona_v)
+
+    longitudes = np.bincount(zona_u[internas], weights=arrays.longitudes[internas], minlength=k)
+    cortes_por_zona = (np.bincount(zona_u[corte], minlength=k)
+                       + np.bincount(zona_v[corte], minlength=k))
+    nodos_por_zona = np.bincount(labels[labels >= 0], minlength=k)
+
+    # Áreas: se proyectan todas las coordenadas una sola vez
+    proyectadas, epsg = proyectar_coordenadas(arrays.coords, epsg)
+    areas_km2 = [area_envolvente_m2(proyectadas[labels == i]) / 1_000_000 for i in range(k)]
+
+    zonas = []
+    for i in range(k):
+        area = areas_km2[i]
+        zonas.append({
+            'nodos': int(nodos_por_zona[i]),
+            'longitud_m': float(longitudes[i]),
+            'area_km2': area,
+            'densidad_nodos_km2': nodos_por_zona[i] / area if area else 0,
+            'densidad_calles_m_km2': longitudes[i] / area if area else 0,
+            'aristas_corte': int(cortes_por_zona[i]),
+        })
+
+    return {
+        'zonas': zonas,
+        'aristas_corte': int(corte.sum()),
+        'longitud_corte_m': float(arrays.longitudes[corte].sum()),
+        'epsg': epsg,
+    }
+
+
+
+def calcular_scores_calidad(zonas, total_nodos):
+    """
+    Scores de calidad (0-100) de una división a partir de la lista 'zonas' de
+    procesar_poligono_completo: balance de nodos, eficiencia de rutas,
+    equidad de cargas y compacidad.
+    """
+    nodos = [zona['nodos'] for zona in zonas]
+    longitudes = [zona['longitud_m'] for zona in zonas]
+    areas = [zona['area_m2'] for zona in zonas]
+    dens_calles = [zona['densidad_calles_m_km2'] for zona in zonas]
+
+    if len(zonas) <= 1:
+        # Zona única: balance y equidad perfectos, compacidad base
+        balance = equidad = 100.0
+        compacidad = 85.0
+    else:
+        # Balance: diferencia de nodos entre la zona más grande y la más chica
+        diferencia_nodos = max(nodos) - min(nodos)
+        balance = max(0, 100 - (diferencia_nodos / total_nodos * 100)) if total_nodos > 0 else 0
+
+        # Equidad de cargas: equilibrio de longitudes de calles
+        total_longitud = sum(longitudes)
+        diferencia_longitud = max(longitudes) - min(longitudes)
+        equidad = max(0, 100 - (diferencia_longitud / total_longitud * 100)) if total_longitud > 0 else 0
+
+        # Compacidad estimada a partir del área de cada zona
+        compacidades = [min(100, area / 100000) if area > 0 else 0 for area in areas]
+        compacidad = sum(compacidades) / len(compacidades)
+
+    # Eficiencia de rutas: densidad de calles promedio normalizada a 0-100
+    eficiencia_promedio = sum(dens_calles) / len(dens_calles) if dens_calles else 0
+    eficiencia = min(100, max(0, eficiencia_promedio / 1000))
+
+    return {
+        'balance_zonas': balance,
+        'eficiencia_rutas': eficiencia,
+        'equidad_cargas': equidad,
+        'compacidad': compacidad,
+    }
+
+# ================================
+# SILHOUETTE SCORE POR ESTRATEGIA
+# ================================
+
+ESTRATEGIAS_SILHOUETTE = ('auto', 'exacta', 'muestreo', 'simplificada')
+
+
+def _silhouette_contra_todos(X, labels, indices, k, bloque=256):
+    """
+    Silhouette s(i) de los puntos `indices` medido contra TODOS los puntos.
+
+    Se procesa por bloques de `bloque` filas: memoria O(bloque·n), tiempo O(m·n).
+    """
+    from scipy.spatial.distance import cdist
+
+    conteos = np.bincount(labels, minlength=k).astype(np.float64)
+    valores = np.empty(len(indices), dtype=np.float64)
+    for inicio in range(0, len(indices), bloque):
+        filas = indices[inicio:inicio + bloque]
+        D = cdist(X[filas], X)
+        # Suma de distancias de cada fila a cada zona: (bloque, k)
+        sumas = np.stack([D[:, labels == c].sum(axis=1) for c in range(k)], axis=1)
+        propias = labels[filas]
+        n_propia = conteos[propias]
+        a = np.where(n_propia > 1, sumas[np.arange(len(filas)), propias] / np.maximum(n_propia - 1, 1), 0.0)
+        medias = sumas / np.where(conteos > 0, conteos, np.inf)
+        medias[np.arange(len(filas)), propias] = np.inf
+        medias[:, conteos == 0] = np.inf
+        b = medias.min(axis=1)
+        s = (b - a) / np.maximum(np.maximum(a, b), 1e-12)
+        valores[inicio:inicio + len(filas)] = np.where(n_propia > 1, s, 0.0)  # zonas de un solo nodo: s = 0
+    return valores
+
+
+def silhouette_muestreo(X, labels, tamano_muestra=2000, semilla=42):
+    """
+    Silhouette estimado con muestreo estratificado por zona.
+
+    Cada zona aporta puntos en proporción a su tamaño (al menos 2) y su
+    silhouette se mide contra todos los nodos. Retorna (score, (ic_inf, ic_sup), m)
+    con un intervalo de confianza del 95 % del estimador estratificado.
+    """
+    k = int(labels.max()) + 1
+    n = len(labels)
+    rng = np.random.default_rng(semilla)
+    muestras, pesos = [], []
+    for c in range(k):
+        miembros = np.flatnonzero(labels == c)
+        if len(miembros) == 0:
+            continue
+        m_c = min(len(miembros), max(2, int(round(tamano_muestra * len(miembros) / n))))
+        muestras.append(rng.choice(miembros, size=m_c, replace=False))
+        pesos.append(len(miembros) / n)
+
+    indices = np.concatenate(muestras)
+    valores = _silhouette_contra_todos(X, labels, indices, k)
+
+    score, varianza, inicio = 0.0, 0.0, 0
+    for muestra, peso in zip(muestras, pesos):
+        s_c = valores[inicio:inicio + len(muestra)]
+        inicio += len(muestra)
+        score += peso * s_c.mean()
+        if len(s_c) > 1:
+            # Corrección por población finita: una zona muestreada completa no aporta varianza
+            fpc = 1 - len(s_c) / (peso * n)
+            varianza += peso ** 2 * s_c.var(ddof=1) / len(s_c) * fpc
+    margen = 1.96 * np.sqrt(varianza)
+    return float(score), (float(score - margen), float(score + margen)), len(indices)
+
+
+def silhouette_simplificada(X, labels):
+    """
+    Silhouette simplificado (basado en centroides) en O(n·k).
+
+    a(i) es la distancia al centroide de su zona y b(i) la distancia al
+    centroide de la zona más cercana distinta.
+    """
+    k = int(labels.max()) + 1
+    conteos = np.bincount(labels, minlength=k)
+    centroides = np.stack([
+        np.bincount(labels, weights=X[:, j], minlength=k) / np.maximum(conteos, 1)
+        for j in range(X.shape[1])
+    ], axis=1)
+    D = np.sqrt(((X[:, None, :] - centroides[None, :, :]) ** 2).sum(axis=2))  # (n, k)
+    D[:, conteos == 0] = np.inf
+    a = D[np.arange(len(labels)), labels]
+    D[np.arange(len(labels)), labels] = np.inf
+    b = D.min(axis=1)
+    s = (b - a) / np.maximum(np.maximum(a, b), 1e-12)
+    return float(s.mean())
+
+
+def calcular_silhouette(X, labels, estrategia='auto', umbral_exacto=5000, tamano_muestra=2000):
+    """
+    Silhouette Score de puntos ya etiquetados (0..k-1) según la estrategia:
+
+        - exacta: sklearn sobre todos los puntos, O(n²)
+        - muestreo: estratificado por zona con intervalo de confianza, O(m·n)
+        - simplificada: basada en centroides, O(n·k)
+        - auto: exacta hasta `umbral_exacto` puntos, muestreo arriba de eso
+
+    Retorna un diccionario con score, estrategia, n, muestra e intervalo_confianza.
+    """
+    if estrategia not in ESTRATEGIAS_SILHOUETTE:
+        raise ValueError(f"Estrategia de silhouette desconocida: {estrategia}")
+
+    n = len(labels)
+    if estrategia == 'auto':
+        estrategia = 'exacta' if n <= umbral_exacto else 'muestreo'
+
+    detalle = {'estrategia': estrategia, 'n': n, 'muestra': n, 'intervalo_confianza': None}
+    if estrategia == 'exacta':
+        from sklearn.metrics import silhouette_score
+        detalle['score'] = float(silhouette_score(X, labels, metric='euclidean'))
+    elif estrategia == 'muestreo':
+        score, intervalo, m = silhouette_muestreo(X, labels, tamano_muestra=tamano_muestra)
+        detalle.update(score=score, muestra=m, intervalo_confianza=[round(intervalo[0], 4), round(intervalo[1], 4)])
+    else:
+        detalle['score'] = silhouette_simplificada(X, labels)
+    return detalle
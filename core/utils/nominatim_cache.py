@@ -0,0 +1,295 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Directorio de la caché de Nominatim (antes un JSON por colonia, ahora un solo SQLite)
+NOMINATIM_CACHE_DIR = Path(__file__).resolve().parent.parent / "cache"
+NOMINATIM_CACHE_DB = NOMINATIM_CACHE_DIR / "nominatim.sqlite3"
+
+
+class NoEncontradoNominatim(RuntimeError):
+    """Nominatim respondió sin resultados; se guarda como resultado negativo"""
+
+
+def normalizar_consulta(consulta: str) -> str:
+    """Llave de la caché (la misma normalización que los antiguos nombres de archivo)"""
+    return re.sub(r'\W+', '_', consulta.lower())
+
+
+def _config(nombre, defecto):
+    try:
+        from django.conf import settings
+        return getattr(settings, nombre, defecto)
+    except Exception:
+        return defecto
+
+
+class LimitadorTasa:
+    """
+    Token bucket: `tasa` peticiones por segundo con ráfagas de hasta `capacidad`.
+
+    El estado (tokens y momento de la última recarga) vive en una fila de la
+    base SQLite de la caché, así que todos los workers de gunicorn comparten un
+    solo presupuesto. adquirir() reserva un token en una transacción
+    BEGIN IMMEDIATE (los tokens pueden quedar negativos: es la fila de espera)
+    y duerme fuera de ella hasta el turno reservado.
+    """
+
+    def __init__(self, tasa=1.0, capacidad=1, db_path=NOMINATIM_CACHE_DB, nombre='nominatim'):
+        self.tasa = float(tasa)
+        self.capacidad = float(capacidad)
+        self.db_path = Path(db_path)
+        self.nombre = nombre
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS limitador (
+                    nombre TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    ultimo REAL NOT NULL
+                )
+            """)
+
+    def _conectar(self):
+        # Sin transacciones implícitas: adquirir() abre la suya con BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _mover_tokens(self, delta):
+        """Recarga el bucket según el tiempo transcurrido, le suma `delta` y retorna los tokens resultantes"""
+        conn = self._conectar()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            ahora = time.time()
+            fila = conn.execute("SELECT tokens, ultimo FROM limitador WHERE nombre = ?", (self.nombre,)).fetchone()
+            tokens, ultimo = fila if fila else (self.capacidad, ahora)
+            tokens = min(self.capacidad, tokens + max(0.0, ahora - ultimo) * self.tasa)
+            tokens = min(self.capacidad, tokens + delta)
+            conn.execute("INSERT OR REPLACE INTO limitador VALUES (?, ?, ?)", (self.nombre, tokens, ahora))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return tokens
+
+    def _reservar(self):
+        """Toma un token y retorna cuántos segundos hay que esperar para usarlo"""
+        tokens = self._mover_tokens(-1)
+        return -tokens / self.tasa if tokens < 0 else 0.0
+
+    def devolver(self):
+        """Regresa al bucket un token reservado que no se llegó a usar"""
+        self._mover_tokens(1)
+
+    def adquirir(self, cancelado=None):
+        """
+        Reserva un token y espera su turno. Si `cancelado` (threading.Event) se
+        activa antes de usarlo, el token se devuelve, para no retrasar a los
+        demás workers, y retorna False.
+        """
+        espera = self._reservar()
+        if cancelado is None:
+            if espera > 0:
+                time.sleep(espera)
+            return True
+        if cancelado.wait(espera):
+            self.devolver()
+            return False
+        return True
+
+
+class _BusquedaEnCurso:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class CacheNominatim:
+    """
+    Caché de búsquedas de Nominatim en SQLite (una tabla indexada por la
+    consulta normalizada) con:
+
+        - TTL para resultados positivos (NOMINATIM_CACHE_TTL_HORAS)
+        - caché negativa para nombres sin resultados (NOMINATIM_CACHE_TTL_NEGATIVO_HORAS)
+        - agrupación de búsquedas simultáneas: N peticiones por el mismo nombre
+          producen una sola consulta a Nominatim y las demás esperan su resultado
+
+    Los errores de red no se guardan: la siguiente petición vuelve a intentar.
+    También se guarda la variación del nombre con la que Nominatim encontró la
+    colonia, para ir directo a ella cuando la entrada expira.
+    """
+
+    def __init__(self, db_path=NOMINATIM_CACHE_DB):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._en_curso = {}
+        self._inicializar()
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _inicializar(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS busquedas (
+                    clave TEXT PRIMARY KEY,
+                    consulta TEXT NOT NULL,
+                    encontrado INTEGER NOT NULL,
+                    datos TEXT,
+                    error TEXT,
+                    fecha REAL NOT NULL,
+                    expira REAL NOT NULL,
+                    variacion TEXT
+                )
+            """)
+            columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(busquedas)")}
+            if 'variacion' not in columnas:
+                conn.execute("ALTER TABLE busquedas ADD COLUMN variacion TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS busquedas_expira ON busquedas (expira)")
+            vacia = conn.execute("SELECT COUNT(*) FROM busquedas").fetchone()[0] == 0
+        if vacia:
+            self._importar_archivos_json()
+
+    def _importar_archivos_json(self):
+        """Migra una sola vez los JSON sueltos de core/cache al almacén"""
+        archivos = list(self.db_path.parent.glob("*.json"))
+        if not archivos:
+            return
+        ahora = time.time()
+        expira = ahora + self._ttl_positivo()
+        filas = []
+        for archivo in archivos:
+            try:
+                with open(archivo, "r", encoding="utf-8") as f:
+                    datos = json.load(f)
+            except Exception:
+                continue
+            if datos:
+                filas.append((archivo.stem, archivo.stem, 1, json.dumps(datos), None, ahora, expira, None))
+        with self._conectar() as conn:
+            conn.executemany("INSERT OR IGNORE INTO busquedas VALUES (?, ?, ?, ?, ?, ?, ?, ?)", filas)
+        print(f"📦 Caché de Nominatim: {len(filas)} búsquedas importadas de archivos JSON")
+
+    def _ttl_positivo(self):
+        return float(_config('NOMINATIM_CACHE_TTL_HORAS', 720)) * 3600
+
+    def _ttl_negativo(self):
+        return float(_config('NOMINATIM_CACHE_TTL_NEGATIVO_HORAS', 6)) * 3600
+
+    def _leer(self, clave):
+        with self._conectar() as conn:
+            return conn.execute(
+                "SELECT encontrado, datos, error FROM busquedas WHERE clave = ? AND expira > ?",
+                (clave, time.time())
+            ).fetchone()
+
+    def _variacion_previa(self, clave):
+        """Variación que encontró la colonia la última vez (aunque la entrada haya expirado)"""
+        with self._conectar() as conn:
+            fila = conn.execute(
+                "SELECT variacion FROM busquedas WHERE clave = ? AND encontrado = 1", (clave,)
+            ).fetchone()
+        return fila[0] if fila else None
+
+    def _guardar(self, clave, consulta, encontrado, datos=None, error=None, variacion=None):
+        ahora = time.time()
+        ttl = self._ttl_positivo() if encontrado else self._ttl_negativo()
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO busquedas VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (clave, consulta, int(encontrado), json.dumps(datos) if datos is not None else None,
+                 error, ahora, ahora + ttl, variacion)
+            )
+
+    def _resultado_de_fila(self, fila):
+        encontrado, datos, error = fila
+        if not encontrado:
+            raise NoEncontradoNominatim(error)
+        return json.loads(datos)
+
+    def buscar(self, consulta, resolver):
+        """
+        Retorna la lista de resultados de Nominatim para `consulta`.
+
+        `resolver(consulta, variacion_previa)` hace la consulta real y retorna
+        (resultados, variación usada); debe lanzar NoEncontradoNominatim si no
+        hay resultados.
+        """
+        clave = normalizar_consulta(consulta)
+        fila = self._leer(clave)
+        if fila is not None:
+            print(f"⚡ Nominatim desde caché: '{consulta}'{' (sin resultados)' if not fila[0] else ''}")
+            return self._resultado_de_fila(fila)
+
+        with self._lock:
+            pendiente = self._en_curso.get(clave)
+            lider = pendiente is None
+            if lider:
+                pendiente = self._en_curso[clave] = _BusquedaEnCurso()
+
+        if not lider:
+            print(f"⏳ Esperando búsqueda en curso de '{consulta}'")
+            pendiente.evento.wait()
+            if pendiente.error is not None:
+                raise pendiente.error
+            return pendiente.resultado
+
+        try:
+            # Otro proceso pudo haberla guardado mientras tanto
+            fila = self._leer(clave)
+            if fila is not None:
+                pendiente.resultado = self._resultado_de_fila(fila)
+                return pendiente.resultado
+            pendiente.resultado, variacion = resolver(consulta, self._variacion_previa(clave))
+            self._guardar(clave, consulta, True, datos=pendiente.resultado, variacion=variacion)
+            return pendiente.resultado
+        except NoEncontradoNominatim as e:
+            self._guardar(clave, consulta, False, error=str(e))
+            pendiente.error = e
+            raise
+        except Exception as e:
+            pendiente.error = e
+            raise
+        finally:
+            with self._lock:
+                self._en_curso.pop(clave, None)
+            pendiente.evento.set()
+
+    def purgar_expirados(self):
+        with self._conectar() as conn:
+            return conn.execute("DELETE FROM busquedas WHERE expira <= ?", (time.time(),)).rowcount
+
+
+_cache = None
+_limitador = None
+_singleton_lock = threading.Lock()
+
+
+def get_cache_nominatim() -> CacheNominatim:
+    global _cache
+    with _singleton_lock:
+        if _cache is None:
+            _cache = CacheNominatim()
+        return _cache
+
+
+def get_limitador_nominatim() -> LimitadorTasa:
+    """Limitador compartido por todas las peticiones a Nominatim de todos los procesos (política de 1 req/s)"""
+    global _limitador
+    cache = get_cache_nominatim()
+    with _singleton_lock:
+        if _limitador is None:
+            _limitador = LimitadorTasa(tasa=float(_config('NOMINATIM_REQ_POR_SEGUNDO', 1)), capacidad=1,
+                                       db_path=cache.db_path)
+        return _limitador
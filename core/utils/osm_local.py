@@ -0,0 +1,405 @@
+import json
+import math
+import os
+import re
+import sqlite3
+from pathlib import Path
+
+# Almacén local por defecto del extracto regional de OSM
+OSM_EXTRACT_DB = Path(__file__).resolve().parent.parent / "osm_extract" / "extracto.sqlite3"
+
+# Filtros de vías equivalentes a los de osmnx 1.3 por tipo de red (clave -> regex que EXCLUYE la vía)
+FILTROS_RED = {
+    'walk': {
+        'highway': r'abandoned|bus_guideway|construction|cycleway|motor|planned|platform|proposed|raceway',
+        'area': r'yes',
+        'access': r'private',
+        'foot': r'no',
+        'service': r'private',
+    },
+    'drive': {
+        'highway': r'abandoned|bridleway|bus_guideway|construction|corridor|cycleway|elevator|escalator|footway|path|pedestrian|planned|platform|proposed|raceway|service|steps|track',
+        'area': r'yes',
+        'access': r'private',
+        'motor_vehicle': r'no',
+        'motorcar': r'no',
+        'service': r'alley|driveway|emergency_access|parking|parking_aisle|private',
+    },
+    'all': {
+        'highway': r'abandoned|construction|planned|platform|proposed|raceway',
+        'area': r'yes',
+    },
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS nodos (
+    id INTEGER PRIMARY KEY,
+    lon REAL NOT NULL,
+    lat REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vias (
+    id INTEGER PRIMARY KEY,
+    tags TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS via_nodos (
+    via_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    nodo_id INTEGER NOT NULL,
+    PRIMARY KEY (via_id, seq)
+) WITHOUT ROWID;
+CREATE VIRTUAL TABLE IF NOT EXISTS vias_rtree USING rtree(
+    id, min_lon, max_lon, min_lat, max_lat
+);
+CREATE TABLE IF NOT EXISTS metadatos (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+
+def ruta_extracto():
+    """Ruta del almacén local (settings.OSM_EXTRACT_DB o el valor por defecto)"""
+    try:
+        from django.conf import settings
+        return Path(getattr(settings, 'OSM_EXTRACT_DB', OSM_EXTRACT_DB))
+    except Exception:
+        return OSM_EXTRACT_DB
+
+
+def extracto_disponible(db_path=None) -> bool:
+    return Path(db_path or ruta_extracto()).exists()
+
+
+def usar_extracto_local() -> bool:
+    """
+    Decide la fuente del grafo según settings.OSM_FUENTE:
+        - auto: extracto local si ya fue cargado, Overpass en caso contrario
+        - local: siempre el extracto (error si no existe)
+        - overpass: siempre descarga en vivo
+    """
+    try:
+        from django.conf import settings
+        fuente = getattr(settings, 'OSM_FUENTE', 'auto')
+    except Exception:
+        fuente = 'auto'
+    if fuente == 'overpass':
+        return False
+    if fuente == 'local' and not extracto_disponible():
+        raise RuntimeError(f"OSM_FUENTE=local pero no existe el extracto {ruta_extracto()}; ejecuta 'manage.py cargar_extracto_osm'")
+    return extracto_disponible()
+
+
+def fuente_grafo() -> str:
+    """
+    Identificador de la fuente de los grafos para las llaves de caché:
+    'overpass', o 'local-<mtime>' del extracto (cambia al recargarlo con
+    manage.py cargar_extracto_osm).
+    """
+    if not usar_extracto_local():
+        return 'overpass'
+    try:
+        return f"local-{os.stat(ruta_extracto()).st_mtime_ns:x}"
+    except OSError:
+        return 'local'
+
+
+# ================================
+# CARGA DEL EXTRACTO
+# ================================
+
+class CargadorExtractoOSM:
+    """
+    Carga nodos y vías (solo las que tienen 'highway') de un extracto OSM a
+    SQLite, en lotes. Al finalizar calcula el bounding box de cada vía en un
+    índice R*Tree y descarta los nodos que no pertenecen a ninguna vía.
+    """
+
+    TAMANO_LOTE = 50_000
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;")
+        self.conn.executescript(ESQUEMA)
+        self._nodos, self._vias, self._via_nodos = [], [], []
+        self.total_nodos = 0
+        self.total_vias = 0
+
+    def agregar_nodo(self, nodo_id, lon, lat):
+        self._nodos.append((nodo_id, lon, lat))
+        if len(self._nodos) >= self.TAMANO_LOTE:
+            self._vaciar_nodos()
+
+    def agregar_via(self, via_id, nodos, tags):
+        if 'highway' not in tags or len(nodos) < 2:
+            return
+        self._vias.append((via_id, json.dumps(tags, ensure_ascii=False)))
+        self._via_nodos.extend((via_id, seq, nodo_id) for seq, nodo_id in enumerate(nodos))
+        if len(self._via_nodos) >= self.TAMANO_LOTE:
+            self._vaciar_vias()
+
+    def _vaciar_nodos(self):
+        self.conn.executemany("INSERT OR REPLACE INTO nodos VALUES (?, ?, ?)", self._nodos)
+        self.total_nodos += len(self._nodos)
+        self._nodos = []
+
+    def _vaciar_vias(self):
+        self.conn.executemany("INSERT OR REPLACE INTO vias VALUES (?, ?)", self._vias)
+        self.conn.executemany("INSERT OR REPLACE INTO via_nodos VALUES (?, ?, ?)", self._via_nodos)
+        self.total_vias += len(self._vias)
+        self._vias, self._via_nodos = [], []
+
+    def finalizar(self, origen=''):
+        self._vaciar_nodos()
+        self._vaciar_vias()
+        print("🗂️ Construyendo índice espacial de vías...")
+        self.conn.execute("DELETE FROM vias_rtree")
+        self.conn.execute("""
+            INSERT INTO vias_rtree (id, min_lon, max_lon, min_lat, max_lat)
+            SELECT vn.via_id, MIN(n.lon), MAX(n.lon), MIN(n.lat), MAX(n.lat)
+            FROM via_nodos vn JOIN nodos n ON n.id = vn.nodo_id
+            GROUP BY vn.via_id
+        """)
+        print("🧹 Descartando nodos que no pertenecen a vías...")
+        self.conn.execute("DELETE FROM nodos WHERE id NOT IN (SELECT nodo_id FROM via_nodos)")
+        self.conn.executemany("INSERT OR REPLACE INTO metadatos VALUES (?, ?)", [
+            ('origen', str(origen)),
+            ('total_vias', str(self.total_vias)),
+        ])
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+        self.conn.close()
+
+
+def cargar_osm_xml(archivo, cargador):
+    """
+    Lee un extracto .osm (XML) en streaming con iterparse.
+
+    Limpiar cada elemento no basta: la raíz <osm> conserva la referencia a
+    todos sus hijos ya leídos, así que se vacía al terminar cada elemento de
+    primer nivel para que la memoria no crezca con el tamaño del extracto.
+    """
+    import xml.etree.ElementTree as ET
+
+    raiz = None
+    via_id, via_nodos, via_tags = None, [], {}
+    for evento, elem in ET.iterparse(str(archivo), events=('start', 'end')):
+        if evento == 'start':
+            if raiz is None:
+                raiz = elem
+            elif elem.tag == 'way':
+                via_id, via_nodos, via_tags = int(elem.get('id')), [], {}
+            continue
+        if elem.tag == 'node':
+            cargador.agregar_nodo(int(elem.get('id')), float(elem.get('lon')), float(elem.get('lat')))
+        elif elem.tag == 'nd' and via_id is not None:
+            via_nodos.append(int(elem.get('ref')))
+            continue
+        elif elem.tag == 'tag' and via_id is not None:
+            via_tags[elem.get('k')] = elem.get('v')
+            continue
+        elif elem.tag == 'way':
+            cargador.agregar_via(via_id, via_nodos, via_tags)
+            via_id = None
+        elif elem.tag != 'relation':
+            continue
+        raiz.clear()
+
+
+def cargar_osm_pbf(archivo, cargador):
+    """Lee un extracto .osm.pbf con pyosmium (dependencia opcional)"""
+    try:
+        import osmium
+    except ImportError:
+        raise RuntimeError("Para leer archivos .osm.pbf instala pyosmium (pip install osmium) o usa un extracto .osm XML")
+
+    class Manejador(osmium.SimpleHandler):
+        def node(self, n):
+            cargador.agregar_nodo(n.id, n.location.lon, n.location.lat)
+
+        def way(self, w):
+            cargador.agregar_via(w.id, [nd.ref for nd in w.nodes], {t.k: t.v for t in w.tags})
+
+    Manejador().apply_file(str(archivo))
+
+
+def cargar_extracto(archivo, db_path=None):
+    """
+    Carga un extracto .osm.pbf u .osm al almacén local, reemplazando el anterior.
+
+    El almacén se construye en un archivo temporal junto al destino y se
+    renombra al terminar (como guardar_grafo_disco), para que los workers
+    sigan leyendo el extracto anterior completo mientras dura la carga.
+    """
+    archivo = Path(archivo)
+    db_path = Path(db_path or ruta_extracto())
+    tmp_path = db_path.with_suffix('.tmp')
+    if tmp_path.exists():
+        tmp_path.unlink()
+    cargador = CargadorExtractoOSM(tmp_path)
+    try:
+        if archivo.name.endswith('.pbf'):
+            cargar_osm_pbf(archivo, cargador)
+        else:
+            cargar_osm_xml(archivo, cargador)
+        cargador.finalizar(origen=archivo.name)
+        os.replace(tmp_path, db_path)
+    except Exception:
+        cargador.conn.close()
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+    return {'nodos': cargador.total_nodos, 'vias': cargador.total_vias, 'db': str(db_path)}
+
+
+# ================================
+# CONSTRUCCIÓN DE GRAFOS (RECORTE LOCAL)
+# ================================
+
+def _haversine_m(lon1, lat1, lon2, lat2):
+    radio = 6_371_009  # mismo radio terrestre que osmnx
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    h = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * radio * math.asin(math.sqrt(min(1.0, h)))
+
+
+def via_permitida(tags, network_type='walk') -> bool:
+    """True si la vía pasa el filtro del tipo de red (mismas exclusiones que osmnx)"""
+    if 'highway' not in tags:
+        return False
+    for clave, patron in FILTROS_RED.get(network_type, FILTROS_RED['walk']).items():
+        valor = tags.get(clave)
+        if valor is not None and re.search(patron, valor):
+            return False
+    return True
+
+
+def grafo_desde_extracto(geojson, network_type='walk', db_path=None):
+    """
+    Construye el grafo no dirigido de calles de un polígono recortando el
+    extracto local, sin llamadas de red.
+
+    Replica el resultado de ox.graph_from_polygon + nx.Graph: se conservan solo
+    los nodos dentro del polígono, se simplifica la topología (solo
+    intersecciones y extremos son nodos; la forma queda en 'geometry') y se
+    retiene la componente conexa más grande.
+    """
+    import networkx as nx
+    import numpy as np
+    import shapely
+    from shapely.geometry import shape, LineString
+
+    poligono = shape(geojson["geometry"] if "geometry" in geojson else geojson)
+    min_lon, min_lat, max_lon, max_lat = poligono.bounds
+
+    conn = sqlite3.connect(f"file:{db_path or ruta_extracto()}?mode=ro", uri=True)
+    try:
+        filas = conn.execute("""
+            SELECT v.id, v.tags FROM vias_rtree r JOIN vias v ON v.id = r.id
+            WHERE r.max_lon >= ? AND r.min_lon <= ? AND r.max_lat >= ? AND r.min_lat <= ?
+        """, (min_lon, max_lon, min_lat, max_lat)).fetchall()
+        vias = {}
+        for via_id, tags_json in filas:
+            tags = json.loads(tags_json)
+            if via_permitida(tags, network_type):
+                vias[via_id] = tags
+
+        conn.execute("CREATE TEMP TABLE vias_consulta (id INTEGER PRIMARY KEY)")
+        conn.executemany("INSERT INTO vias_consulta VALUES (?)", ((i,) for i in vias))
+        puntos = conn.execute("""
+            SELECT vn.via_id, vn.nodo_id, n.lon, n.lat
+            FROM vias_consulta q
+            JOIN via_nodos vn ON vn.via_id = q.id
+            JOIN nodos n ON n.id = vn.nodo_id
+            ORDER BY vn.via_id, vn.seq
+        """).fetchall()
+    finally:
+        conn.close()
+
+    if not puntos:
+        raise ValueError("El extracto local no tiene calles dentro del polígono")
+
+    # Recorte: qué nodos quedan dentro del polígono (vectorizado con shapely 2)
+    coords = {}
+    for _, nodo_id, lon, lat in puntos:
+        coords[nodo_id] = (lon, lat)
+    ids = np.fromiter(coords.keys(), dtype=np.int64, count=len(coords))
+    xy = np.array(list(coords.values()), dtype=np.float64)
+    dentro_mask = shapely.contains_xy(poligono, xy[:, 0], xy[:, 1]) | shapely.touches(poligono, shapely.points(xy))
+    dentro = set(ids[dentro_mask].tolist())
+
+    # Partir cada vía en tramos de nodos consecutivos dentro del polígono
+    tramos = []
+    via_actual, tramo = None, []
+    for via_id, nodo_id, _, _ in puntos:
+        if via_id != via_actual:
+            if len(tramo) > 1:
+                tramos.append((via_actual, tramo))
+            via_actual, tramo = via_id, []
+        if nodo_id in dentro:
+            tramo.append(nodo_id)
+        else:
+            if len(tramo) > 1:
+                tramos.append((via_actual, tramo))
+            tramo = []
+    if len(tramo) > 1:
+        tramos.append((via_actual, tramo))
+
+    # Nodos del grafo simplificado: extremos de tramo y nodos compartidos por más de un tramo
+    apariciones = {}
+    for _, tramo in tramos:
+        for nodo_id in tramo:
+            apariciones[nodo_id] = apariciones.get(nodo_id, 0) + 1
+    extremos = {n for n, c in apariciones.items() if c > 1}
+    for _, tramo in tramos:
+        extremos.add(tramo[0])
+        extremos.add(tramo[-1])
+
+    G = nx.Graph()
+    G.graph['crs'] = 'epsg:4326'
+    G.graph['fuente'] = 'extracto_local'
+    for via_id, tramo in tramos:
+        tags = vias[via_id]
+        inicio = 0
+        for i in range(1, len(tramo)):
+            if tramo[i] not in extremos:
+                continue
+            segmento = tramo[inicio:i + 1]
+            inicio = i
+            u, v = segmento[0], segmento[-1]
+            puntos_segmento = [coords[n] for n in segmento]
+            longitud = sum(
+                _haversine_m(*puntos_segmento[j], *puntos_segmento[j + 1])
+                for j in range(len(puntos_segmento) - 1)
+            )
+            # Entre dos nodos se conserva la arista más corta (nx.Graph no admite paralelas)
+            if G.has_edge(u, v) and G.edges[u, v]['length'] <= longitud:
+                continue
+            atributos = {
+                'osmid': via_id,
+                'highway': tags.get('highway'),
+                'length': longitud,
+            }
+            if 'name' in tags:
+                atributos['name'] = tags['name']
+            if len(segmento) > 2:
+                atributos['geometry'] = LineString(puntos_segmento)
+            G.add_edge(u, v, **atributos)
+
+    for nodo_id in G.nodes:
+        lon, lat = coords[nodo_id]
+        G.nodes[nodo_id]['x'] = lon
+        G.nodes[nodo_id]['y'] = lat
+        G.nodes[nodo_id]['street_count'] = G.degree(nodo_id)
+
+    # Igual que osmnx con retain_all=False: solo la componente conexa más grande
+    if G.number_of_nodes() and not nx.is_connected(G):
+        mayor = max(nx.connected_components(G), key=len)
+        G = G.subgraph(mayor).copy()
+
+    if G.number_of_nodes() == 0:
+        raise ValueError("El extracto local no tiene calles dentro del polígono")
+    return G
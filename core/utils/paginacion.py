@@ -0,0 +1,32 @@
+import base64
+import json
+
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 200
+
+
+def leer_limite(valor, defecto=LIMITE_POR_DEFECTO, maximo=LIMITE_MAXIMO):
+    """Tamaño de página de un parámetro GET, acotado a [1, maximo]"""
+    try:
+        limite = int(valor) if valor not in (None, '') else defecto
+    except (TypeError, ValueError):
+        raise ValueError('El parámetro limite debe ser un entero')
+    return max(1, min(limite, maximo))
+
+
+def codificar_cursor(*valores):
+    """Cursor opaco con los valores de la llave de orden del último elemento de la página"""
+    texto = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in valores], separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decodificar_cursor(cursor, cantidad):
+    """Lista con los `cantidad` valores del cursor; ValueError si está mal formado"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode('utf-8'))
+    except Exception:
+        raise ValueError('Cursor inválido')
+    if not isinstance(valores, list) or len(valores) != cantidad:
+        raise ValueError('Cursor inválido')
+    return valores
@@ -0,0 +1,144 @@
+# Precisión por defecto del formato de Google (5 decimales ≈ 1.1 m)
+PRECISION_POLILINEA = 5
+# Tolerancia de Douglas-Peucker por defecto, en metros
+TOLERANCIA_SIMPLIFICACION_M = 1.0
+
+METROS_POR_GRADO = 111320.0
+
+
+def _config(nombre, defecto):
+    try:
+        from django.conf import settings
+        return getattr(settings, nombre, defecto)
+    except Exception:
+        return defecto
+
+
+def precision_polilinea():
+    return int(_config('RUTAS_PRECISION_POLILINEA', PRECISION_POLILINEA))
+
+
+def tolerancia_simplificacion_m():
+    return float(_config('RUTAS_TOLERANCIA_SIMPLIFICACION_M', TOLERANCIA_SIMPLIFICACION_M))
+
+
+def _codificar_valor(valor):
+    valor = ~(valor << 1) if valor < 0 else valor << 1
+    caracteres = []
+    while valor >= 0x20:
+        caracteres.append(chr((0x20 | (valor & 0x1f)) + 63))
+        valor >>= 5
+    caracteres.append(chr(valor + 63))
+    return ''.join(caracteres)
+
+
+def codificar_polilinea(coords, precision=PRECISION_POLILINEA):
+    """
+    Google encoded polyline de una línea [lon, lat]: cada coordenada se
+    cuantiza a `precision` decimales y se guarda como diferencia con la
+    anterior (el formato va en orden lat, lon).
+    """
+    factor = 10 ** precision
+    partes = []
+    lat_previa = lon_previa = 0
+    for lon, lat in coords:
+        lat_entera = int(round(lat * factor))
+        lon_entera = int(round(lon * factor))
+        partes.append(_codificar_valor(lat_entera - lat_previa))
+        partes.append(_codificar_valor(lon_entera - lon_previa))
+        lat_previa, lon_previa = lat_entera, lon_entera
+    return ''.join(partes)
+
+
+def decodificar_polilinea(texto, precision=PRECISION_POLILINEA):
+    """Inverso de codificar_polilinea: lista de [lon, lat]"""
+    factor = 10 ** precision
+    coords = []
+    indice = lat = lon = 0
+    while indice < len(texto):
+        deltas = []
+        for _ in range(2):
+            resultado = desplazamiento = 0
+            while True:
+                byte = ord(texto[indice]) - 63
+                indice += 1
+                resultado |= (byte & 0x1f) << desplazamiento
+                desplazamiento += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(resultado >> 1) if resultado & 1 else resultado >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coords.append([lon / factor, lat / factor])
+    return coords
+
+
+def unir_y_simplificar(lineas, tolerancia_m=None):
+    """
+    Une las aristas contiguas en polilíneas largas (shapely.line_merge, en los
+    nodos donde solo se tocan dos aristas) y las simplifica con
+    Douglas-Peucker. `lineas` y el resultado son listas de líneas [lon, lat].
+    """
+    import shapely
+    from shapely.geometry import MultiLineString
+
+    lineas = [linea for linea in lineas if len(linea) >= 2]
+    if not lineas:
+        return []
+    if tolerancia_m is None:
+        tolerancia_m = tolerancia_simplificacion_m()
+
+    unidas = shapely.line_merge(MultiLineString(lineas))
+    if tolerancia_m > 0:
+        # Grados de latitud: en longitud la tolerancia real queda por debajo de tolerancia_m
+        unidas = unidas.simplify(tolerancia_m / METROS_POR_GRADO, preserve_topology=False)
+    return [list(linea.coords) for linea in getattr(unidas, 'geoms', [unidas]) if not linea.is_empty]
+
+
+def codificar_lineas(lineas, precision=None, tolerancia_m=None):
+    """Une, simplifica y codifica una lista de líneas [lon, lat] como polilíneas"""
+    if precision is None:
+        precision = precision_polilinea()
+    return [codificar_polilinea(linea, precision) for linea in unir_y_simplificar(lineas, tolerancia_m)]
+
+
+def codificar_geojson(geojson, precision=None, tolerancia_m=None):
+    """
+    Versión compacta de una FeatureCollection de MultiLineString (la de
+    geojson_zonas): mismas propiedades, con las líneas de cada feature unidas,
+    simplificadas y como polilíneas codificadas.
+
+        {'formato': 'polyline', 'precision': 5, 'features': [{'properties': {...}, 'lineas': ['...']}]}
+    """
+    if precision is None:
+        precision = precision_polilinea()
+    return {
+        'formato': 'polyline',
+        'precision': precision,
+        'features': [
+            {
+                'properties': feature.get('properties') or {},
+                'lineas': codificar_lineas(feature['geometry']['coordinates'], precision, tolerancia_m),
+            }
+            for feature in geojson.get('features', [])
+        ],
+    }
+
+
+def decodificar_geojson(geometria):
+    """FeatureCollection a partir de la versión compacta de codificar_geojson"""
+    precision = geometria.get('precision', PRECISION_POLILINEA)
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'properties': feature.get('properties') or {},
+                'geometry': {
+                    'type': 'MultiLineString',
+                    'coordinates': [decodificar_polilinea(linea, precision) for linea in feature.get('lineas', [])],
+                },
+            }
+            for feature in geometria.get('features', [])
+        ],
+    }
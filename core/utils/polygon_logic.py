@@ -1,12 +1,16 @@
 import json
+import os
 from pathlib import Path
 
-def get_colonia_config(cache_path: str) -> dict:
+def get_colonia_config(resultados) -> dict:
     """
-    Lee el archivo de cache y construye la configuración para el editor.
+    Construye la configuración para el editor a partir de los resultados de
+    Nominatim (lista retornada por download_bbox) o de un archivo JSON con ellos.
     """
-    with open(cache_path, "r", encoding="utf-8") as f:
-        data = json.load(f)[0]
+    if isinstance(resultados, (str, os.PathLike)):
+        with open(resultados, "r", encoding="utf-8") as f:
+            resultados = json.load(f)
+    data = resultados[0]
 
     bbox = [float(x) for x in data["boundingbox"]]  # [south, north, west, east]
     center_lat = (bbox[0] + bbox[1]) / 2
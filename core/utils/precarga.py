@@ -0,0 +1,79 @@
+import importlib
+import subprocess
+import sys
+import time
+
+# Módulos pesados que solo necesitan las rutas de división de polígonos y de
+# predicción; las vistas los importan la primera vez que se usan.
+MODULOS_PESADOS = [
+    'numpy',
+    'pandas',
+    'shapely',
+    'networkx',
+    'geopandas',
+    'matplotlib.pyplot',
+    'folium',
+    'osmnx',
+    'sklearn.ensemble',
+    'requests',
+    'core.utils.main',
+    'core.utils.random_forest_predictor',
+]
+
+
+def precargar_modulos(modulos=None):
+    """
+    Importa el stack geo/ML en el proceso actual y retorna {módulo: segundos}.
+
+    Con PRECARGAR_STACK_GEO=True, wsgi.py la llama al cargar la aplicación; si
+    gunicorn corre con --preload eso ocurre en el proceso maestro y los
+    workers comparten esas páginas copy-on-write en lugar de importar cada uno.
+    """
+    tiempos = {}
+    for modulo in modulos or MODULOS_PESADOS:
+        inicio = time.perf_counter()
+        try:
+            importlib.import_module(modulo)
+        except Exception as e:
+            print(f"⚠️ No se pudo precargar {modulo}: {e}")
+            continue
+        tiempos[modulo] = time.perf_counter() - inicio
+    print(f"📚 Stack geo/ML precargado: {len(tiempos)} módulos en {sum(tiempos.values()):.2f} s")
+    return tiempos
+
+
+_SCRIPT_MEDICION = """
+import importlib, json, resource, sys, time
+import django
+django.setup()
+rss_inicial = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+inicio = time.perf_counter()
+importlib.import_module(sys.argv[1])
+print(json.dumps({
+    'segundos': time.perf_counter() - inicio,
+    'rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_inicial,
+}))
+"""
+
+
+def medir_importacion(modulo, timeout=300):
+    """
+    Costo de importar `modulo` en un intérprete nuevo (con Django ya
+    configurado): {'segundos', 'rss_kb'} o {'error'}. Cada módulo se mide por
+    separado, así que incluye el costo de sus dependencias.
+    """
+    import json
+    import os
+
+    entorno = dict(os.environ)
+    entorno.setdefault('DJANGO_SETTINGS_MODULE', 'routes_project.settings')
+    try:
+        salida = subprocess.run(
+            [sys.executable, '-c', _SCRIPT_MEDICION, modulo],
+            capture_output=True, text=True, timeout=timeout, env=entorno,
+        )
+    except subprocess.TimeoutExpired:
+        return {'error': 'tiempo agotado'}
+    if salida.returncode != 0:
+        return {'error': (salida.stderr.strip().splitlines() or ['error desconocido'])[-1]}
+    return json.loads(salida.stdout.strip().splitlines()[-1])
@@ -14,6 +14,7 @@ import requests
 
 import matplotlib.pyplot as plt
 import networkx as nx
+from core.utils.osm_local import usar_extracto_local, grafo_desde_extracto
 
 def sanitize_filename(name: str) -> str:
     return re.sub(r'\W+', '_', name.lower())
@@ -67,9 +68,12 @@ def download_graph(place_name: str):
     # Caso 1: Usamos geojson si hay polígono válido
     if geometry_type in ["Polygon", "MultiPolygon"] and "coordinates" in geojson:
         print("Generando grafo desde geojson (polígono)...")
-        geometry = shape(geojson)
-        G = ox.graph_from_polygon(geometry, network_type='walk')
-        G = nx.Graph(G)
+        if usar_extracto_local():
+            G = grafo_desde_extracto(geojson, network_type='walk')
+        else:
+            geometry = shape(geojson)
+            G = ox.graph_from_polygon(geometry, network_type='walk')
+            G = nx.Graph(G)
     # Caso 2: Creamos un polígono rectangular a partir del bounding box ------ tenemos que manejar siempre a logica del bbox dado a que se usara mas adelante
     else:
         print("Generando grafo desde bounding box (como polígono)...")
@@ -80,9 +84,12 @@ def download_graph(place_name: str):
             (west, north),
         ]
         polygon = Polygon(polygon_coords)
-        gdf = gpd.GeoDataFrame(index=[0], geometry=[polygon], crs="EPSG:4326")
-        G = ox.graph_from_polygon(gdf.geometry[0], network_type='drive')
-        G = nx.Graph(G)
+        if usar_extracto_local():
+            G = grafo_desde_extracto(polygon.__geo_interface__, network_type='drive')
+        else:
+            gdf = gpd.GeoDataFrame(index=[0], geometry=[polygon], crs="EPSG:4326")
+            G = ox.graph_from_polygon(gdf.geometry[0], network_type='drive')
+            G = nx.Graph(G)
     return G
 
 #### --------------------------------------------Division de grafo
@@ -0,0 +1,231 @@
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# Caché en disco de tiles: TILES_CACHE_DIR/<configuracion>/<versión>/<z>/<x>/<y>.<formato>
+TILES_CACHE_DIR = Path(__file__).resolve().parent.parent / "tiles_cache"
+
+EXTENSION_MVT = 4096
+# Margen alrededor de cada tile (fracción del tile) para que las líneas no se corten en el borde
+MARGEN_TILE = 0.05
+# A zoom 19 un tile mide ~75 m: más cerca el cliente reusa los tiles de este zoom
+ZOOM_MAXIMO = 19
+
+
+def tile_valido(z, x, y) -> bool:
+    return 0 <= z <= ZOOM_MAXIMO and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def limites_tile(z, x, y):
+    """(min_lon, min_lat, max_lon, max_lat) del tile XYZ en Web Mercator"""
+    n = 2 ** z
+
+    def lat(yy):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * yy / n))))
+
+    return (x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y))
+
+
+def tolerancia_para_zoom(z):
+    """
+    Tolerancia de Douglas-Peucker (grados) para un zoom: medio píxel de un
+    tile de 256 px, así la simplificación no se nota en pantalla.
+    """
+    return 360.0 / (256 * 2 ** z) / 2
+
+
+def version_mapa(mapa_calculado):
+    """Versión de las rutas (cambia cada vez que se recalculan)"""
+    return (mapa_calculado or {}).get('version') or 'v0'
+
+
+class _IndiceRutas:
+    """Líneas de las zonas de una configuración con un STRtree para recortar por tile"""
+
+    def __init__(self, geojson):
+        import shapely
+        from shapely import STRtree
+        from shapely.geometry import LineString
+
+        self.lineas = []
+        self.propiedades = []
+        for feature in geojson.get('features', []):
+            props = feature.get('properties') or {}
+            for coords in feature['geometry']['coordinates']:
+                if len(coords) >= 2:
+                    self.lineas.append(LineString(coords))
+                    self.propiedades.append(props)
+        self.tree = STRtree(self.lineas)
+        # (min_lon, min_lat, max_lon, max_lat) de todas las rutas; None si no hay líneas
+        self.limites = tuple(shapely.total_bounds(self.lineas).tolist()) if self.lineas else None
+
+    def intersecta(self, limites):
+        """True si la caja `limites` toca el rectángulo que envuelve las rutas"""
+        if self.limites is None:
+            return False
+        min_lon, min_lat, max_lon, max_lat = limites
+        return not (max_lon < self.limites[0] or min_lon > self.limites[2]
+                    or max_lat < self.limites[1] or min_lat > self.limites[3])
+
+    def recortar(self, limites, tolerancia):
+        """Líneas que tocan `limites`, recortadas y simplificadas, agrupadas por zona"""
+        from shapely.geometry import box
+
+        caja = box(*limites)
+        por_zona = OrderedDict()
+        for i in self.tree.query(caja):
+            recorte = self.lineas[i].intersection(caja)
+            if recorte.is_empty:
+                continue
+            recorte = recorte.simplify(tolerancia, preserve_topology=False)
+            partes = getattr(recorte, 'geoms', [recorte])
+            props = self.propiedades[i]
+            clave = (props.get('zona'), bool(props.get('corte')))
+            if clave not in por_zona:
+                por_zona[clave] = (props, [])
+            por_zona[clave][1].extend(
+                list(parte.coords) for parte in partes
+                if parte.geom_type == 'LineString' and not parte.is_empty
+            )
+        return por_zona
+
+
+_indices = OrderedDict()
+_indices_lock = threading.Lock()
+MAX_INDICES_EN_MEMORIA = 8
+
+
+def _indice_configuracion(configuracion_id, version):
+    """Índice de líneas de la configuración (LRU pequeña por worker, llave id + versión)"""
+    from core.models import ConfiguracionRuta
+    from core.utils.geojson_rutas import geojson_de_mapa_calculado
+
+    clave = (configuracion_id, version)
+    with _indices_lock:
+        indice = _indices.get(clave)
+        if indice is not None:
+            _indices.move_to_end(clave)
+            return indice
+    # mapa_calculado solo se lee cuando hay que generar un tile que no está en disco
+    mapa_calculado = ConfiguracionRuta.objects.filter(id=configuracion_id).values_list('mapa_calculado', flat=True).first()
+    indice = _IndiceRutas(geojson_de_mapa_calculado(mapa_calculado))
+    with _indices_lock:
+        _indices[clave] = indice
+        while len(_indices) > MAX_INDICES_EN_MEMORIA:
+            _indices.popitem(last=False)
+    return indice
+
+
+def _geojson_tile(por_zona, precision):
+    features = []
+    for props, lineas in por_zona.values():
+        if not lineas:
+            continue
+        features.append({
+            'type': 'Feature',
+            'properties': props,
+            'geometry': {
+                'type': 'MultiLineString',
+                'coordinates': [[[round(x, precision), round(y, precision)] for x, y in linea] for linea in lineas],
+            },
+        })
+    return json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':')).encode('utf-8')
+
+
+def _mvt_tile(por_zona, z, x, y):
+    """Mapbox Vector Tile (requiere mapbox-vector-tile); coordenadas en píxeles del tile"""
+    import mapbox_vector_tile
+
+    n = 2 ** z
+
+    def a_tile(lon, lat):
+        px = ((lon + 180.0) / 360.0 * n - x) * EXTENSION_MVT
+        lat_rad = math.radians(lat)
+        py = ((1 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2 * n - y) * EXTENSION_MVT
+        return (round(px), round(py))
+
+    features = []
+    for props, lineas in por_zona.values():
+        if not lineas:
+            continue
+        features.append({
+            'geometry': {
+                'type': 'MultiLineString',
+                'coordinates': [[a_tile(lon, lat) for lon, lat in linea] for linea in lineas],
+            },
+            'properties': {k: v for k, v in props.items() if v is not None},
+        })
+    capa = [{'name': 'rutas', 'features': features}]
+    try:
+        return mapbox_vector_tile.encode(capa, default_options={'y_coord_down': True, 'extents': EXTENSION_MVT})
+    except TypeError:
+        # mapbox-vector-tile < 2.0
+        return mapbox_vector_tile.encode(capa, y_coord_down=True, extents=EXTENSION_MVT)
+
+
+def mvt_disponible() -> bool:
+    try:
+        import mapbox_vector_tile  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def ruta_tile(configuracion_id, version, z, x, y, formato):
+    return TILES_CACHE_DIR / str(configuracion_id) / version / str(z) / str(x) / f"{y}.{formato}"
+
+
+def obtener_tile(configuracion_id, version, z, x, y, formato='geojson'):
+    """
+    Bytes del tile (z, x, y) de las rutas de una configuración en la versión
+    `version` de su mapa_calculado, o None si el tile no tiene calles.
+
+    Se lee de la caché en disco si existe; si no, se recortan las líneas del
+    tile (con un pequeño margen), se simplifican según el zoom y se guarda con
+    escritura atómica. Solo se guardan tiles con calles: los que caen fuera
+    del rectángulo de las rutas ni siquiera se recortan, así que pedir z/x/y
+    arbitrarios no llena el disco.
+    """
+    archivo = ruta_tile(configuracion_id, version, z, x, y, formato)
+    if archivo.exists():
+        return archivo.read_bytes()
+
+    min_lon, min_lat, max_lon, max_lat = limites_tile(z, x, y)
+    margen_lon = (max_lon - min_lon) * MARGEN_TILE
+    margen_lat = (max_lat - min_lat) * MARGEN_TILE
+    limites = (min_lon - margen_lon, min_lat - margen_lat, max_lon + margen_lon, max_lat + margen_lat)
+
+    indice = _indice_configuracion(configuracion_id, version)
+    if not indice.intersecta(limites):
+        return None
+    por_zona = indice.recortar(limites, tolerancia_para_zoom(z))
+    if not any(lineas for _, lineas in por_zona.values()):
+        return None
+    if formato == 'mvt':
+        contenido = _mvt_tile(por_zona, z, x, y)
+    else:
+        # Suficientes decimales para 1/4 de píxel en este zoom
+        precision = max(5, min(7, int(math.ceil(math.log10(256 * 2 ** z / 360.0 * 4)))))
+        contenido = _geojson_tile(por_zona, precision)
+
+    archivo.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporal = tempfile.mkstemp(dir=archivo.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(contenido)
+        os.replace(temporal, archivo)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return contenido
+
+
+def eliminar_tiles_configuracion(configuracion_id):
+    """Borra todos los tiles en caché de una configuración (al recalcular sus rutas)"""
+    shutil.rmtree(TILES_CACHE_DIR / str(configuracion_id), ignore_errors=True)
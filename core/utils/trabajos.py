@@ -0,0 +1,341 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+# Pool local (uno por worker de gunicorn) como sustituto de Celery: el estado vive
+# en TrabajoProcesamiento, así que para usar Celery basta con que encolar_trabajo
+# despache ejecutar_trabajo(trabajo.id) como tarea.
+_executor = None
+_executor_lock = threading.Lock()
+
+# Último barrido de trabajos huérfanos en este proceso (time.monotonic())
+_ultimo_barrido = None
+_barrido_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Pool de workers del proceso, con tamaño settings.TRABAJOS_MAX_WORKERS"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from django.conf import settings
+            max_workers = int(getattr(settings, 'TRABAJOS_MAX_WORKERS', 2))
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='trabajo')
+        return _executor
+
+
+def encolar_trabajo(trabajo):
+    """
+    Encola el trabajo en el pool. Se despacha al confirmar la transacción para
+    que el worker siempre encuentre el registro en la base de datos.
+
+    Con settings.TRABAJOS_ASINCRONOS = False se ejecuta en línea (útil en
+    pruebas y en despliegues sin workers).
+    """
+    from django.conf import settings
+    if not getattr(settings, 'TRABAJOS_ASINCRONOS', True):
+        ejecutar_trabajo(trabajo.id)
+        return
+    trabajo_id = trabajo.id
+    transaction.on_commit(lambda: get_executor().submit(ejecutar_trabajo, trabajo_id))
+    print(f"📥 Trabajo {trabajo_id} ({trabajo.tipo}) encolado")
+    barrer_si_corresponde()
+
+
+def ejecutar_trabajo(trabajo_id):
+    """
+    Ejecuta un trabajo registrando estado, progreso, resultado o error.
+
+    El trabajo se reclama pasando de 'pendiente' a 'en_proceso' en un UPDATE
+    condicional, así que una copia duplicada en la cola (p. ej. re-encolada por
+    barrer_trabajos_huerfanos) no lo ejecuta dos veces. Cada escritura se filtra
+    por el número de intento: si el trabajo se re-encoló mientras este intento
+    seguía vivo, sus escrituras ya no cuentan.
+    """
+    from core.models import TrabajoProcesamiento
+
+    close_old_connections()
+    intento = TrabajoProcesamiento.objects.none()
+    try:
+        trabajo = TrabajoProcesamiento.objects.select_related('colonia', 'configuracion_ruta').get(id=trabajo_id)
+        intento = TrabajoProcesamiento.objects.filter(id=trabajo_id, intentos=trabajo.intentos)
+        ahora = timezone.now()
+        if not intento.filter(estado='pendiente').update(
+            estado='en_proceso', fecha_inicio=ahora, fecha_latido=ahora, mensaje='Iniciando'
+        ):
+            print(f"⏭️ Trabajo {trabajo_id}: ya no está pendiente, se omite")
+            return
+
+        def progreso(porcentaje, mensaje=''):
+            intento.update(progreso=int(porcentaje), mensaje=str(mensaje)[:255], fecha_latido=timezone.now())
+
+        print(f"⚙️ Trabajo {trabajo_id}: ejecutando '{trabajo.tipo}' (intento {trabajo.intentos + 1})")
+        resultado = TAREAS[trabajo.tipo](trabajo, progreso)
+
+        ahora = timezone.now()
+        intento.update(
+            estado='completado', progreso=100, mensaje='Completado',
+            resultado=resultado, fecha_fin=ahora, fecha_latido=ahora
+        )
+        print(f"✅ Trabajo {trabajo_id}: completado")
+    except Exception as e:
+        print(f"❌ Trabajo {trabajo_id}: error - {str(e)}")
+        traceback.print_exc()
+        ahora = timezone.now()
+        intento.filter(estado='en_proceso').update(
+            estado='error', mensaje='Error', error=str(e), fecha_fin=ahora, fecha_latido=ahora
+        )
+    finally:
+        close_old_connections()
+
+
+def barrer_trabajos_huerfanos():
+    """
+    Recupera trabajos que quedaron 'pendiente' o 'en_proceso' sin avance.
+
+    El pool vive dentro de cada worker de gunicorn: si el worker se recicla o
+    muere, sus trabajos nunca terminan. Un trabajo sin latido (fecha_latido, o
+    fecha_creacion si nunca empezó) en settings.TRABAJOS_LATIDO_MAX_MINUTOS se
+    re-encola en este proceso hasta settings.TRABAJOS_MAX_INTENTOS intentos;
+    después se marca como error. Cada trabajo se reclama con un UPDATE
+    condicional, así que varios workers pueden barrer a la vez.
+
+    Retorna (re_encolados, fallidos).
+    """
+    from django.conf import settings
+    from django.db.models import F, Q
+    from django.db.models.functions import Coalesce
+    from core.models import TrabajoProcesamiento
+
+    limite = timezone.now() - timedelta(minutes=float(getattr(settings, 'TRABAJOS_LATIDO_MAX_MINUTOS', 30)))
+    max_intentos = int(getattr(settings, 'TRABAJOS_MAX_INTENTOS', 2))
+
+    huerfanos = (
+        TrabajoProcesamiento.objects
+        .filter(estado__in=['pendiente', 'en_proceso'])
+        .annotate(ultimo_latido=Coalesce('fecha_latido', 'fecha_creacion'))
+        .filter(ultimo_latido__lt=limite)
+        .values_list('id', 'tipo', 'intentos', 'estado')
+    )
+
+    re_encolados, fallidos = 0, 0
+    for trabajo_id, tipo, intentos, estado in huerfanos:
+        mismo_estado = TrabajoProcesamiento.objects.filter(
+            Q(fecha_latido__lt=limite) | Q(fecha_latido__isnull=True, fecha_creacion__lt=limite),
+            id=trabajo_id, estado=estado, intentos=intentos,
+        )
+        ahora = timezone.now()
+        if intentos + 1 < max_intentos:
+            if mismo_estado.update(estado='pendiente', progreso=0, mensaje='Re-encolado',
+                                   intentos=F('intentos') + 1, fecha_latido=ahora):
+                re_encolados += 1
+                print(f"🔁 Trabajo {trabajo_id} ({tipo}): sin avance, re-encolado")
+                encolar_trabajo(TrabajoProcesamiento(id=trabajo_id, tipo=tipo))
+        elif mismo_estado.update(estado='error', mensaje='Error', fecha_fin=ahora, fecha_latido=ahora,
+                                 error=f'Trabajo interrumpido: sin avance tras {intentos + 1} intento(s)'):
+            fallidos += 1
+            print(f"💀 Trabajo {trabajo_id} ({tipo}): sin avance, marcado como error")
+    return re_encolados, fallidos
+
+
+def barrer_si_corresponde():
+    """Barre trabajos huérfanos como máximo cada settings.TRABAJOS_BARRIDO_SEGUNDOS en este proceso"""
+    global _ultimo_barrido
+    from django.conf import settings
+    intervalo = float(getattr(settings, 'TRABAJOS_BARRIDO_SEGUNDOS', 60))
+    with _barrido_lock:
+        ahora = time.monotonic()
+        if _ultimo_barrido is not None and ahora - _ultimo_barrido < intervalo:
+            return
+        _ultimo_barrido = ahora
+    try:
+        barrer_trabajos_huerfanos()
+    except Exception as e:
+        print(f"⚠️ Error al barrer trabajos huérfanos: {str(e)}")
+
+
+def calcular_rutas_configuracion(configuracion, progreso=None):
+    """
+    Divide la colonia de una ConfiguracionRuta entre sus empleados y guarda
+    las rutas calculadas (mapa_calculado con su geometría, tiempo_calculado) en ella.
+
+    El empleado i (en el orden de informacion_empleados) recibe la zona i.
+    """
+    from core.utils.main import procesar_poligono_completo
+    from core.utils.polilineas import codificar_geojson
+    from core.utils.tiles import eliminar_tiles_configuracion
+
+    colonia = configuracion.colonia
+    empleados_por_id = {e.id: e for e in configuracion.empleados_asignados.all()}
+    orden = [info['id'] for info in (configuracion.informacion_empleados or []) if info.get('id') in empleados_por_id]
+    empleados = [empleados_por_id[i] for i in orden] or list(empleados_por_id.values())
+    if not empleados:
+        raise ValueError('La configuración no tiene empleados asignados')
+
+    print(f"🚀 CALCULAR_RUTAS: colonia_id={colonia.id}, empleados={len(empleados)}, algoritmo={configuracion.algoritmo_usado}")
+    resultado = procesar_poligono_completo(colonia.id, len(empleados), configuracion.algoritmo_usado, progreso=progreso)
+
+    if progreso:
+        progreso(90, 'Guardando rutas')
+
+    partes = resultado['partes']
+
+    # Crear mapa calculado: la geometría de todas las zonas se guarda una sola vez,
+    # unida, simplificada y como polilíneas codificadas
+    geojson = resultado['geojson']
+    mapa_calculado = {
+        'rutas': [],
+        'centro_colonia': colonia.get_configuracion_centro(),
+        'poligono_colonia': colonia.poligono_geojson,
+        'version': uuid.uuid4().hex[:12],  # Versión de los tiles en caché (core/utils/tiles.py)
+    }
+
+    # Crear rutas reales para cada empleado: el empleado i recibe la zona i
+    features_por_zona = {f['properties']['zona']: f for f in geojson['features']}
+    for i, empleado in enumerate(empleados):
+        zona = resultado['zonas'][i]
+        features_por_zona[zona['zona']]['properties'].update({
+            'empleado_id': empleado.id,
+            'empleado_nombre': empleado.username,
+        })
+        mapa_calculado['rutas'].append({
+            'empleado_id': empleado.id,
+            'empleado_nombre': empleado.username,
+            'zona': zona['zona'],  # Feature de mapa_calculado['geometria'] con sus calles
+            'color_ruta': zona['color'],
+            'distancia': zona['longitud_m'] / 1000,  # Convertir a km
+            'tiempo_estimado': int((zona['longitud_m'] / 1000) * 15),  # Estimación: 15 min/km
+            'nodos': zona['nodos'],
+            'area': zona['area_m2']
+        })
+
+    mapa_calculado['geometria'] = codificar_geojson(geojson)
+
+    # Calcular tiempo total estimado basado en las rutas reales
+    tiempo_total_minutos = sum(ruta['tiempo_estimado'] for ruta in mapa_calculado['rutas'])
+
+    datos_ruta = dict(configuracion.datos_ruta or {})
+    datos_ruta.update({
+        'distancia_total': sum(zona['longitud_m'] for zona in resultado['zonas']) / 1000,  # Convertir a km
+        'puntos_parada': resultado['nodos']['total'],
+        'tipo_ruta': 'algoritmo_grafos'
+    })
+
+    configuracion.datos_ruta = datos_ruta
+    configuracion.mapa_calculado = mapa_calculado
+    configuracion.mapa_html = None  # El mapa se dibuja en el cliente a partir del GeoJSON
+    configuracion.tiempo_calculado = timedelta(minutes=tiempo_total_minutos)
+    configuracion.save(update_fields=['datos_ruta', 'mapa_calculado', 'mapa_html', 'tiempo_calculado'])
+    eliminar_tiles_configuracion(configuracion.id)
+
+    return {
+        'configuracion_id': configuracion.id,
+        'num_zonas': len(partes),
+        'distancia_total_km': round(datos_ruta['distancia_total'], 3),
+        'tiempo_estimado': configuracion.get_tiempo_formateado(),
+        'silhouette_score': resultado.get('silhouette_score'),
+    }
+
+
+def dividir_poligono_empleados(colonia_id, num_empleados, algoritmo, progreso=None):
+    """
+    Divide la colonia en una zona por empleado sin guardar nada: es la vista
+    previa del dashboard de staff. Cada ruta lleva sus métricas y sus calles
+    unidas, simplificadas y como polilíneas codificadas.
+    """
+    from core.utils.main import procesar_poligono_completo
+    from core.utils.polilineas import codificar_lineas, precision_polilinea
+
+    print(f"🚀 DIVIDIR_POLIGONO: Procesando colonia_id={colonia_id}, empleados={num_empleados}, algoritmo={algoritmo}")
+    resultado = procesar_poligono_completo(colonia_id, num_empleados, algoritmo, progreso=progreso)
+
+    if progreso:
+        progreso(90, 'Codificando rutas')
+
+    # Las calles de cada zona ya vienen en resultado['geojson'] (una feature por zona)
+    precision = precision_polilinea()
+    rutas = []
+    for i, feature in enumerate(resultado['geojson']['features'][:len(resultado['partes'])]):
+        zona = resultado['zonas'][i]
+        rutas.append({
+            'nodos': zona['nodos'],
+            'longitud': zona['longitud_m'],
+            'area': zona['area_m2'],
+            'densidad_nodos': zona['densidad_nodos_km2'],
+            'densidad_calles': zona['densidad_calles_m_km2'],
+            'color': zona['color'],
+            'calles': codificar_lineas(feature['geometry']['coordinates'], precision)  # Google encoded polyline
+        })
+
+    return {
+        'success': True,
+        'algoritmo_usado': algoritmo,
+        'codificacion_calles': {'formato': 'polyline', 'precision': precision},
+        'rutas': rutas,
+        'metricas_totales': {
+            'nodos_total': resultado['nodos']['total'],
+            'longitud_total': sum(ruta['longitud'] for ruta in rutas),
+            'area_total': sum(ruta['area'] for ruta in rutas)
+        }
+    }
+
+
+def _tarea_calcular_rutas(trabajo, progreso):
+    return calcular_rutas_configuracion(trabajo.configuracion_ruta, progreso=progreso)
+
+
+def _tarea_dividir_poligono(trabajo, progreso):
+    parametros = trabajo.parametros or {}
+    return dividir_poligono_empleados(
+        trabajo.colonia_id, int(parametros.get('num_empleados', 2)),
+        parametros.get('algoritmo', 'kernighan_lin'), progreso=progreso
+    )
+
+
+def _tarea_benchmark(trabajo, progreso):
+    """Construye el grafo una vez y mide todos los algoritmos en un pool de procesos"""
+    from core.models import EficienciaAlgoritmica
+    from core.utils.main import obtener_grafo_colonia
+    from core.utils.benchmark import ejecutar_benchmark, guardar_resultados_benchmark
+
+    parametros = trabajo.parametros or {}
+    num_empleados = int(parametros.get('num_empleados', 2))
+    algoritmos = parametros.get('algoritmos') or [clave for clave, _ in EficienciaAlgoritmica.ALGORITMO_CHOICES]
+
+    progreso(5, 'Obteniendo grafo de calles')
+    G = obtener_grafo_colonia(trabajo.colonia, network_type='walk')
+
+    progreso(10, f'Midiendo {len(algoritmos)} algoritmos')
+    resultados = ejecutar_benchmark(
+        G, num_empleados, algoritmos,
+        repeticiones=int(parametros.get('repeticiones', 5)),
+        max_procesos=parametros.get('max_procesos'),
+        silhouette_estrategia=parametros.get('silhouette_estrategia'),
+        progreso=progreso
+    )
+
+    progreso(95, 'Guardando resultados')
+    registros = guardar_resultados_benchmark(resultados, trabajo.colonia, trabajo.creado_por,
+                                             num_empleados, G.number_of_edges())
+
+    return {
+        'eficiencia_ids': [registro.id for registro in registros if registro.id],
+        'resultados': [
+            {clave: valor for clave, valor in resultado.items() if clave != 'zonas'}
+            for resultado in resultados
+        ],
+    }
+
+
+# Tipo de trabajo -> función(trabajo, progreso) que retorna el resultado (JSON)
+TAREAS = {
+    'calcular_rutas': _tarea_calcular_rutas,
+    'dividir_poligono': _tarea_dividir_poligono,
+    'benchmark': _tarea_benchmark,
+}
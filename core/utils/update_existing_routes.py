@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 """
-Script para actualizar rutas existentes con HTML del mapa
+Script para actualizar rutas existentes al GeoJSON compacto del mapa
 """
 
 import os
@@ -11,21 +11,22 @@ import django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'routes_project.settings')
 django.setup()
 
-from core.models import ConfiguracionRuta, ColoniaProcesada
-from core.utils.main import procesar_poligono_completo
-import json
-import tempfile
+from core.models import ConfiguracionRuta
+from core.utils.geojson_rutas import tiene_geometria
+from core.utils.trabajos import calcular_rutas_configuracion
 
 
 def update_existing_routes():
-    """Actualiza las rutas existentes que no tienen mapa_html"""
+    """Recalcula las rutas que aún no tienen GeoJSON en mapa_calculado"""
     
-    # Obtener rutas sin mapa_html
-    rutas_sin_html = ConfiguracionRuta.objects.filter(mapa_html__isnull=True)
+    rutas_sin_geojson = [
+        ruta for ruta in ConfiguracionRuta.objects.select_related('colonia')
+        if not tiene_geometria(ruta.mapa_calculado)
+    ]
     
-    print(f"Encontradas {rutas_sin_html.count()} rutas sin HTML del mapa")
+    print(f"Encontradas {len(rutas_sin_geojson)} rutas sin GeoJSON del mapa")
     
-    for ruta in rutas_sin_html:
+    for ruta in rutas_sin_geojson:
         try:
             print(f"Procesando ruta {ruta.id} - {ruta.colonia.nombre}")
             
@@ -34,30 +35,8 @@ def update_existing_routes():
                 print(f"  ❌ Colonia {ruta.colonia.nombre} no tiene polígono")
                 continue
             
-            # Crear archivo temporal con el polígono
-            nombre_archivo = f"temp_update_{ruta.id}.json"
-            ruta_temp = os.path.join("core", "polygons", nombre_archivo)
-            
-            with open(ruta_temp, "w", encoding="utf-8") as f:
-                json.dump(ruta.colonia.poligono_geojson, f)
-            
-            try:
-                # Procesar con el algoritmo
-                num_employees = ruta.empleados_asignados.count()
-                resultado = procesar_poligono_completo(nombre_archivo, num_employees)
-                
-                # Actualizar el mapa_html
-                if 'mapa_html_content' in resultado:
-                    ruta.mapa_html = resultado['mapa_html_content']
-                    ruta.save()
-                    print(f"  ✅ HTML del mapa actualizado para ruta {ruta.id}")
-                else:
-                    print(f"  ❌ No se pudo generar HTML para ruta {ruta.id}")
-                    
-            finally:
-                # Limpiar archivo temporal
-                if os.path.exists(ruta_temp):
-                    os.remove(ruta_temp)
+            calcular_rutas_configuracion(ruta)
+            print(f"  ✅ GeoJSON del mapa actualizado para ruta {ruta.id}")
                     
         except Exception as e:
             print(f"  ❌ Error procesando ruta {ruta.id}: {str(e)}")
@@ -66,4 +45,4 @@ def update_existing_routes():
 
 
 if __name__ == "__main__":
-    update_existing_routes() 
\ No newline at end of file
+    update_existing_routes()
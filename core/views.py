@@ -1,9 +1,9 @@
 from django.shortcuts import render
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponse, FileResponse
-from core.utils.main import download_bbox,procesar_poligono_completo, sanitize_filename
 import json
 import requests   
 from django.views.decorators.csrf import csrf_exempt
+from django.contrib.auth.decorators import login_required
 from core.utils.polygon_logic import get_colonia_config 
 import os
 from pathlib import Path
@@ -20,10 +20,10 @@ def procesar_colonia(request):
     if not colonia:
         return HttpResponseBadRequest("Falta el parámetro 'colonia'")
 
+    from core.utils.main import download_bbox
+
     try:
-        cache_path = download_bbox(colonia)
-        with open(cache_path, "r", encoding="utf-8") as f:
-            data = json.load(f)  # 🔁 Aquí ya es una lista con la info original de Nominatim
+        data = download_bbox(colonia)  # 🔁 Lista con la info original de Nominatim
         return JsonResponse(data, safe=False)  # ✅ Devolverlo tal cual
     except Exception as e:
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
@@ -38,31 +38,20 @@ def config_editor(request):
     if not colonia:
         return HttpResponseBadRequest("Falta parámetro 'colonia'")
 
+    from core.utils.main import download_bbox
+
     try:
-        # Usar el nombre original para la consulta a Nominatim
-        cache_file_name = f"{sanitize_filename(colonia)}.json"
-        base_cache_dir = Path(__file__).resolve().parent / "cache"
-        cache_path = base_cache_dir / cache_file_name
-        
-        # Descargar si no existe
-        if not cache_path.exists():
-            try:
-                download_bbox(colonia)
-            except Exception as download_error:
-                print(f"Error descargando {colonia}: {str(download_error)}")
-                return JsonResponse({
-                    "error": f"No se encontró '{colonia}' en Nominatim. Intenta con un nombre más específico.",
-                    "details": str(download_error)
-                }, status=404)
-        
-        # Verificar que el archivo existe después de la descarga
-        if not cache_path.exists():
+        # Usar el nombre original para la consulta a Nominatim (con caché)
+        try:
+            resultados = download_bbox(colonia)
+        except Exception as download_error:
+            print(f"Error descargando {colonia}: {str(download_error)}")
             return JsonResponse({
-                "error": f"No se pudo obtener información para '{colonia}'",
-                "suggestion": "Verifica el nombre de la colonia e intenta de nuevo"
+                "error": f"No se encontró '{colonia}' en Nominatim. Intenta con un nombre más específico.",
+                "details": str(download_error)
             }, status=404)
         
-        config = get_colonia_config(str(cache_path))
+        config = get_colonia_config(resultados)
         return JsonResponse(config)
     except Exception as e:
         print(f"Error en config_editor: {str(e)}")
@@ -96,6 +85,8 @@ def generar_reporte_colonia(request):
     if not archivo:
         return HttpResponseBadRequest("Falta el parámetro 'archivo'")
 
+    from core.utils.main import procesar_poligono_completo
+
     try:
         resultado = procesar_poligono_completo(archivo)
         return JsonResponse(resultado)
@@ -160,3 +151,89 @@ def list_available_maps(request):
         
     except Exception as e:
         return HttpResponse(f"Error listing maps: {str(e)}", status=500)
+
+
+@login_required
+def rutas_geojson(request, configuracion_id):
+    """
+    GeoJSON compacto de las rutas de una ConfiguracionRuta. Lleva nombres de
+    empleados y el polígono de la colonia, así que solo lo ven el staff que la
+    creó, sus empleados y los administradores (404 para los demás).
+    """
+    from core.models import ConfiguracionRuta
+    from core.utils.geojson_rutas import geojson_de_mapa_calculado
+
+    configuracion = ConfiguracionRuta.visibles_para(request.user).filter(id=configuracion_id).select_related('colonia').first()
+    if not configuracion:
+        return JsonResponse({"error": "Configuración no encontrada"}, status=404)
+
+    return JsonResponse({
+        "configuracion_id": configuracion.id,
+        "colonia": configuracion.colonia.nombre,
+        "geojson": geojson_de_mapa_calculado(configuracion.mapa_calculado),
+        "poligono_colonia": configuracion.colonia.poligono_geojson,
+    })
+
+
+@login_required
+def tile_rutas(request, configuracion_id, z, x, y):
+    """
+    Tile (z, x, y) de las rutas de una ConfiguracionRuta, para que el navegador
+    solo pida las calles visibles. GeoJSON por defecto; ?formato=mvt entrega un
+    Mapbox Vector Tile si mapbox-vector-tile está instalado.
+
+    Mismo acceso que rutas_geojson. Los tiles sin calles (fuera de las rutas)
+    responden 204 y no se guardan en la caché.
+    """
+    from core.models import ConfiguracionRuta
+    from core.utils.tiles import mvt_disponible, obtener_tile, tile_valido, version_mapa
+
+    if not tile_valido(z, x, y):
+        return JsonResponse({"error": "Tile fuera de rango"}, status=400)
+
+    formato = request.GET.get('formato', 'geojson')
+    if formato not in ('geojson', 'mvt'):
+        return JsonResponse({"error": "Formato no soportado (geojson o mvt)"}, status=400)
+    if formato == 'mvt' and not mvt_disponible():
+        return JsonResponse({"error": "Formato mvt no disponible en este servidor"}, status=501)
+
+    # Solo la versión: el GeoJSON completo se lee únicamente si el tile no está en disco
+    fila = (ConfiguracionRuta.visibles_para(request.user).filter(id=configuracion_id)
+            .values_list('id', 'mapa_calculado__version').first())
+    if not fila:
+        return JsonResponse({"error": "Configuración no encontrada"}, status=404)
+    version = version_mapa({'version': fila[1]})
+
+    try:
+        contenido = obtener_tile(configuracion_id, version, z, x, y, formato)
+    except Exception as e:
+        print(f"❌ Error generando tile {z}/{x}/{y} de la configuración {configuracion_id}: {e}")
+        return JsonResponse({"error": str(e)}, status=500)
+
+    if contenido is None:
+        return HttpResponse(status=204)
+
+    content_type = 'application/vnd.mapbox-vector-tile' if formato == 'mvt' else 'application/geo+json'
+    response = HttpResponse(contenido, content_type=content_type)
+    # La versión de las rutas va en la URL que arma el cliente (?v=...), así que el tile se puede cachear
+    response['Cache-Control'] = 'private, max-age=86400' if request.GET.get('v') else 'no-cache'
+    return response
+
+
+@login_required
+def mapa_rutas(request, configuracion_id):
+    """Visor de rutas: una sola plantilla que dibuja el GeoJSON en el navegador"""
+    from core.models import ConfiguracionRuta
+
+    configuracion = ConfiguracionRuta.visibles_para(request.user).filter(id=configuracion_id).select_related('colonia').first()
+    if not configuracion:
+        return HttpResponse("Configuración no encontrada", status=404)
+
+    from core.utils.tiles import version_mapa
+
+    return render(request, "mapa_rutas.html", {
+        "colonia_nombre": configuracion.colonia.nombre,
+        "configuracion_id": configuracion.id,
+        "version_rutas": version_mapa(configuracion.mapa_calculado),
+        "poligono_colonia": configuracion.colonia.poligono_geojson,
+    })
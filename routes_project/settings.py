@@ -158,6 +158,47 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 # Static files configuration
 
+# Límite de memoria (MB) de la caché LRU de grafos de calles por worker
+GRAPH_LRU_MAX_MB = int(os.environ.get('GRAPH_LRU_MAX_MB', 256))
+
+# Extracto OSM local (manage.py cargar_extracto_osm): 'auto' lo usa si existe, 'local' lo exige, 'overpass' lo ignora
+OSM_FUENTE = os.environ.get('OSM_FUENTE', 'auto')
+OSM_EXTRACT_DB = os.environ.get('OSM_EXTRACT_DB', str(BASE_DIR / 'core' / 'osm_extract' / 'extracto.sqlite3'))
+
+# Caché de Nominatim (core/cache/nominatim.sqlite3) y límite de peticiones por segundo
+NOMINATIM_CACHE_TTL_HORAS = float(os.environ.get('NOMINATIM_CACHE_TTL_HORAS', 720))
+NOMINATIM_CACHE_TTL_NEGATIVO_HORAS = float(os.environ.get('NOMINATIM_CACHE_TTL_NEGATIVO_HORAS', 6))
+NOMINATIM_REQ_POR_SEGUNDO = float(os.environ.get('NOMINATIM_REQ_POR_SEGUNDO', 1))
+NOMINATIM_MAX_CONCURRENTES = int(os.environ.get('NOMINATIM_MAX_CONCURRENTES', 4))
+
+# Geometría de rutas guardada/enviada: aristas unidas, Douglas-Peucker (metros) y polilíneas codificadas
+RUTAS_TOLERANCIA_SIMPLIFICACION_M = float(os.environ.get('RUTAS_TOLERANCIA_SIMPLIFICACION_M', 1.0))
+RUTAS_PRECISION_POLILINEA = int(os.environ.get('RUTAS_PRECISION_POLILINEA', 5))
+
+# Silhouette Score: 'auto' (exacto hasta el umbral, muestreo arriba), 'exacta', 'muestreo' o 'simplificada'
+SILHOUETTE_ESTRATEGIA = os.environ.get('SILHOUETTE_ESTRATEGIA', 'auto')
+SILHOUETTE_UMBRAL_EXACTO = int(os.environ.get('SILHOUETTE_UMBRAL_EXACTO', 5000))
+SILHOUETTE_TAMANO_MUESTRA = int(os.environ.get('SILHOUETTE_TAMANO_MUESTRA', 2000))
+
+# Importar el stack geo/ML al cargar wsgi.py (con gunicorn --preload, una vez en el maestro);
+# si es False cada worker lo importa la primera vez que divide un polígono o predice tiempos
+PRECARGAR_STACK_GEO = os.environ.get('PRECARGAR_STACK_GEO', 'False').lower() == 'true'
+
+# Chat por SSE: pub/sub en Redis (vacío = en memoria, solo entre clientes del mismo proceso),
+# duración máxima de cada conexión (el navegador reconecta solo) y latido para proxies
+CHAT_PUBSUB_URL = os.environ.get('CHAT_PUBSUB_URL', '')
+CHAT_SSE_DURACION_MAX = int(os.environ.get('CHAT_SSE_DURACION_MAX', 300))
+CHAT_SSE_LATIDO = int(os.environ.get('CHAT_SSE_LATIDO', 15))
+
+# Trabajos de procesamiento de polígonos en segundo plano (pool local por worker)
+TRABAJOS_ASINCRONOS = os.environ.get('TRABAJOS_ASINCRONOS', 'True').lower() == 'true'
+TRABAJOS_MAX_WORKERS = int(os.environ.get('TRABAJOS_MAX_WORKERS', 2))
+# Trabajos sin avance (worker reciclado o caído): minutos sin latido, intentos antes de
+# marcarlos como error y cada cuántos segundos barre cada proceso (manage.py recuperar_trabajos para cron)
+TRABAJOS_LATIDO_MAX_MINUTOS = float(os.environ.get('TRABAJOS_LATIDO_MAX_MINUTOS', 30))
+TRABAJOS_MAX_INTENTOS = int(os.environ.get('TRABAJOS_MAX_INTENTOS', 2))
+TRABAJOS_BARRIDO_SEGUNDOS = int(os.environ.get('TRABAJOS_BARRIDO_SEGUNDOS', 60))
+
 # Base URL configuration
 BASE_URL = os.environ.get('BASE_URL', 'http://localhost:8000')
 
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'routes_project.settings')
 
 application = get_wsgi_application()
+
+# Con gunicorn --preload esto corre en el proceso maestro y los workers heredan
+# el stack geo/ML ya importado (copy-on-write)
+from django.conf import settings  # noqa: E402
+
+if settings.PRECARGAR_STACK_GEO:
+    from core.utils.precarga import precargar_modulos
+    precargar_modulos()